@@ -1,30 +1,23 @@
 import os
+import sys
 from dotenv import load_dotenv
-from supabase import create_client
 import folium
 from folium.plugins import HeatMap, MarkerCluster
 from collections import defaultdict
 
+# The local mirror of Supabase lives with the backend analysis scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'analysis'))
+import local_store
+
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
-
-if not supabase_url or not supabase_key:
-    raise Exception("Missing Supabase credentials in .env file")
-
-supabase = create_client(supabase_url, supabase_key)
-
 def fetch_quick_searches():
-    """Fetch all quick searches with location data"""
-    response = supabase.table('quick_searches')\
-        .select('*')\
-        .execute()
+    """Fetch all quick searches with location data from the local mirror"""
+    searches = local_store.read('SELECT * FROM quick_searches', ['quick_searches'])
     
     # Filter out entries with no location in Python
-    return [search for search in response.data if search.get('location') is not None]
+    return [search for search in searches if search.get('location') is not None]
 
 def create_map(searches):
     """Create a map with markers for each search location"""
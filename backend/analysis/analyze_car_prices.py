@@ -12,6 +12,7 @@ import re
 from datetime import datetime
 from chrome_config import create_driver, get_chrome_options
 import logging
+import local_store
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -28,10 +29,8 @@ def init_supabase():
     return create_client(supabase_url, supabase_key)
 
 def get_cars_from_supabase():
-    """Fetch car data from Supabase"""
-    supabase = init_supabase()
-    response = supabase.table('coches').select("*").execute()
-    return response.get('data', [])
+    """Fetch car data from the local mirror of Supabase"""
+    return local_store.read('SELECT * FROM coches', ['coches'])
 
 def parse_price(price_text):
     """Parse price text into numeric value"""
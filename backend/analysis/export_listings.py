@@ -2,10 +2,10 @@ import os
 from datetime import datetime
 import csv
 from dotenv import load_dotenv
-from supabase import create_client, Client
 import logging
 import re
 import asyncio
+import local_store
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -14,26 +14,16 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-def init_supabase() -> Client:
-    """Initialize Supabase client"""
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY")
-    
-    if not supabase_url or not supabase_key:
-        raise Exception("Missing Supabase credentials in .env file")
-    
-    return create_client(supabase_url, supabase_key)
-
-def fetch_listings(supabase: Client, vehicle_type: str):
-    """Fetch listings from Supabase for a specific vehicle type"""
+def fetch_listings(vehicle_type: str):
+    """Fetch listings for a specific vehicle type from the local mirror"""
     try:
-        # Get listings with their searches data using a join
-        response = supabase.rpc(
-            'get_listings_with_models',
-            {'vehicle_type': vehicle_type}
-        ).execute()
-        
-        data = response.data if response else []
+        # Listings with the model of their search, as the get_listings_with_models RPC returned them
+        table = f"listings_{vehicle_type}"
+        data = local_store.read(
+            f'SELECT l.*, s.model AS model FROM {local_store.quote_identifier(table)} l '
+            f'LEFT JOIN searches s ON s.id = l.search_id',
+            [table, 'searches']
+        )
         
         # Debug: Print first listing's data structure
         if data:
@@ -127,14 +117,13 @@ def export_to_csv(listings, vehicle_type):
 
 def main():
     try:
-        supabase = init_supabase()
         vehicle_types = ['coches', 'motos', 'furgos', 'scooters']
 
         for vehicle_type in vehicle_types:
             logger.info(f"\nProcessing {vehicle_type}...")
             
             # Fetch listings
-            listings = fetch_listings(supabase, vehicle_type)
+            listings = fetch_listings(vehicle_type)
             
             if listings:
                 # Sort listings by price difference, handling None values
@@ -0,0 +1,361 @@
+import os
+import sys
+import csv
+import json
+import sqlite3
+import logging
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from supabase import create_client, Client
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_DB_PATH = os.getenv(
+    "LOCAL_STORE_PATH",
+    os.path.join(os.path.dirname(__file__), 'data', 'local_store.sqlite')
+)
+
+# Rows per Supabase request (PostgREST caps responses at 1000 rows by default)
+PAGE_SIZE = 1000
+
+# Mirrored tables: table -> (primary key, watermark column).
+# Append-only tables use their id or insertion timestamp. Tables whose rows
+# are rewritten onto a newer search or run use that parent id, which only
+# grows. Tables without any such column are fully re-synced each time.
+MIRRORED_TABLES = {
+    'car_searches': ('id', 'created_at'),
+    'car_listings': ('id', 'created_at'),
+    'car_market_price': ('id', 'timestamp'),
+    'market_data': ('id', 'created_at'),
+    'market_price_history': ('id', 'created_at'),
+    'listing_price_history': ('id', 'observed_at'),
+    'autoscout_runs': ('id', 'id'),
+    # Upserted on the listing id with the run that saw it last
+    'autoscout_listings': ('id', 'run_id'),
+    # Read by analyze_car_prices.py; a small catalogue edited in place without a timestamp
+    'coches': ('id', None),
+    # Read by export_listings.py, in place of the get_listings_with_models RPC
+    'searches': ('id', 'created_at'),
+    'listings_coches': ('id', 'id'),
+    # Existing motos and furgos listings are moved onto the newest search
+    'listings_motos': ('id', 'search_id'),
+    'listings_furgos': ('id', 'search_id'),
+    'listings_scooters': ('id', 'id'),
+    # Read by analytics/quick_search_map.py
+    'quick_searches': ('id', 'created_at'),
+}
+
+
+# Hours between key reconciliation passes of the watermark-synced tables, which
+# remove local rows deleted upstream (retention, crawl truncates and prunes)
+RECONCILE_HOURS = float(os.getenv("LOCAL_STORE_RECONCILE_HOURS", "24"))
+
+# Minutes a mirrored table is read without syncing it again
+MAX_AGE_MINUTES = float(os.getenv("LOCAL_STORE_MAX_AGE_MINUTES", "60"))
+
+# Secondary indexes for the usual analytical filters
+TABLE_INDEXES = {
+    'car_listings': [('brand', 'model'), ('external_id',), ('search_id',)],
+    'car_market_price': [('search_id',)],
+    'market_price_history': [('query_key', 'created_at')],
+    'listing_price_history': [('external_id', 'observed_at')],
+    'autoscout_listings': [('run_id',)],
+    'listings_coches': [('search_id',)],
+    'listings_motos': [('search_id',)],
+    'listings_furgos': [('search_id',)],
+    'listings_scooters': [('search_id',)],
+}
+
+def init_supabase() -> Client:
+    """Initialize Supabase client"""
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")
+
+    if not supabase_url or not supabase_key:
+        raise Exception("Missing Supabase credentials in .env file")
+
+    return create_client(supabase_url, supabase_key)
+
+def connect(db_path=DEFAULT_DB_PATH):
+    """Open the local store, creating it if needed"""
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS _sync_state ('
+        'table_name TEXT PRIMARY KEY, watermark TEXT, rows_synced INTEGER, synced_at TEXT, reconciled_at TEXT)'
+    )
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(_sync_state)')}
+    if 'reconciled_at' not in columns:
+        # Stores created before reconciliation was added
+        conn.execute('ALTER TABLE _sync_state ADD COLUMN reconciled_at TEXT')
+    return conn
+
+def quote_identifier(name):
+    """Quote a column or table name for SQLite"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def to_sqlite_value(value):
+    """Store nested JSON values as text"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+def ensure_table(conn, table, key, columns):
+    """Create the mirror table and add any columns seen for the first time"""
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {quote_identifier(table)} ({quote_identifier(key)} PRIMARY KEY)')
+    existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({quote_identifier(table)})')}
+    for column in columns:
+        if column not in existing:
+            conn.execute(f'ALTER TABLE {quote_identifier(table)} ADD COLUMN {quote_identifier(column)}')
+            existing.add(column)
+
+    for index_columns in TABLE_INDEXES.get(table, []):
+        if all(column in existing for column in index_columns):
+            index_name = quote_identifier(f"idx_{table}_{'_'.join(index_columns)}")
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS {index_name} ON {quote_identifier(table)} '
+                f'({", ".join(quote_identifier(c) for c in index_columns)})'
+            )
+
+def table_exists(conn, table):
+    """Check whether a table is already mirrored locally"""
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return row is not None
+
+def upsert_rows(conn, table, key, rows):
+    """Insert or replace a page of rows in the local mirror"""
+    if not rows:
+        return
+    columns = sorted({column for row in rows for column in row})
+    ensure_table(conn, table, key, columns)
+
+    placeholders = ', '.join('?' for _ in columns)
+    column_list = ', '.join(quote_identifier(c) for c in columns)
+    conn.executemany(
+        f'INSERT OR REPLACE INTO {quote_identifier(table)} ({column_list}) VALUES ({placeholders})',
+        [tuple(to_sqlite_value(row.get(column)) for column in columns) for row in rows]
+    )
+
+def get_sync_state(conn, table):
+    """Return the sync state row of a table, or None if it was never synced"""
+    row = conn.execute('SELECT * FROM _sync_state WHERE table_name = ?', (table,)).fetchone()
+    return dict(row) if row else None
+
+def get_watermark(conn, table):
+    """Return the last synced watermark for a table"""
+    state = get_sync_state(conn, table)
+    return state['watermark'] if state else None
+
+def save_sync_state(conn, table, watermark, rows_synced):
+    """Remember how far a table has been synced"""
+    conn.execute(
+        'INSERT INTO _sync_state (table_name, watermark, rows_synced, synced_at) VALUES (?, ?, ?, ?) '
+        'ON CONFLICT(table_name) DO UPDATE SET watermark = excluded.watermark, '
+        'rows_synced = excluded.rows_synced, synced_at = excluded.synced_at',
+        (table, watermark, rows_synced, datetime.now(timezone.utc).isoformat())
+    )
+
+def is_past_watermark(value, watermark):
+    """Compare ids as numbers and timestamps as ISO text"""
+    if watermark is None:
+        return True
+    if isinstance(value, (int, float)):
+        return value > float(watermark)
+    return str(value) > watermark
+
+def hours_since(timestamp):
+    """Hours elapsed since an ISO timestamp, or None if it is missing"""
+    if not timestamp:
+        return None
+    return (datetime.now(timezone.utc) - datetime.fromisoformat(timestamp)).total_seconds() / 3600
+
+def reconcile_table(supabase: Client, conn, table):
+    """Delete the local rows of a table whose key no longer exists upstream"""
+    key, _ = MIRRORED_TABLES[table]
+    if not table_exists(conn, table):
+        return 0
+
+    remote_keys = set()
+    offset = 0
+    while True:
+        response = supabase.table(table).select(key).order(key).range(offset, offset + PAGE_SIZE - 1).execute()
+        rows = response.data or []
+        remote_keys.update(str(row[key]) for row in rows)
+        offset += len(rows)
+        if len(rows) < PAGE_SIZE:
+            break
+
+    local_keys = [row[0] for row in conn.execute(f'SELECT {quote_identifier(key)} FROM {quote_identifier(table)}')]
+    deleted = [(local_key,) for local_key in local_keys if str(local_key) not in remote_keys]
+    conn.executemany(f'DELETE FROM {quote_identifier(table)} WHERE {quote_identifier(key)} = ?', deleted)
+    conn.execute(
+        'UPDATE _sync_state SET reconciled_at = ? WHERE table_name = ?',
+        (datetime.now(timezone.utc).isoformat(), table)
+    )
+    conn.commit()
+    logger.info(f"Reconciled {table}: removed {len(deleted)} rows deleted upstream")
+    return len(deleted)
+
+def sync_table(supabase: Client, conn, table):
+    """Pull new rows of one table from Supabase into the local store"""
+    key, watermark_column = MIRRORED_TABLES[table]
+    watermark = get_watermark(conn, table) if watermark_column else None
+    new_watermark = watermark
+    rows_synced = 0
+    offset = 0
+
+    if watermark_column is None and table_exists(conn, table):
+        # No watermark column: replace the mirror with a full copy
+        conn.execute(f'DELETE FROM {quote_identifier(table)}')
+
+    while True:
+        query = supabase.table(table).select('*')
+        if watermark_column and watermark:
+            # gte re-reads rows sharing the boundary value; the upsert makes that harmless
+            query = query.gte(watermark_column, watermark)
+
+        # Page on the primary key so the order is stable across requests
+        response = query.order(key).range(offset, offset + PAGE_SIZE - 1).execute()
+        rows = response.data or []
+        upsert_rows(conn, table, key, rows)
+        rows_synced += len(rows)
+        offset += len(rows)
+
+        if watermark_column:
+            for row in rows:
+                value = row.get(watermark_column)
+                if value is not None and is_past_watermark(value, new_watermark):
+                    new_watermark = str(value)
+
+        if len(rows) < PAGE_SIZE:
+            break
+
+    save_sync_state(conn, table, new_watermark, rows_synced)
+    conn.commit()
+    logger.info(f"Synced {rows_synced} rows into {table} (watermark: {new_watermark})")
+
+    if watermark_column:
+        # Incremental syncs only see new rows; deletes are caught up periodically
+        age = hours_since(get_sync_state(conn, table).get('reconciled_at'))
+        if age is None or age >= RECONCILE_HOURS:
+            reconcile_table(supabase, conn, table)
+    return rows_synced
+
+def sync(tables=None, db_path=DEFAULT_DB_PATH):
+    """Incrementally sync the mirrored Supabase tables into the local store"""
+    supabase = init_supabase()
+    conn = connect(db_path)
+    results = {}
+    try:
+        for table in tables or MIRRORED_TABLES:
+            try:
+                results[table] = sync_table(supabase, conn, table)
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error syncing {table}: {str(e)}")
+                results[table] = None
+    finally:
+        conn.close()
+    return results
+
+def query(sql, params=(), db_path=DEFAULT_DB_PATH):
+    """Run an analytical query against the local store"""
+    conn = connect(db_path)
+    try:
+        return [dict(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+def from_sqlite_value(value):
+    """Decode the nested JSON values stored as text"""
+    if isinstance(value, str) and value[:1] in ('{', '['):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+def stale_tables(tables, db_path=DEFAULT_DB_PATH):
+    """Tables never synced or last synced more than MAX_AGE_MINUTES ago"""
+    conn = connect(db_path)
+    try:
+        stale = []
+        for table in tables:
+            state = get_sync_state(conn, table)
+            age = hours_since(state['synced_at']) if state else None
+            if age is None or age * 60 >= MAX_AGE_MINUTES or not table_exists(conn, table):
+                stale.append(table)
+        return stale
+    finally:
+        conn.close()
+
+def read(sql, tables, params=(), db_path=DEFAULT_DB_PATH):
+    """
+    Query the local store for the analysis scripts: the tables the query
+    reads are synced first when stale, and JSON values are decoded.
+    """
+    stale = stale_tables(tables, db_path)
+    if stale:
+        sync(stale, db_path)
+    return [{column: from_sqlite_value(value) for column, value in row.items()} for row in query(sql, params, db_path)]
+
+def export_csv(sql, filename, params=(), db_path=DEFAULT_DB_PATH):
+    """Export the result of a local query to a CSV file"""
+    conn = connect(db_path)
+    try:
+        cursor = conn.execute(sql, params)
+        columns = [description[0] for description in cursor.description]
+        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(columns)
+            row_count = 0
+            for row in cursor:
+                writer.writerow(tuple(row))
+                row_count += 1
+        logger.info(f"Exported {row_count} rows to {filename}")
+        return filename
+    finally:
+        conn.close()
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'sync'
+
+    if command == 'sync':
+        results = sync(sys.argv[2:] or None)
+        for table, count in results.items():
+            logger.info(f"{table}: {'failed' if count is None else f'{count} rows'}")
+    elif command == 'reconcile':
+        supabase = init_supabase()
+        conn = connect()
+        try:
+            for table in sys.argv[2:] or [t for t, (_, column) in MIRRORED_TABLES.items() if column]:
+                reconcile_table(supabase, conn, table)
+        finally:
+            conn.close()
+    elif command == 'export' and len(sys.argv) == 4:
+        table, filename = sys.argv[2], sys.argv[3]
+        if table not in MIRRORED_TABLES:
+            raise SystemExit(f"Unknown table '{table}', expected one of: {', '.join(MIRRORED_TABLES)}")
+        export_csv(f'SELECT * FROM {quote_identifier(table)}', filename)
+    elif command == 'query' and len(sys.argv) == 3:
+        for row in query(sys.argv[2]):
+            print(row)
+    else:
+        raise SystemExit(
+            "Usage: python local_store.py sync [table ...]\n"
+            "       python local_store.py reconcile [table ...]\n"
+            "       python local_store.py export <table> <file.csv>\n"
+            "       python local_store.py query \"<sql>\""
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark page loads of saved Wallapop result pages with and without the
+lean Chrome profile of chrome_config.
+
+Result pages are first saved once from live searches, then loaded from disk
+by a driver started with each profile. For every load the script reports the
+time spent in driver.get until the listings are in the DOM, the number and
+size of the resources fetched, and the number of listing anchors found, so
+the lean profile can be checked to still expose what the scrapers read.
+Example:
+
+    python bench_chrome_profile.py --save "https://es.wallapop.com/app/search?keywords=xmax&category_ids=14000"
+    python bench_chrome_profile.py --repeat 3
+"""
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from chrome_config import get_chrome_options, apply_lean_profile
+
+PAGES_DIR = Path(__file__).parent / 'data' / 'saved_pages'
+
+LISTING_SELECTOR = 'a[href*="/item/"]'
+
+def start_driver(lean):
+    return apply_lean_profile(webdriver.Chrome(options=get_chrome_options(lean=lean)), lean=lean)
+
+def save_pages(urls, pages_dir):
+    """Save the rendered result pages of live searches"""
+    pages_dir.mkdir(parents=True, exist_ok=True)
+    driver = start_driver(lean=False)
+    try:
+        for index, url in enumerate(urls):
+            driver.get(url)
+            WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, LISTING_SELECTOR)))
+            path = pages_dir / f"results_{index}.html"
+            path.write_text(driver.page_source, encoding='utf-8')
+            print(f"Saved {url} to {path}")
+    finally:
+        driver.quit()
+
+def load_page(driver, path):
+    """Seconds until the listings are in the DOM, resources fetched and listings found"""
+    start_time = time.perf_counter()
+    driver.get(path.resolve().as_uri())
+    WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, LISTING_SELECTOR)))
+    seconds = time.perf_counter() - start_time
+
+    resources = driver.execute_script(
+        "return performance.getEntriesByType('resource').map(r => r.transferSize || r.encodedBodySize || 0)"
+    )
+    listings = len(driver.find_elements(By.CSS_SELECTOR, LISTING_SELECTOR))
+    return seconds, len(resources), sum(resources), listings
+
+def run_profile(lean, pages, repeat):
+    startup_time = time.perf_counter()
+    driver = start_driver(lean)
+    startup = time.perf_counter() - startup_time
+    try:
+        loads = [load_page(driver, path) for _ in range(repeat) for path in pages]
+    finally:
+        driver.quit()
+    return startup, loads
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=Path, default=PAGES_DIR, help='directory of saved result pages')
+    parser.add_argument('--save', nargs='+', metavar='URL', help='save the result pages of these searches first')
+    parser.add_argument('--repeat', type=int, default=3, help='loads of each page per profile')
+    args = parser.parse_args()
+
+    if args.save:
+        save_pages(args.save, args.pages)
+
+    pages = sorted(args.pages.glob('*.html')) if args.pages.is_dir() else []
+    if not pages:
+        parser.error(f"No saved pages in {args.pages}, save some with --save")
+
+    print(f"{len(pages)} saved pages, {args.repeat} loads each")
+    for name, lean in [('Default profile', False), ('Lean profile', True)]:
+        startup, loads = run_profile(lean, pages, args.repeat)
+        seconds = [load[0] for load in loads]
+        print(f"- {name}: startup {startup:.2f}s, "
+              f"load median {statistics.median(seconds) * 1000:.0f}ms, max {max(seconds) * 1000:.0f}ms, "
+              f"{statistics.mean(load[1] for load in loads):.0f} resources, "
+              f"{statistics.mean(load[2] for load in loads) / 1024:.0f} KB, "
+              f"{min(load[3] for load in loads)} listings found")
+
+if __name__ == "__main__":
+    main()
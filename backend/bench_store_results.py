@@ -0,0 +1,140 @@
+"""
+Benchmark the store_search_results writers of the scrapers against the
+in-memory Supabase stand-in of render/memory_supabase.py.
+
+Listings are synthetic API results converted with wallapop_api.to_listing, so
+only the database side is measured. Every search is stored twice, the second
+time finding its listings already stored, like a crawl that runs again before
+the listings change. Example:
+
+    python bench_store_results.py --latency-ms 40 --searches 10 --listings 40
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import random
+import sys
+import time
+
+import wallapop_api
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'render'))
+from memory_supabase import MemorySupabase
+
+WRITERS = ['cars', 'motos', 'scooters', 'furgos']
+
+class DictResponse(dict):
+    """supabase_py response: a dict with 'data', also readable as .data"""
+
+    @property
+    def data(self):
+        return self['data']
+
+class DictQuery:
+    """Chainable query over the stand-in whose execute() returns a DictResponse"""
+
+    def __init__(self, query):
+        self.query = query
+
+    def __getattr__(self, name):
+        method = getattr(self.query, name)
+
+        def chain(*args, **kwargs):
+            return DictQuery(method(*args, **kwargs))
+        return chain
+
+    def execute(self):
+        response = self.query.execute()
+        return DictResponse(data=response.data, count=response.count)
+
+class DictClient:
+    """supabase_py-style client over the in-memory stand-in"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def table(self, name):
+        return DictQuery(self.client.table(name))
+
+def make_listings(search, count, title):
+    """Listings in the shape returned by wallapop_api.fetch_listings"""
+    return [wallapop_api.to_listing({
+        'id': f"item-{search}-{n}",
+        'web_slug': f"bench-{search}-{n}",
+        'title': title,
+        'price': random.randint(2000, 9000),
+        'year': random.randint(2012, 2022),
+        'km': random.randint(5000, 90000),
+        'description': f"{title} en muy buen estado",
+        'location': {'city': 'Barcelona', 'latitude': 41.3851, 'longitude': 2.1734},
+        'images': [{'large': f"https://cdn.wallapop.com/images/{search}/{n}/{i}.jpg"} for i in range(3)]
+    }) for n in range(count)]
+
+def search_url(vehicle, search):
+    return f"https://es.wallapop.com/app/search?keywords={vehicle}&bench={search}"
+
+def store_cars(client, searches, listings_per_search):
+    import search_wallapop
+    for search in range(searches):
+        params = {'model': 'Leon', 'brand': 'Seat', 'min_price': 3000, 'max_price': 9000,
+                  'year': 2012, 'url': search_url('seat-leon', search)}
+        search_wallapop.store_search_results(client, params, make_listings(search, listings_per_search, 'Seat Leon'))
+
+def store_motos(client, searches, listings_per_search):
+    import search_wallapop_motos
+    for search in range(searches):
+        params = {'model': 'Z900', 'marca': 'Kawasaki', 'min_price': 3000, 'max_price': 9000, 'min_year': 2017,
+                  'search_url': search_url('z900', search), 'vehicle_type': 'moto'}
+        search_wallapop_motos.store_search_results(client, params, make_listings(search, listings_per_search, 'Kawasaki Z900'))
+
+def store_scooters(client, searches, listings_per_search):
+    import search_wallapop_scooters
+    for search in range(searches):
+        params = {'model': 'xmax', 'min_price': 1000, 'max_price': 4000, 'vehicle_type': 'scooter',
+                  'url': search_url('xmax', search)}
+        search_wallapop_scooters.store_search_results(client, params, make_listings(search, listings_per_search, 'Yamaha Xmax 125'))
+
+def store_furgos(client, searches, listings_per_search):
+    import search_wallapop_furgos
+    all_searches = [{'model': 'Vito', 'min_price': 3000, 'max_price': 9000, 'vehicle_type': 'furgo',
+                     'search_url': search_url('vito', search)} for search in range(searches)]
+    all_listings = {search['search_url']: make_listings(index, listings_per_search, 'Mercedes Vito')
+                    for index, search in enumerate(all_searches)}
+    search_wallapop_furgos.store_search_results(client, all_searches, all_listings)
+
+def bench_writer(name, latency, searches, listings_per_search):
+    """Store the searches twice and print the wall time and round trips of each pass"""
+    store = globals()[f"store_{name}"]
+    client = MemorySupabase(latency=latency)
+    print(f"\n{name}: {searches} searches x {listings_per_search} listings")
+    for label in ['new listings', 'already stored']:
+        random.seed(0)
+        client.reset_stats()
+        start = time.perf_counter()
+        # The scooters and furgos writers print every listing
+        with contextlib.redirect_stdout(io.StringIO()):
+            store(DictClient(client), searches, listings_per_search)
+        elapsed = time.perf_counter() - start
+        rows = sum(len(rows) for rows in client.tables.values())
+        print(f"- {label}: {elapsed:.2f}s, {client.total_round_trips} round trips, {rows} rows stored")
+        for key, count in sorted(client.round_trips.items(), key=lambda item: -item[1]):
+            print(f"    {key}: {count}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=40, help='simulated latency per Supabase request')
+    parser.add_argument('--searches', type=int, default=10, help='searches stored per writer')
+    parser.add_argument('--listings', type=int, default=40, help='listings per search')
+    parser.add_argument('--writers', nargs='+', choices=WRITERS, default=WRITERS, help='writers to benchmark')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    print(f"Simulated latency per request: {args.latency_ms:.0f}ms")
+    for name in args.writers:
+        bench_writer(name, args.latency_ms / 1000, args.searches, args.listings)
+
+if __name__ == "__main__":
+    main()
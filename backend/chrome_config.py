@@ -1,15 +1,55 @@
+import os
+
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 
-def get_chrome_options():
+# The scrapers only read anchors and text, so by default pages are loaded
+# without images, media, fonts and third-party scripts
+LEAN_PROFILE = os.getenv("CHROME_LEAN_PROFILE", "true").lower() == "true"
+
+# URL patterns blocked through the DevTools protocol by the lean profile
+BLOCKED_URL_PATTERNS = [
+    # Images and media
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.mp4', '*.webm', '*.mp3',
+    # Fonts
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*fonts.googleapis.com*', '*fonts.gstatic.com*',
+    # Third-party analytics, ads and trackers
+    '*google-analytics.com*', '*googletagmanager.com*', '*googlesyndication.com*',
+    '*doubleclick.net*', '*googleadservices.com*', '*facebook.net*', '*facebook.com*',
+    '*hotjar.com*', '*criteo.com*', '*criteo.net*', '*amazon-adsystem.com*', '*adnxs.com*',
+    '*taboola.com*', '*onetrust.com*', '*cookielaw.org*', '*branch.io*', '*braze.com*',
+    '*sentry.io*', '*datadoghq*', '*newrelic.com*', '*nr-data.net*', '*tiktok.com*',
+]
+
+def get_chrome_options(lean=LEAN_PROFILE):
     chrome_options = Options()
     chrome_options.add_argument('--headless')  # Run in headless mode
     chrome_options.add_argument('--no-sandbox')
     chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--window-size=1920,1080')
+    chrome_options.add_argument('user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36')
+    if lean:
+        # Return from driver.get once the DOM is ready; the scrapers wait for the listings themselves
+        chrome_options.page_load_strategy = 'eager'
+        chrome_options.add_argument('--disable-extensions')
+        chrome_options.add_argument('--disable-gpu')
+        chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+        chrome_options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.managed_default_content_settings.fonts': 2,
+        })
     return chrome_options
 
+def apply_lean_profile(driver, lean=LEAN_PROFILE):
+    """Block the requests of the lean profile in a started driver"""
+    if lean:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+    return driver
+
 def create_driver():
     """Create a Chrome WebDriver instance"""
     try:
@@ -25,7 +65,7 @@ def create_driver():
             options=options
         )
         
-        return driver
+        return apply_lean_profile(driver)
         
     except Exception as e:
         raise Exception(f"Failed to create Chrome driver: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+Pool of headless Chrome drivers shared by the scrapers.
+
+Starting Chrome dominates the time of a search, so drivers are kept alive
+between searches and handed out with `with get_pool().driver() as driver:`.
+Idle drivers are health-checked before being reused, drivers that crashed
+are replaced, and every driver is recycled after DRIVER_MAX_PAGES pages to
+cap Chrome's memory growth.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium import webdriver
+
+from chrome_config import get_chrome_options, apply_lean_profile
+
+logger = logging.getLogger(__name__)
+
+# Drivers alive at the same time, shared by every scraper of the process
+POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", "2"))
+
+# Pages served by a driver before it is replaced
+MAX_PAGES = int(os.getenv("DRIVER_MAX_PAGES", "50"))
+
+# Seconds a scraper waits for a free driver
+ACQUIRE_TIMEOUT = float(os.getenv("DRIVER_ACQUIRE_TIMEOUT", "600"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def start_driver():
+    """Start a headless Chrome with the shared scraper options and lean profile"""
+    return apply_lean_profile(webdriver.Chrome(options=get_chrome_options()))
+
+def is_healthy(driver):
+    """Check that the browser still answers"""
+    try:
+        return driver.execute_script("return 1") == 1
+    except Exception:
+        return False
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.warning(f"Error closing driver: {str(e)}")
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+class DriverPool:
+    def __init__(self, size=POOL_SIZE, max_pages=MAX_PAGES, factory=start_driver):
+        self.size = max(1, size)
+        self.max_pages = max(1, max_pages)
+        self.factory = factory
+        self.stats = {'started': 0, 'reused': 0, 'recycled': 0, 'crashed': 0, 'pages': 0}
+
+        self._idle = []
+        self._alive = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def driver(self, timeout=ACQUIRE_TIMEOUT):
+        """Borrow a driver for one page; it goes back to the pool afterwards"""
+        pooled = self._checkout(timeout)
+        failed = False
+        try:
+            yield pooled.driver
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._checkin(pooled, failed)
+
+    def _checkout(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Driver pool is closed")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._alive < self.size:
+                    self._alive += 1
+                    pooled = None
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No driver available after {timeout}s")
+                self._condition.wait(remaining)
+
+        if pooled is not None:
+            if is_healthy(pooled.driver):
+                self._count('reused')
+                return pooled
+            # The browser died while idle; its slot is reused for a new one
+            logger.warning("Replacing crashed driver")
+            self._count('crashed')
+            quit_driver(pooled.driver)
+
+        try:
+            driver = self.factory()
+        except Exception:
+            with self._condition:
+                self._alive -= 1
+                self._condition.notify()
+            raise
+        self._count('started')
+        return PooledDriver(driver)
+
+    def _checkin(self, pooled, failed):
+        pooled.pages += 1
+        self._count('pages')
+
+        discard = False
+        if failed and not is_healthy(pooled.driver):
+            logger.warning("Discarding driver that crashed during a search")
+            self._count('crashed')
+            discard = True
+        elif pooled.pages >= self.max_pages:
+            logger.info(f"Recycling driver after {pooled.pages} pages")
+            self._count('recycled')
+            discard = True
+
+        if discard or self._closed:
+            quit_driver(pooled.driver)
+            with self._condition:
+                self._alive -= 1
+                self._condition.notify()
+        else:
+            with self._condition:
+                self._idle.append(pooled)
+                self._condition.notify()
+
+    def _count(self, name):
+        with self._condition:
+            self.stats[name] += 1
+
+    def close(self):
+        """Quit the idle drivers; borrowed ones are quit when they are returned"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._alive -= len(idle)
+            self._condition.notify_all()
+        for pooled in idle:
+            quit_driver(pooled.driver)
+
+def get_pool():
+    """Driver pool shared by the scrapers of this process"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool()
+            atexit.register(_pool.close)
+        return _pool
@@ -1,11 +1,13 @@
 from fastapi import FastAPI, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 import search_wallapop
-import backend_copy.search_wallapop_motos as search_wallapop_motos
+import search_wallapop_motos
 import search_wallapop_furgos
 import search_wallapop_scooters
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Configure logging
@@ -31,61 +33,100 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Pipelines running at the same time; browsers are capped by the shared driver pool (DRIVER_POOL_SIZE)
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+
 # Store the last run time
 last_run_time = None
+last_run_seconds = None
 search_in_progress = False
 
+# Status of each pipeline in the current or last run
+pipeline_status = {}
+
+def summarize_cars(results):
+    last_car = results[-1]['search_parameters']
+    return len(results), f"{last_car['marca']} {last_car['model']}"
+
+def summarize_motos(results):
+    last_moto = results[-1]['search_parameters']
+    return len(results), f"{last_moto['marca']} {last_moto['model']}"
+
+def summarize_furgos(results):
+    if not results[0]:
+        return 0, None
+    last_furgo = results[0][-1]
+    return len(results[0]), f"{last_furgo['marca']} {last_furgo['model']}"
+
+def summarize_scooters(results):
+    last_scooter = results[-1]['search_parameters']
+    return len(results), last_scooter['model']
+
+# (name, label, run, summarize) of each vehicle pipeline; they write to disjoint tables
+PIPELINES = [
+    ('cars', 'Car', search_wallapop.process_all_cars, summarize_cars),
+    ('motos', 'Motorcycle', search_wallapop_motos.process_all_motos, summarize_motos),
+    ('furgos', 'Van', search_wallapop_furgos.process_all_furgos, summarize_furgos),
+    ('scooters', 'Scooter', search_wallapop_scooters.process_all_scooters, summarize_scooters),
+]
+
+def run_pipeline(name, label, run, summarize):
+    """Run one vehicle pipeline and record its status"""
+    status = pipeline_status[name]
+    status['status'] = 'running'
+    status['started_at'] = datetime.now().isoformat()
+    start_time = time.time()
+    logger.info(f"Starting {label.lower()} search...")
+    try:
+        results = run()
+        count, last_searched = summarize(results) if results else (0, None)
+        status['results'] = count
+        status['status'] = 'success'
+        if count:
+            # One line per pipeline, the pipelines log concurrently
+            logger.info(f"✓ {label} search complete. Found {count} results. Last searched: {last_searched}")
+        else:
+            logger.info(f"✓ {label} search complete. No results found")
+    except Exception as e:
+        status['status'] = 'error'
+        status['error'] = str(e)
+        logger.error(f"✗ {label} search failed: {str(e)}", exc_info=True)
+    finally:
+        status['duration_seconds'] = round(time.time() - start_time, 2)
+    return status
+
 def run_all_searches():
-    """Run all search scripts"""
-    global search_in_progress, last_run_time
+    """Run the vehicle pipelines concurrently"""
+    global search_in_progress, last_run_time, last_run_seconds, pipeline_status
     
     try:
         search_in_progress = True
+        start_time = time.time()
+        pipeline_status = {
+            name: {'status': 'pending', 'started_at': None, 'duration_seconds': None, 'results': None, 'error': None}
+            for name, _, _, _ in PIPELINES
+        }
         logger.info("="*50)
         logger.info("STARTING NEW SEARCH SESSION")
         logger.info("="*50)
         
-        # Run each search script
-        logger.info("\n[1/4] Starting car search...")
-        car_results = search_wallapop.process_all_cars()
-        if car_results:
-            last_car = car_results[-1]['search_parameters']
-            logger.info(f"✓ Car search complete. Found {len(car_results)} results")
-            logger.info(f"  Last searched: {last_car['marca']} {last_car['model']}")
-        else:
-            logger.info("✓ Car search complete. No results found")
-        
-        logger.info("\n[2/4] Starting motorcycle search...")
-        moto_results = search_wallapop_motos.process_all_motos()
-        if moto_results:
-            last_moto = moto_results[-1]['search_parameters']
-            logger.info(f"✓ Motorcycle search complete. Found {len(moto_results)} results")
-            logger.info(f"  Last searched: {last_moto['marca']} {last_moto['model']}")
-        else:
-            logger.info("✓ Motorcycle search complete. No results found")
-        
-        logger.info("\n[3/4] Starting van search...")
-        furgo_results = search_wallapop_furgos.process_all_furgos()
-        if furgo_results and furgo_results[0]:
-            last_furgo = furgo_results[0][-1]
-            logger.info(f"✓ Van search complete. Found {len(furgo_results[0])} results")
-            logger.info(f"  Last searched: {last_furgo['marca']} {last_furgo['model']}")
-        else:
-            logger.info("✓ Van search complete. No results found")
-        
-        logger.info("\n[4/4] Starting scooter search...")
-        scooter_results = search_wallapop_scooters.process_all_scooters()
-        if scooter_results:
-            last_scooter = scooter_results[-1]['search_parameters']
-            logger.info(f"✓ Scooter search complete. Found {len(scooter_results)} results")
-            logger.info(f"  Last searched: {last_scooter['model']}")
-        else:
-            logger.info("✓ Scooter search complete. No results found")
+        with ThreadPoolExecutor(max_workers=PIPELINE_WORKERS) as executor:
+            futures = [executor.submit(run_pipeline, *pipeline) for pipeline in PIPELINES]
+            for future in futures:
+                future.result()
         
         last_run_time = datetime.now()
+        last_run_seconds = round(time.time() - start_time, 2)
+        failed = [name for name, status in pipeline_status.items() if status['status'] == 'error']
+        
         logger.info("\n" + "="*50)
-        logger.info("ALL SEARCHES COMPLETED SUCCESSFULLY")
-        logger.info(f"Total time: {(datetime.now() - last_run_time).total_seconds():.2f} seconds")
+        if failed:
+            logger.info(f"SEARCHES COMPLETED WITH ERRORS IN: {', '.join(failed)}")
+        else:
+            logger.info("ALL SEARCHES COMPLETED SUCCESSFULLY")
+        for name, status in pipeline_status.items():
+            logger.info(f"  {name}: {status['status']} in {status['duration_seconds']:.2f} seconds")
+        logger.info(f"Total time: {last_run_seconds:.2f} seconds")
         logger.info("="*50 + "\n")
         
     except Exception as e:
@@ -125,7 +166,9 @@ async def get_status():
     """Get the status of the search process"""
     return {
         "search_in_progress": search_in_progress,
-        "last_run": last_run_time.isoformat() if last_run_time else None
+        "last_run": last_run_time.isoformat() if last_run_time else None,
+        "last_run_seconds": last_run_seconds,
+        "pipelines": pipeline_status
     }
 
 @app.get("/logs")
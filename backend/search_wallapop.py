@@ -1,13 +1,12 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
 import json
 import os
 from supabase_py import create_client
 from urllib.parse import quote
 from dotenv import load_dotenv
+import driver_pool
 import re
 from chrome_config import get_chrome_options, create_driver
 import logging
@@ -318,101 +317,90 @@ def clean_title(title):
 
 def search_wallapop(car):
     """Search Wallapop for a specific car model"""
-    chrome_options = Options()
-    chrome_options.add_argument('--headless')
-    chrome_options.add_argument('--no-sandbox')
-    chrome_options.add_argument('--disable-dev-shm-usage')
-    chrome_options.add_argument('--window-size=1920,1080')
-    chrome_options.add_argument('user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36')
-    
-    driver = webdriver.Chrome(options=chrome_options)
-    wait = WebDriverWait(driver, 10)
-    
-    try:
-        # Get model and price range
-        model = car['modelo']
-        brand = car['marca']
-        price_range = car['precio_compra']
-        start_year = car['ano_fabricacion'].split('/')[0] if '/' in car['ano_fabricacion'] else car['ano_fabricacion']
+    with driver_pool.get_pool().driver() as driver:
+        wait = WebDriverWait(driver, 10)
         
-        # Parse price range
-        min_price = parse_price_range(price_range)
-        if min_price is None:  # Handle error case
-            logger.error(f"Could not parse price range: {price_range}")
-            return None
+        try:
+            # Get model and price range
+            model = car['modelo']
+            brand = car['marca']
+            price_range = car['precio_compra']
+            start_year = car['ano_fabricacion'].split('/')[0] if '/' in car['ano_fabricacion'] else car['ano_fabricacion']
+        
+            # Parse price range
+            min_price = parse_price_range(price_range)
+            if min_price is None:  # Handle error case
+                logger.error(f"Could not parse price range: {price_range}")
+                return None
             
-        # Build search URL
-        base_url = "https://es.wallapop.com/app/search"
-        search_params = {
-            'keywords': model,
-            'latitude': '41.224151',
-            'longitude': '1.7255678',
-            'category_ids': '100',
-            'min_sale_price': str(int(min_price)),
-            'min_year': start_year,
-            'max_km': '200000',
-            'distance': '200000',
-            'order_by': 'price_low_to_high',
-            'brand': brand
-        }
+            # Build search URL
+            base_url = "https://es.wallapop.com/app/search"
+            search_params = {
+                'keywords': model,
+                'latitude': '41.224151',
+                'longitude': '1.7255678',
+                'category_ids': '100',
+                'min_sale_price': str(int(min_price)),
+                'min_year': start_year,
+                'max_km': '200000',
+                'distance': '200000',
+                'order_by': 'price_low_to_high',
+                'brand': brand
+            }
         
-        url = f"{base_url}?{'&'.join(f'{k}={quote(str(v))}' for k, v in search_params.items())}"
-        logger.debug(f"Searching URL: {url}")  # Changed to debug level
+            url = f"{base_url}?{'&'.join(f'{k}={quote(str(v))}' for k, v in search_params.items())}"
+            logger.debug(f"Searching URL: {url}")  # Changed to debug level
         
-        driver.get(url)
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href*="/item/"]')))
+            driver.get(url)
+            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href*="/item/"]')))
         
-        listing_elements = driver.find_elements(By.CSS_SELECTOR, 'a[href*="/item/"]')[:5]
+            listing_elements = driver.find_elements(By.CSS_SELECTOR, 'a[href*="/item/"]')[:5]
         
-        if not listing_elements:
-            logger.warning("No listings found")
-            return None
+            if not listing_elements:
+                logger.warning("No listings found")
+                return None
             
-        listings = []
-        for element in listing_elements:
-            try:
-                image_elements = element.find_elements(By.CSS_SELECTOR, 'img[src*="cdn.wallapop.com/images/"]')
-                image_urls = [img.get_attribute('src') for img in image_elements if img.get_attribute('src')]
+            listings = []
+            for element in listing_elements:
+                try:
+                    image_elements = element.find_elements(By.CSS_SELECTOR, 'img[src*="cdn.wallapop.com/images/"]')
+                    image_urls = [img.get_attribute('src') for img in image_elements if img.get_attribute('src')]
                 
-                original_title = element.text
-                cleaned_title = clean_title(original_title)
+                    original_title = element.text
+                    cleaned_title = clean_title(original_title)
                 
-                listing = {
-                    'url': element.get_attribute('href'),
-                    'title': cleaned_title + '\n' + '\n'.join(original_title.split('\n')[1:]),
-                    'price': element.find_element(By.CSS_SELECTOR, '[class*="price"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="price"]') else None,
-                    'location': element.find_element(By.CSS_SELECTOR, '[class*="location"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="location"]') else None,
-                    'images': image_urls
-                }
-                listings.append(listing)
-            except Exception as e:
-                logger.error(f"Error processing listing element: {str(e)}")
-                continue
+                    listing = {
+                        'url': element.get_attribute('href'),
+                        'title': cleaned_title + '\n' + '\n'.join(original_title.split('\n')[1:]),
+                        'price': element.find_element(By.CSS_SELECTOR, '[class*="price"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="price"]') else None,
+                        'location': element.find_element(By.CSS_SELECTOR, '[class*="location"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="location"]') else None,
+                        'images': image_urls
+                    }
+                    listings.append(listing)
+                except Exception as e:
+                    logger.error(f"Error processing listing element: {str(e)}")
+                    continue
         
-        search_params = {
-            'model': model,
-            'brand': brand,
-            'min_price': min_price,
-            'max_price': None,
-            'year': start_year,
-            'vehicle_type': 'car',
-            'url': url
-        }
+            search_params = {
+                'model': model,
+                'brand': brand,
+                'min_price': min_price,
+                'max_price': None,
+                'year': start_year,
+                'vehicle_type': 'car',
+                'url': url
+            }
         
-        logger.info(f"Found {len(listings)} listings for {brand} {model}")  # Simplified log message
+            logger.info(f"Found {len(listings)} listings for {brand} {model}")  # Simplified log message
         
-        return {
-            'search_parameters': search_params,
-            'listings': listings
-        }
+            return {
+                'search_parameters': search_params,
+                'listings': listings
+            }
         
-    except Exception as e:
-        logger.error(f"Error searching for {car['modelo']}: {str(e)}")
-        return None
-        
-    finally:
-        if driver:
-            driver.quit()
+        except Exception as e:
+            logger.error(f"Error searching for {car['modelo']}: {str(e)}")
+            return None
 
 def search_with_retry(car, max_retries=3, delay=5):
     """Retry search with exponential backoff"""
@@ -1,12 +1,12 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
 import os
 from supabase_py import create_client
 from urllib.parse import quote
 from dotenv import load_dotenv
+import driver_pool
+import wallapop_api
 import re
 import json
 from datetime import datetime
@@ -109,17 +109,8 @@ def log_search_error(furgo, url, error_message):
         print(f"\nFailed to log error: {str(e)}")
 
 def search_wallapop(furgo):
-    """Search Wallapop for van listings"""
-    chrome_options = Options()
-    chrome_options.add_argument('--headless')
-    chrome_options.add_argument('--no-sandbox')
-    chrome_options.add_argument('--disable-dev-shm-usage')
-    chrome_options.add_argument('--window-size=1920,1080')
-    chrome_options.add_argument('user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36')
-    
-    driver = webdriver.Chrome(options=chrome_options)
-    wait = WebDriverWait(driver, 10)
-    
+    """Search Wallapop for van listings, from the API or using Selenium"""
+    url = None
     try:
         # Get parameters from the van data
         model = furgo['modelo']
@@ -128,18 +119,18 @@ def search_wallapop(furgo):
         config = furgo['configuracion']
         min_price, max_price = parse_price_range(furgo['precio'])
         year_range = furgo['año_fabricacion']
-        
+
         # Calculate minimum price (using same approach as cars)
         avg_price = (min_price + max_price) / 2
         search_min_price = int(avg_price / 2)  # Use 50% of average price as minimum
-        
+
         # Extract year range
         start_year = year_range.split('-')[0]
-        
+
         # Use only the model for search keywords
         encoded_keywords = quote(model)
         encoded_brand = quote(brand)
-        
+
         url = (
             f"https://es.wallapop.com/app/search?"
             f"keywords={encoded_keywords}"
@@ -153,79 +144,98 @@ def search_wallapop(furgo):
             f"&order_by=price_low_to_high"
             f"&brand={encoded_brand}"  # Add brand parameter
         )
+    except Exception as e:
+        log_search_error(furgo, url, e)
+        print(f"\nError searching for {furgo['modelo']}: {str(e)}")
+        return None
+
+    search_params = {
+        'model': model,
+        'marca': brand,
+        'min_price': search_min_price,
+        'max_price': None,
+        'motor': motor,
+        'configuracion': config,
+        'vehicle_type': 'furgo',
+        'url': url,
+        'target_price_range': (min_price, max_price)
+    }
+
+    print(f"\nSearching URL: {url}")
+
+    if wallapop_api.use_api():
+        try:
+            listings = wallapop_api.fetch_listings(url)
+            if not listings:
+                log_search_error(furgo, url, "No listings found")
+                return None
+            print(f"\nSearch complete for {model}. Found {len(listings)} listings")
+            return {
+                'search_parameters': search_params,
+                'listings': listings
+            }
+        except Exception as e:
+            print(f"\nAPI search failed for {model}, using the browser: {str(e)}")
+
+    with driver_pool.get_pool().driver() as driver:
+        wait = WebDriverWait(driver, 10)
         
-        print(f"\nSearching URL: {url}")
-        
-        driver.get(url)
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href*="/item/"]')))
+        try:
+            driver.get(url)
+            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href*="/item/"]')))
         
-        listing_elements = driver.find_elements(By.CSS_SELECTOR, 'a[href*="/item/"]')[:5]
+            listing_elements = driver.find_elements(By.CSS_SELECTOR, 'a[href*="/item/"]')[:5]
         
-        if not listing_elements:
-            log_search_error(furgo, url, "No listings found")
-            return None
+            if not listing_elements:
+                log_search_error(furgo, url, "No listings found")
+                return None
             
-        listings = []
+            listings = []
         
-        for element in listing_elements:
-            image_elements = element.find_elements(By.CSS_SELECTOR, 'img[src*="cdn.wallapop.com/images/"]')
-            image_urls = [img.get_attribute('src') for img in image_elements if img.get_attribute('src')]
+            for element in listing_elements:
+                image_elements = element.find_elements(By.CSS_SELECTOR, 'img[src*="cdn.wallapop.com/images/"]')
+                image_urls = [img.get_attribute('src') for img in image_elements if img.get_attribute('src')]
             
-            original_title = element.text
-            cleaned_title = clean_title(original_title)
-            price_text = element.find_element(By.CSS_SELECTOR, '[class*="price"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="price"]') else None
+                original_title = element.text
+                cleaned_title = clean_title(original_title)
+                price_text = element.find_element(By.CSS_SELECTOR, '[class*="price"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="price"]') else None
             
-            # Calculate price difference right here
-            listing_price = parse_listing_price(price_text)
-            if listing_price:
-                target_avg_price = (min_price + max_price) / 2
-                price_difference = int(round(listing_price - target_avg_price))
+                # Calculate price difference right here
+                listing_price = parse_listing_price(price_text)
+                if listing_price:
+                    target_avg_price = (min_price + max_price) / 2
+                    price_difference = int(round(listing_price - target_avg_price))
                 
-                print("\n" + "="*50)
-                print(f"Listing: {cleaned_title}")
-                print(f"Raw price text: {price_text}")
-                print("\nCalculation:")
-                print(f"Parsed listing price: {listing_price}€")
-                print(f"Target price range: {min_price}€ - {max_price}€")
-                print(f"Target average: ({min_price} + {max_price}) / 2 = {target_avg_price}€")
-                print(f"Price difference: {listing_price} - {target_avg_price} = {price_difference}€")
-                print("="*50)
+                    print("\n" + "="*50)
+                    print(f"Listing: {cleaned_title}")
+                    print(f"Raw price text: {price_text}")
+                    print("\nCalculation:")
+                    print(f"Parsed listing price: {listing_price}€")
+                    print(f"Target price range: {min_price}€ - {max_price}€")
+                    print(f"Target average: ({min_price} + {max_price}) / 2 = {target_avg_price}€")
+                    print(f"Price difference: {listing_price} - {target_avg_price} = {price_difference}€")
+                    print("="*50)
             
-            listing = {
-                'url': element.get_attribute('href'),
-                'title': cleaned_title + '\n' + '\n'.join(original_title.split('\n')[1:]),
-                'price': price_text,
-                'location': element.find_element(By.CSS_SELECTOR, '[class*="location"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="location"]') else None,
-                'images': image_urls
-            }
-            listings.append(listing)
-        
-        search_params = {
-            'model': model,
-            'marca': brand,
-            'min_price': search_min_price,
-            'max_price': None,
-            'motor': motor,
-            'configuracion': config,
-            'vehicle_type': 'furgo',
-            'url': url,
-            'target_price_range': (min_price, max_price)
-        }
-        
-        print(f"\nSearch complete for {model}. Found {len(listings)} listings")
+                listing = {
+                    'url': element.get_attribute('href'),
+                    'title': cleaned_title + '\n' + '\n'.join(original_title.split('\n')[1:]),
+                    'price': price_text,
+                    'location': element.find_element(By.CSS_SELECTOR, '[class*="location"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="location"]') else None,
+                    'images': image_urls
+                }
+                listings.append(listing)
         
-        return {
-            'search_parameters': search_params,
-            'listings': listings
-        }
+            print(f"\nSearch complete for {model}. Found {len(listings)} listings")
         
-    except Exception as e:
-        log_search_error(furgo, url, e)
-        print(f"\nError searching for {furgo['modelo']}: {str(e)}")
-        return None
+            return {
+                'search_parameters': search_params,
+                'listings': listings
+            }
         
-    finally:
-        driver.quit()
+        except Exception as e:
+            log_search_error(furgo, url, e)
+            print(f"\nError searching for {furgo['modelo']}: {str(e)}")
+            return None
 
 def parse_listing_price(price_text):
     """Parse price text into numeric value"""
@@ -315,7 +325,7 @@ def store_search_results(supabase, all_searches, all_listings):
                     'price_text': listing['price'],
                     'price_difference': price_difference,
                     'location': listing['location'],
-                    'description': listing['title']
+                    'description': listing.get('description') or listing['title']
                 }
                 all_listing_data.append(listing_data)
         
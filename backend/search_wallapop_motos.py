@@ -1,12 +1,12 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
 import os
 from supabase_py import create_client
 from urllib.parse import quote
 from dotenv import load_dotenv
+import driver_pool
+import wallapop_api
 import re
 import logging
 import time
@@ -106,91 +106,109 @@ def parse_year_range(year_range):
         logger.error(f"Failed to parse year range '{year_range}': {str(e)}")
         return []
 
+def build_search(moto, specific_year=None):
+    """Search URL and parameters for a motorcycle and year"""
+    model = moto['model']
+    brand = moto['brand']
+    min_price, max_price = parse_price_range(moto['price_range'])
+
+    # Include year in search terms if specified
+    search_terms = f"{brand} {model}"
+    if specific_year:
+        search_terms += f" {specific_year}"
+
+    encoded_keywords = quote(search_terms)
+
+    # Calculate price range
+    avg_price = (min_price + max_price) / 2
+    search_min_price = int(avg_price * 0.4)
+
+    url = (
+        f"https://es.wallapop.com/app/search?"
+        f"keywords={encoded_keywords}"
+        f"&latitude=41.224151"
+        f"&longitude=1.7255678"
+        f"&category_ids=14000"
+        f"&min_sale_price={search_min_price}"
+        f"&distance=200000"
+        f"&order_by=price_low_to_high"
+    )
+
+    search_params = {
+        'model': model,
+        'marca': brand,
+        'min_price': search_min_price,
+        'max_price': int(max_price),
+        'min_year': specific_year,
+        'max_year': specific_year,
+        'search_url': url,
+        'vehicle_type': 'moto'
+    }
+    return search_terms, search_params
+
 def search_wallapop(moto, specific_year=None):
     """Search Wallapop for motorcycle listings for a specific year"""
-    chrome_options = Options()
-    chrome_options.add_argument('--headless')
-    chrome_options.add_argument('--no-sandbox')
-    chrome_options.add_argument('--disable-dev-shm-usage')
-    
+    try:
+        search_terms, search_params = build_search(moto, specific_year)
+    except Exception as e:
+        logger.error(f"Invalid search for {moto['model']}: {str(e)}")
+        return None
+    url = search_params['search_url']
+
+    print(f"\nSearching URL for year {specific_year}: {url}")
+
+    if wallapop_api.use_api():
+        try:
+            listings = wallapop_api.fetch_listings(url)
+            for listing in listings:
+                listing['search_year'] = specific_year
+            print(f"\nSearch complete for {search_terms}. Found {len(listings)} listings")
+            return {
+                'search_parameters': search_params,
+                'listings': listings
+            }
+        except Exception as e:
+            logger.warning(f"API search failed for {search_terms}, using the browser: {str(e)}")
+
     max_retries = 3
     retry_delay = 5
     
     for attempt in range(max_retries):
-        driver = None
         try:
-            driver = webdriver.Chrome(options=chrome_options)
-            wait = WebDriverWait(driver, 15)
-            
-            model = moto['model']
-            brand = moto['brand']
-            min_price, max_price = parse_price_range(moto['price_range'])
-            
-            # Include year in search terms if specified
-            search_terms = f"{brand} {model}"
-            if specific_year:
-                search_terms += f" {specific_year}"
-                
-            encoded_keywords = quote(search_terms)
+            # A driver that crashed during the attempt is replaced by the pool
+            with driver_pool.get_pool().driver() as driver:
+                wait = WebDriverWait(driver, 15)
             
-            # Calculate price range
-            avg_price = (min_price + max_price) / 2
-            search_min_price = int(avg_price * 0.4)
+                driver.get(url)
+                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href*="/item/"]')))
             
-            url = (
-                f"https://es.wallapop.com/app/search?"
-                f"keywords={encoded_keywords}"
-                f"&latitude=41.224151"
-                f"&longitude=1.7255678"
-                f"&category_ids=14000"
-                f"&min_sale_price={search_min_price}"
-                f"&distance=200000"
-                f"&order_by=price_low_to_high"
-            )
+                listing_elements = driver.find_elements(By.CSS_SELECTOR, 'a[href*="/item/"]')[:7]
             
-            print(f"\nSearching URL for year {specific_year}: {url}")
-            
-            driver.get(url)
-            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href*="/item/"]')))
-            
-            listing_elements = driver.find_elements(By.CSS_SELECTOR, 'a[href*="/item/"]')[:7]
-            
-            listings = []
-            for element in listing_elements:
-                image_elements = element.find_elements(By.CSS_SELECTOR, 'img[src*="cdn.wallapop.com/images/"]')
-                image_urls = [img.get_attribute('src') for img in image_elements if img.get_attribute('src')]
+                listings = []
+                for element in listing_elements:
+                    image_elements = element.find_elements(By.CSS_SELECTOR, 'img[src*="cdn.wallapop.com/images/"]')
+                    image_urls = [img.get_attribute('src') for img in image_elements if img.get_attribute('src')]
                 
-                original_title = element.text
-                cleaned_title = clean_title(original_title)
+                    original_title = element.text
+                    cleaned_title = clean_title(original_title)
                 
-                listing = {
-                    'url': element.get_attribute('href'),
-                    'title': cleaned_title + '\n' + '\n'.join(original_title.split('\n')[1:]),
-                    'price': element.find_element(By.CSS_SELECTOR, '[class*="price"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="price"]') else None,
-                    'location': element.find_element(By.CSS_SELECTOR, '[class*="location"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="location"]') else None,
-                    'images': image_urls,
-                    'search_year': specific_year
-                }
-                listings.append(listing)
-                print(f"Found: {listing['title']} - {listing['price']} - {listing['location']}")
+                    listing = {
+                        'url': element.get_attribute('href'),
+                        'title': cleaned_title + '\n' + '\n'.join(original_title.split('\n')[1:]),
+                        'price': element.find_element(By.CSS_SELECTOR, '[class*="price"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="price"]') else None,
+                        'location': element.find_element(By.CSS_SELECTOR, '[class*="location"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="location"]') else None,
+                        'images': image_urls,
+                        'search_year': specific_year
+                    }
+                    listings.append(listing)
+                    print(f"Found: {listing['title']} - {listing['price']} - {listing['location']}")
             
-            search_params = {
-                'model': model,
-                'marca': brand,
-                'min_price': search_min_price,
-                'max_price': int(max_price),
-                'min_year': specific_year,
-                'max_year': specific_year,
-                'search_url': url,
-                'vehicle_type': 'moto'
-            }
+                print(f"\nSearch complete for {search_terms}. Found {len(listings)} listings")
             
-            print(f"\nSearch complete for {search_terms}. Found {len(listings)} listings")
-            
-            return {
-                'search_parameters': search_params,
-                'listings': listings
-            }
+                return {
+                    'search_parameters': search_params,
+                    'listings': listings
+                }
             
         except Exception as e:
             logger.error(f"Attempt {attempt + 1}/{max_retries} failed: {str(e)}")
@@ -200,13 +218,6 @@ def search_wallapop(moto, specific_year=None):
             else:
                 logger.error(f"All attempts failed for {moto['model']}: {str(e)}")
                 return None
-                
-        finally:
-            if driver:
-                try:
-                    driver.quit()
-                except Exception as e:
-                    logger.error(f"Error closing driver: {str(e)}")
 
 def parse_listing_price(price_text):
     """Parse price text into numeric value"""
@@ -316,7 +327,7 @@ def store_search_results(supabase, search_params, listings):
                 listing_data = {
                     'search_id': search_id,
                     'url': listing['url'],
-                    'title': listing['title'].split('\n')[-1],
+                    'title': listing.get('item_title') or listing['title'].split('\n')[-1],
                     'price': float(details['price']) if details['price'] else None,
                     'price_text': details['price_text'],
                     'location': listing['location'],
@@ -325,7 +336,7 @@ def store_search_results(supabase, search_params, listings):
                     'transmission': details['transmission'],
                     'power_cv': int(details['power_cv']) if details['power_cv'] else None,
                     'kilometers': int(details['kilometers']) if details['kilometers'] else None,
-                    'description': details['description']
+                    'description': listing.get('description') or details['description']
                 }
                 
                 logger.debug(f"Attempting to insert listing with data: {listing_data}")
@@ -1,11 +1,11 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
 from supabase_py import create_client
 from urllib.parse import quote
 from dotenv import load_dotenv
+import driver_pool
+import wallapop_api
 import os
 import re
 from chrome_config import get_chrome_options, create_driver
@@ -28,80 +28,82 @@ def clean_title(title):
     return title.split('\n')[0].strip()
 
 def search_wallapop_scooters():
-    """Search Wallapop for scooter listings using Selenium"""
-    chrome_options = Options()
-    chrome_options.add_argument('--headless')
-    chrome_options.add_argument('--no-sandbox')
-    chrome_options.add_argument('--disable-dev-shm-usage')
-    chrome_options.add_argument('--window-size=1920,1080')
-    chrome_options.add_argument('user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36')
-    
-    driver = webdriver.Chrome(options=chrome_options)
-    wait = WebDriverWait(driver, 10)
-    
-    try:
-        # Fixed search parameters for scooters
-        keywords = "Scooter 125cc"
-        min_price = 400
-        max_price = 2000  # Increased max price for more results
-        
-        encoded_keywords = quote(keywords)
-        url = (
-            f"https://es.wallapop.com/app/search?"
-            f"keywords={encoded_keywords}"
-            f"&latitude=41.224151"
-            f"&longitude=1.7255678"
-            f"&category_ids=14000"  # Motorcycle/Scooter category
-            f"&min_sale_price={min_price}"
-            f"&max_sale_price={max_price}"
-            f"&distance=200000"
-            f"&order_by=price_low_to_high"
-        )
-        
-        print(f"Searching: {url}")
+    """Search Wallapop for scooter listings, from the API or using Selenium"""
+    # Fixed search parameters for scooters
+    keywords = "Scooter 125cc"
+    min_price = 400
+    max_price = 2000  # Increased max price for more results
+
+    encoded_keywords = quote(keywords)
+    url = (
+        f"https://es.wallapop.com/app/search?"
+        f"keywords={encoded_keywords}"
+        f"&latitude=41.224151"
+        f"&longitude=1.7255678"
+        f"&category_ids=14000"  # Motorcycle/Scooter category
+        f"&min_sale_price={min_price}"
+        f"&max_sale_price={max_price}"
+        f"&distance=200000"
+        f"&order_by=price_low_to_high"
+    )
+
+    search_params = {
+        'model': keywords,
+        'min_price': min_price,
+        'max_price': max_price,
+        'vehicle_type': 'scooter',
+        'url': url
+    }
+
+    print(f"Searching: {url}")
+
+    if wallapop_api.use_api():
+        try:
+            listings = wallapop_api.fetch_listings(url)
+            for listing in listings:
+                print(f"Found: {listing['item_title']} - {listing['price']} - {listing['location']}")
+            return {
+                'search_parameters': search_params,
+                'listings': listings
+            }
+        except Exception as e:
+            print(f"API search failed for scooters, using the browser: {str(e)}")
+
+    with driver_pool.get_pool().driver() as driver:
+        wait = WebDriverWait(driver, 10)
         
-        driver.get(url)
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href*="/item/"]')))
+        try:
+            driver.get(url)
+            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href*="/item/"]')))
         
-        listing_elements = driver.find_elements(By.CSS_SELECTOR, 'a[href*="/item/"]')[:10]
+            listing_elements = driver.find_elements(By.CSS_SELECTOR, 'a[href*="/item/"]')[:10]
         
-        listings = []
-        for element in listing_elements:
-            image_elements = element.find_elements(By.CSS_SELECTOR, 'img[src*="cdn.wallapop.com/images/"]')
-            image_urls = [img.get_attribute('src') for img in image_elements if img.get_attribute('src')]
+            listings = []
+            for element in listing_elements:
+                image_elements = element.find_elements(By.CSS_SELECTOR, 'img[src*="cdn.wallapop.com/images/"]')
+                image_urls = [img.get_attribute('src') for img in image_elements if img.get_attribute('src')]
             
-            original_title = element.text
-            cleaned_title = clean_title(original_title)
+                original_title = element.text
+                cleaned_title = clean_title(original_title)
             
-            listing = {
-                'url': element.get_attribute('href'),
-                'title': cleaned_title + '\n' + '\n'.join(original_title.split('\n')[1:]),
-                'price': element.find_element(By.CSS_SELECTOR, '[class*="price"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="price"]') else None,
-                'location': element.find_element(By.CSS_SELECTOR, '[class*="location"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="location"]') else None,
-                'images': image_urls
-            }
-            listings.append(listing)
-            print(f"Found: {listing['title']} - {listing['price']} - {listing['location']}")
-        
-        search_params = {
-            'model': keywords,
-            'min_price': min_price,
-            'max_price': max_price,
-            'vehicle_type': 'scooter',
-            'url': url
-        }
-        
-        return {
-            'search_parameters': search_params,
-            'listings': listings
-        }
+                listing = {
+                    'url': element.get_attribute('href'),
+                    'title': cleaned_title + '\n' + '\n'.join(original_title.split('\n')[1:]),
+                    'price': element.find_element(By.CSS_SELECTOR, '[class*="price"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="price"]') else None,
+                    'location': element.find_element(By.CSS_SELECTOR, '[class*="location"]').text if element.find_elements(By.CSS_SELECTOR, '[class*="location"]') else None,
+                    'images': image_urls
+                }
+                listings.append(listing)
+                print(f"Found: {listing['title']} - {listing['price']} - {listing['location']}")
         
-    except Exception as e:
-        print(f"Error searching for scooters: {str(e)}")
-        return None
+            return {
+                'search_parameters': search_params,
+                'listings': listings
+            }
         
-    finally:
-        driver.quit()
+        except Exception as e:
+            print(f"Error searching for scooters: {str(e)}")
+            return None
 
 def parse_listing_details(title_text):
     """Parse listing title text into structured data"""
@@ -179,9 +181,9 @@ def store_search_results(supabase, search_params, listings):
                     'price_text': details['price_text'],
                     'location': listing['location'],
                     'year': details['year'],
-                    'engine_cc': details['engine_cc'],
+                    'engine_cc': listing.get('engine_cc') or details['engine_cc'],
                     'kilometers': details['kilometers'],
-                    'description': details['description']
+                    'description': listing.get('description') or details['description']
                 }
                 
                 # Insert listing and handle response properly
@@ -0,0 +1,129 @@
+"""
+JSON search of the Wallapop API for the motos, furgos and scooters scrapers.
+
+The scrapers build the es.wallapop.com search URL of a query as before;
+fetch_listings sends the same query parameters to the API and returns the
+whole page of results in one HTTP call. Van searches (category 100) go to the
+cars endpoint, motos and scooters (category 14000) to the general one.
+
+Listings have the keys of the dicts scraped from the result cards (url, a
+card-like multi-line title, price text, location, image URLs), so the
+store_search_results functions work unchanged, plus structured fields read
+from the API (item_id, item_title, price_value, year, kilometers, engine_cc,
+description, latitude, longitude, distance).
+"""
+import logging
+import os
+import re
+import time
+from urllib.parse import urlparse, parse_qsl
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# "api" fetches searches from the JSON API and falls back to the browser on errors,
+# "selenium" always scrapes the web search with the driver pool
+FETCH_MODE = os.getenv("SCRAPER_FETCH_MODE", "api").lower()
+
+# Seconds before an API request is abandoned
+REQUEST_TIMEOUT = float(os.getenv("WALLAPOP_API_TIMEOUT", "15"))
+
+CARS_SEARCH_URL = "https://api.wallapop.com/api/v3/cars/search"
+GENERAL_SEARCH_URL = "https://api.wallapop.com/api/v3/general/search"
+CARS_CATEGORY = "100"
+
+def use_api():
+    """Whether searches go to the JSON API first"""
+    return FETCH_MODE == "api"
+
+def search_query(search_url):
+    """Query parameters of an es.wallapop.com search URL"""
+    return dict(parse_qsl(urlparse(search_url).query))
+
+def fetch_search_objects(search_url):
+    """Contents of one page of API results for a web search URL"""
+    params = search_query(search_url)
+    endpoint = CARS_SEARCH_URL if params.get('category_ids') == CARS_CATEGORY else GENERAL_SEARCH_URL
+    response = requests.get(endpoint, params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    # The cars endpoint wraps each item in 'content', the general one does not
+    return [item.get('content', item) for item in response.json().get('search_objects', [])]
+
+def price_value(content):
+    """Numeric price of an item, given as a number or as {'amount': ...}"""
+    price = content.get('price')
+    if isinstance(price, dict):
+        price = price.get('amount')
+    try:
+        return float(price) if price is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def format_price_text(price):
+    """Price text as shown on the result cards"""
+    return f"{price:,.0f} €".replace(",", ".")
+
+def image_urls(images):
+    """Image URLs from the image dicts or URL strings of the API"""
+    urls = []
+    for img in images or []:
+        if isinstance(img, dict):
+            url = img.get('large') or img.get('original') or img.get('medium')
+            if url:
+                urls.append(url)
+        elif isinstance(img, str):
+            urls.append(img)
+    return urls
+
+def engine_size(title):
+    """Engine size in cc mentioned in a title"""
+    match = re.search(r'(\d{2,4})\s*(?:cc|cm3)', title.lower())
+    return int(match.group(1)) if match else None
+
+def to_int(value):
+    try:
+        return int(float(value)) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+def to_listing(content):
+    """Listing dict for the content of an API result"""
+    title = (content.get('title') or '').strip()
+    price = price_value(content)
+    price_text = format_price_text(price) if price is not None else None
+    year = to_int(content.get('year'))
+    kilometers = to_int(content.get('km'))
+    location = content.get('location') or {}
+
+    # Same lines as the text of a result card: title, price, year, kilometers
+    card_lines = [title, price_text or '']
+    if year:
+        card_lines.append(str(year))
+    if kilometers is not None:
+        card_lines.append(f"{kilometers} km")
+
+    return {
+        'url': f"https://es.wallapop.com/item/{content['web_slug']}",
+        'title': '\n'.join(card_lines),
+        'price': price_text,
+        'location': location.get('city'),
+        'images': image_urls(content.get('images')),
+        'item_id': content.get('id'),
+        'item_title': title,
+        'price_value': price,
+        'year': year,
+        'kilometers': kilometers,
+        'engine_cc': engine_size(title),
+        'description': content.get('description'),
+        'latitude': location.get('latitude'),
+        'longitude': location.get('longitude'),
+        'distance': content.get('distance')
+    }
+
+def fetch_listings(search_url):
+    """Listings of a web search URL, fetched from the API in one request"""
+    start_time = time.time()
+    listings = [to_listing(content) for content in fetch_search_objects(search_url) if content.get('web_slug')]
+    logger.info(f"API search returned {len(listings)} listings in {time.time() - start_time:.2f}s")
+    return listings
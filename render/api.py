@@ -5,12 +5,18 @@ import wallapop_endpoint_search
 from process_modo_rapido import process_modo_rapido_entries
 import logging
 import os
+import threading
 from pydantic import BaseModel
 from typing import Optional, List
 from enum import Enum
-from datetime import datetime, timezone, timedelta
 from supabase import create_client, Client
-from process_alerts import process_alerts
+from process_alerts import process_alerts, run_alert_loop
+from reverse_match import process_alerts_reverse
+import price_history
+from listing_record import ListingRecord, API_FIELDS, format_price_text
+import retention
+import mailer
+import memory_supabase
 
 app = FastAPI()
 
@@ -36,6 +42,12 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# How /api/process-alerts serves alerts by default: "search" or "reverse"
+ALERT_MATCH_MODE = os.getenv("ALERT_MATCH_MODE", "search")
+
+# Run the alert processing loop inside the API process instead of relying on cron calls
+ALERT_BACKGROUND_LOOP = os.getenv("ALERT_BACKGROUND_LOOP", "false").lower() == "true"
+
 class EngineType(str, Enum):
     GASOLINE = "gasoline"
     GASOIL = "gasoil"
@@ -152,7 +164,7 @@ async def search_single_car(params: CarSearchParams):
         
         response = {
             "success": True,
-            "listings": result['listings'],
+            "listings": [listing.to_dict() for listing in result['listings']],
             "total_results": result['total_results'],
             "filtered_results": result['filtered_results'],
             "search_parameters": result['search_parameters'],
@@ -288,6 +300,9 @@ async def test_search():
 
 def init_supabase() -> Client:
     """Initialize Supabase client"""
+    if memory_supabase.use_memory_backend():
+        return memory_supabase.get_client()
+    
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_KEY")
     
@@ -296,45 +311,11 @@ def init_supabase() -> Client:
         
     return create_client(supabase_url, supabase_key)
 
-def format_price_text(price: float) -> str:
-    """Format price as text with euro symbol"""
-    return f"{price:,.0f} €".replace(",", ".")
-
 def transform_listing(listing, market_price: float):
     """Transform a Wallapop API listing to our desired format"""
     content = listing['content']
-    price = float(content.get('price', 0))
-    price_difference = market_price - price
-    price_difference_percentage = (price_difference / market_price * 100) if market_price > 0 else 0
-    
-    # Transform images to simple URLs with W800 size
-    # The image URLs come directly from the API, just need to add the size parameter
-    listing_images = []
-    for img in content.get('images', []):
-        if isinstance(img, str):  # Make sure we have a string URL
-            listing_images.append({
-                "image_url": img + "?pictureSize=W800" if "?" not in img else img
-            })
-    
-    return {
-        "id": content['id'],
-        "url": f"https://es.wallapop.com/item/{content['web_slug']}",
-        "year": int(content.get('year', 0)),
-        "price": price,
-        "title": content.get('title', ''),
-        "distance": float(content.get('distance', 0)),
-        "location": f"{content['location']['city']}, {content['location']['postal_code']}",
-        "fuel_type": content.get('engine', ''),
-        "horsepower": float(content.get('horsepower', 0)),
-        "kilometers": int(content.get('km', 0)),
-        "price_text": format_price_text(price),
-        "market_price": market_price,
-        "transmission": content.get('gearbox', ''),
-        "listing_images": listing_images,
-        "price_difference": round(price_difference, 2),
-        "market_price_text": format_price_text(market_price),
-        "price_difference_percentage": f"{abs(price_difference_percentage):.1f}%"
-    }
+    record = ListingRecord.from_content(content, int(content.get('km', 0)), market_price)
+    return record.to_dict(API_FIELDS)
 
 def calculate_market_data(listings, result):
     """Calculate market data with proper formatting"""
@@ -371,77 +352,92 @@ def calculate_market_data(listings, result):
     }
 
 @app.get("/api/process-alerts")
-async def process_alerts_endpoint():
-    """Process all alerts and run searches for those that haven't been run in 23 hours"""
+def process_alerts_endpoint(mode: Optional[str] = None, time_budget: Optional[float] = None):
+    """
+    Process the alerts that are due and schedule their next run.
+    mode=search runs one search per group of alerts; mode=reverse crawls the
+    newest listings once and matches them against the due alerts.
+    Search mode stops starting new searches after time_budget seconds and
+    reports its progress; call again while more_due is true.
+    """
     try:
         supabase = init_supabase()
-        return process_alerts(supabase)
+        if (mode or ALERT_MATCH_MODE) == "reverse":
+            return process_alerts_reverse(supabase)
+        return process_alerts(supabase, time_budget=time_budget)
             
     except Exception as e:
         logger.error(f"Error in process_alerts: {str(e)}")
         return {"error": str(e)}
 
-def cleanup_old_modo_rapido_data(supabase: Client):
-    """Clean up old modo rapido data, keeping only the last 24 hours"""
+@app.on_event("startup")
+def start_alert_loop():
+    """Process alerts continuously in a background thread when ALERT_BACKGROUND_LOOP is enabled"""
+    if not ALERT_BACKGROUND_LOOP:
+        return
+    process = process_alerts_reverse if ALERT_MATCH_MODE == "reverse" else process_alerts
+    threading.Thread(target=run_alert_loop, args=(init_supabase, process), name='alert-loop', daemon=True).start()
+    logger.info("Started background alert loop")
+
+@app.on_event("shutdown")
+def flush_emails():
+    """Deliver the queued alert emails before the process exits; the mailer thread is a daemon"""
+    mailer.shutdown_mailer()
+
+@app.get("/api/price-drops")
+async def price_drops_endpoint(hours: float = 24, min_drop: float = 0):
+    """List listings whose price dropped within the last `hours`"""
     try:
-        # Calculate the cutoff time (24 hours ago)
-        cutoff_time = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
-        
-        # First delete old listings as they reference runs
-        logger.info(f"Deleting modo_rapido_listings older than {cutoff_time}")
-        supabase.table('modo_rapido_listings')\
-            .delete()\
-            .lt('created_at', cutoff_time)\
-            .execute()
-            
-        # Then delete old runs as they reference market data
-        logger.info(f"Deleting modo_rapido_runs older than {cutoff_time}")
-        supabase.table('modo_rapido_runs')\
-            .delete()\
-            .lt('created_at', cutoff_time)\
-            .execute()
-            
-        # Finally delete old market data
-        logger.info(f"Deleting market_data older than {cutoff_time}")
-        supabase.table('market_data')\
-            .delete()\
-            .lt('created_at', cutoff_time)\
-            .execute()
+        supabase = init_supabase()
+        drops = price_history.get_price_drops(supabase, hours=hours, min_drop=min_drop)
+        return {"hours": hours, "total_drops": len(drops), "drops": drops}
             
-        logger.info("Successfully cleaned up old modo rapido data")
-        
     except Exception as e:
-        logger.error(f"Error cleaning up old modo rapido data: {str(e)}", exc_info=True)
+        logger.error(f"Error in price_drops: {str(e)}")
+        return {"error": str(e)}
 
-def run_modo_rapido():
+def run_modo_rapido(force: bool = False):
     """Background task to run modo rapido processing"""
     try:
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_KEY")
-        
-        if not supabase_url or not supabase_key:
-            logger.error("Missing Supabase credentials in environment variables")
-            return
+        if memory_supabase.use_memory_backend():
+            supabase = memory_supabase.get_client()
+        else:
+            supabase_url = os.getenv("SUPABASE_URL")
+            supabase_key = os.getenv("SUPABASE_KEY")
             
-        supabase = create_client(supabase_url, supabase_key)
+            if not supabase_url or not supabase_key:
+                logger.error("Missing Supabase credentials in environment variables")
+                return
+                
+            supabase = create_client(supabase_url, supabase_key)
         
         # First process new entries
         logger.info("Starting modo rapido processing")
-        result = process_modo_rapido_entries(supabase)
+        result = process_modo_rapido_entries(supabase, force=force)
         logger.info(f"Modo rapido processing completed: {result}")
         
         # Then clean up old data
-        logger.info("Starting cleanup of old modo rapido data")
-        cleanup_old_modo_rapido_data(supabase)
+        logger.info("Starting retention job")
+        retention.run_retention(supabase)
         
     except Exception as e:
         logger.error(f"Error in modo rapido background task: {str(e)}", exc_info=True)
 
+@app.get("/api/retention")
+def retention_endpoint(max_chunks: Optional[int] = None):
+    """Run the retention policies and report rows and time per chunk"""
+    try:
+        supabase = init_supabase()
+        return {"tables": retention.run_retention(supabase, max_chunks=max_chunks)}
+    except Exception as e:
+        logger.error(f"Error in retention: {str(e)}")
+        return {"error": str(e)}
+
 @app.get("/api/process-modo-rapido")
-async def process_modo_rapido_endpoint(background_tasks: BackgroundTasks):
-    """Process all modo_rapido entries in the background"""
+async def process_modo_rapido_endpoint(background_tasks: BackgroundTasks, force: bool = False):
+    """Process the modo_rapido entries in the background; force=true also refreshes fresh entries"""
     try:
-        background_tasks.add_task(run_modo_rapido)
+        background_tasks.add_task(run_modo_rapido, force)
         return {"message": "Modo rapido processing started in background"}
     except Exception as e:
         logger.error(f"Error starting modo rapido process: {str(e)}")
@@ -0,0 +1,84 @@
+"""
+Benchmark rendering of alert notification emails with many listings.
+
+Compares the previous per-listing f-string concatenation with the
+precompiled templates in email_templates. Example:
+
+    python bench_email_render.py --listings 500 --repeat 200
+"""
+import argparse
+import timeit
+
+import email_templates
+
+def make_listing(index):
+    return {
+        'listing_id': f"item-{index}",
+        'title': f"BMW Serie 3 320d <M Sport> & extras {index}",
+        'price': 9000.0 + index,
+        'price_text': f"{9000 + index:,.0f} €".replace(",", "."),
+        'location': 'Barcelona, 08001',
+        'year': 2016,
+        'kilometers': 120000 + index,
+        'url': f"https://es.wallapop.com/item/bmw-serie-3-{index}",
+        'listing_images': [{'image_url': f"https://cdn.wallapop.com/images/{index}/0.jpg"}] if index % 4 else []
+    }
+
+def render_concatenated(alert_info, new_listings):
+    """Previous implementation: body += f-string per listing, without escaping"""
+    body = f"""
+        <html>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+            <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin-bottom: 25px; text-align: center;">
+                <a href="https://cholloscars.com/app/alertas/{alert_info['id']}" style="color: #3498db; text-decoration: none; font-size: 16px; font-weight: bold;">
+                    👉 Visita tu panel de alertas para gestionar tus búsquedas y ver todos los anuncios 👈
+                </a>
+            </div>
+            <h2 style="color: #2c3e50; margin-bottom: 20px;">¡Nuevos anuncios encontrados para tu {alert_info['brand']} {alert_info['model']}!</h2>
+            <p style="font-size: 16px;">Hemos encontrado {len(new_listings)} nuevos anuncios que coinciden con tus criterios:</p>
+            <div>
+        """
+    for listing in new_listings:
+        title = listing['title']
+        km = f"{listing['kilometers']:,}".replace(",", ".")
+        image_url = listing['listing_images'][0]['image_url'] if listing['listing_images'] else None
+        body += f"""
+            <div style="border: 1px solid #ddd; padding: 15px; margin-bottom: 20px; border-radius: 5px; display: flex; align-items: start;">
+                <div style="flex: 1; min-width: 0; margin-right: auto; padding-right: 15px;">
+                    <h3 style="color: #2c3e50; margin: 0 0 10px 0; overflow: hidden; text-overflow: ellipsis;">{title}</h3>
+                    <p style="font-size: 18px; color: #27ae60; margin: 10px 0;"><strong>{listing['price_text']}</strong></p>
+                    <p style="margin: 5px 0;">
+                        <span style="color: #7f8c8d;">Año:</span> {listing['year']} | 
+                        <span style="color: #7f8c8d;">Kilómetros:</span> {km}
+                    </p>
+                    <p style="margin: 5px 0;"><span style="color: #7f8c8d;">Ubicación:</span> {listing['location']}</p>
+                </div>
+                {f'<div style="width: 150px; flex-shrink: 0;"><img src="{image_url}" alt="{title}" style="width: 150px; height: 150px; object-fit: cover; border-radius: 5px;"></div>' if image_url else ''}
+            </div>
+            """
+    body += """
+            </div>
+        </div>
+        </body>
+        </html>
+        """
+    return body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--listings', type=int, default=500, help='listings per email')
+    parser.add_argument('--repeat', type=int, default=200, help='emails rendered per implementation')
+    args = parser.parse_args()
+
+    alert_info = {'id': 42, 'brand': 'BMW', 'model': 'Serie 3'}
+    listings = [make_listing(index) for index in range(args.listings)]
+
+    print(f"Rendering {args.repeat} emails with {args.listings} listings each")
+    for name, render in [('Concatenation (no escaping)', render_concatenated), ('Precompiled templates', email_templates.render_alert_email)]:
+        elapsed = timeit.timeit(lambda: render(alert_info, listings), number=args.repeat)
+        size = len(render(alert_info, listings).encode('utf-8'))
+        print(f"- {name}: {elapsed / args.repeat * 1000:.2f}ms per email, {size / 1024:.0f} KiB")
+
+if __name__ == "__main__":
+    main()
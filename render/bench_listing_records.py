@@ -0,0 +1,150 @@
+"""
+Benchmark the per-listing work of a search shared by alerts and modo rapido.
+
+The previous path built a listing dict in search_wallapop_endpoint, copied it
+per alert and rebuilt it for the modo_rapido_listings rows, recomputing the
+price texts and differences. The new path builds one ListingRecord per
+listing, shares it between the alerts and serializes it once. Allocations
+are measured with tracemalloc and CPU time with timeit. Example:
+
+    python bench_listing_records.py --listings 2000 --alerts 5 --repeat 20
+"""
+import argparse
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+
+import email_templates
+from listing_record import ListingRecord, MODO_RAPIDO_FIELDS
+
+def format_price_text(price):
+    return f"{price:,.0f} €".replace(",", ".")
+
+def make_content(index):
+    """Content of a cars search result, as returned by the Wallapop API"""
+    return {
+        'id': f"item-{index}",
+        'title': f"BMW Serie 3 320d {index}",
+        'price': 9000 + index,
+        'year': 2016,
+        'km': 120000 + index,
+        'engine': 'gasoil',
+        'gearbox': 'manual',
+        'horsepower': 190,
+        'distance': 12.4,
+        'web_slug': f"bmw-serie-3-{index}",
+        'location': {'city': 'Barcelona', 'postal_code': '08001', 'latitude': 41.38, 'longitude': 2.17},
+        'images': [{'large': f"https://cdn.wallapop.com/images/{index}/{n}.jpg"} for n in range(3)]
+    }
+
+def previous_transform(content, kilometers, market_price):
+    """Previous wallapop_endpoint_search.transform_listing"""
+    price = float(content['price'])
+    price_difference = market_price - price
+    price_difference_percentage = (price_difference / market_price * 100) if market_price > 0 else 0
+    try:
+        distance_km = round(float(content.get('distance', 0)))
+    except Exception:
+        distance_km = 0
+    return {
+        'listing_id': content['id'],
+        'title': content['title'],
+        'price': price,
+        'price_text': format_price_text(price),
+        'market_price': market_price,
+        'market_price_text': format_price_text(market_price),
+        'price_difference': round(price_difference, 2),
+        'price_difference_percentage': f"{abs(price_difference_percentage):.1f}%",
+        'location': f"{content['location']['city']}, {content['location']['postal_code']}",
+        'year': int(content.get('year', 0)),
+        'kilometers': kilometers,
+        'fuel_type': content.get('engine', '').capitalize(),
+        'transmission': content.get('gearbox', '').capitalize(),
+        'url': f"https://es.wallapop.com/item/{content['web_slug']}",
+        'horsepower': float(content.get('horsepower', 0)),
+        'distance': distance_km,
+        'latitude': content['location'].get('latitude'),
+        'longitude': content['location'].get('longitude'),
+        'listing_images': [
+            {'image_url': img.get('large', img.get('original'))}
+            for img in content.get('images', [])
+            if isinstance(img, dict) and (img.get('large') or img.get('original'))
+        ]
+    }
+
+def previous_modo_rapido_rows(listings, market_data):
+    """Previous process_modo_rapido listing rows, recomputing the derived fields"""
+    rows = []
+    for listing in listings:
+        price = float(listing['price'])
+        market_price = market_data.get('median_price', 0)
+        price_difference = market_price - price
+        price_difference_percentage = (price_difference / market_price * 100) if market_price > 0 else 0
+        rows.append({
+            'listing_id': listing['listing_id'],
+            'title': listing['title'],
+            'price': price,
+            'price_text': listing['price_text'],
+            'market_price': market_price,
+            'market_price_text': format_price_text(market_price),
+            'price_difference': round(price_difference, 2),
+            'price_difference_percentage': f"{abs(price_difference_percentage):.1f}%",
+            'location': listing['location'],
+            'year': listing['year'],
+            'kilometers': listing['kilometers'],
+            'fuel_type': listing['fuel_type'],
+            'transmission': listing['transmission'],
+            'url': listing['url'],
+            'horsepower': listing['horsepower'],
+            'distance': round(float(listing.get('distance', 0))),
+            'listing_images': listing['listing_images'],
+            'created_at': datetime.now(timezone.utc).isoformat()
+        })
+    return rows
+
+def run_previous(contents, alerts, market_data):
+    listings = [previous_transform(content, content['km'], market_data['median_price']) for content in contents]
+    per_alert = [[{**listing, 'distance': 10 + alert} for listing in listings] for alert in range(alerts)]
+    email = email_templates.render_alert_email({'id': 1, 'brand': 'BMW', 'model': 'Serie 3'}, per_alert[0][:20])
+    return listings, per_alert, email, previous_modo_rapido_rows(listings, market_data)
+
+def run_records(contents, alerts, market_data):
+    listings = [ListingRecord.from_content(content, content['km'], market_data['median_price']) for content in contents]
+    per_alert = [list(listings) for alert in range(alerts)]
+    email = email_templates.render_alert_email({'id': 1, 'brand': 'BMW', 'model': 'Serie 3'}, per_alert[0][:20])
+    created_at = datetime.now(timezone.utc).isoformat()
+    rows = []
+    for listing in listings:
+        row = listing.to_dict(MODO_RAPIDO_FIELDS)
+        row['created_at'] = created_at
+        rows.append(row)
+    return listings, per_alert, email, rows
+
+def measure_allocations(run, *args):
+    """Bytes still held by the result and peak bytes while building it"""
+    tracemalloc.start()
+    result = run(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--listings', type=int, default=2000, help='listings per search')
+    parser.add_argument('--alerts', type=int, default=5, help='alerts sharing the search')
+    parser.add_argument('--repeat', type=int, default=20, help='runs timed per implementation')
+    args = parser.parse_args()
+
+    contents = [make_content(index) for index in range(args.listings)]
+    market_data = {'median_price': 12000.0, 'average_price': 12500.0}
+
+    print(f"{args.listings} listings shared by {args.alerts} alerts and modo rapido")
+    for name, run in [('Listing dicts', run_previous), ('ListingRecord', run_records)]:
+        current, peak = measure_allocations(run, contents, args.alerts, market_data)
+        elapsed = timeit.timeit(lambda: run(contents, args.alerts, market_data), number=args.repeat)
+        print(f"- {name}: {elapsed / args.repeat / args.listings * 1e6:.2f}µs CPU per listing, "
+              f"{current / args.listings:.0f} B held and {peak / args.listings:.0f} B peak per listing")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Measure email throughput against a local SMTP stand-in.
+
+The stand-in speaks just enough SMTP (EHLO, AUTH, MAIL, RCPT, DATA, NOOP,
+RSET, QUIT) for smtplib, adds a fixed delay to every reply to mimic a remote
+server and can drop the connection every N messages to exercise reconnects.
+Example:
+
+    python bench_mailer.py --emails 200 --reply-ms 20 --drop-every 50
+"""
+import argparse
+import logging
+import smtplib
+import socketserver
+import threading
+import time
+from email.mime.text import MIMEText
+
+from mailer import Mailer
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        if self.server.reply_delay:
+            time.sleep(self.server.reply_delay)
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.count('connections')
+        self.reply("220 stand-in ESMTP")
+        in_data = False
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode(errors='replace').rstrip('\r\n')
+
+            if in_data:
+                if line == '.':
+                    in_data = False
+                    delivered = self.server.count('delivered')
+                    if self.server.drop_every and delivered % self.server.drop_every == 0:
+                        # Accept the message, then drop the session without warning
+                        self.reply("250 OK")
+                        return
+                    self.reply("250 OK")
+                continue
+
+            command = line.split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.wfile.write(b"250-stand-in\r\n250-AUTH PLAIN LOGIN\r\n")
+                self.reply("250 OK")
+            elif command == 'AUTH':
+                self.server.count('logins')
+                self.reply("235 Authentication successful")
+            elif command == 'DATA':
+                in_data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                # MAIL, RCPT, NOOP, RSET
+                self.reply("250 OK")
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, reply_delay=0.0, drop_every=0):
+        super().__init__(('127.0.0.1', 0), StandInSMTPHandler)
+        self.reply_delay = reply_delay
+        self.drop_every = drop_every
+        self.counters = {'connections': 0, 'logins': 0, 'delivered': 0}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+            return self.counters[name]
+
+def make_message(index):
+    msg = MIMEText(f"<p>Listing {index}</p>", 'html')
+    msg['From'] = "Alertas de Coches <bench@example.com>"
+    msg['To'] = f"user{index}@example.com"
+    msg['Subject'] = f"Bench {index}"
+    return msg
+
+def bench_per_message(port, emails):
+    """Previous behaviour: one connection and login per email"""
+    start = time.perf_counter()
+    for index in range(emails):
+        with smtplib.SMTP('127.0.0.1', port, timeout=30) as server:
+            server.login('bench', 'bench')
+            server.send_message(make_message(index))
+    return time.perf_counter() - start
+
+def bench_mailer(port, emails, batch_size):
+    mailer = Mailer('127.0.0.1', port, username='bench', password='bench', starttls=False,
+                    batch_size=batch_size, retry_backoff=0.05)
+    start = time.perf_counter()
+    for index in range(emails):
+        mailer.enqueue(make_message(index))
+    enqueue_time = time.perf_counter() - start
+    mailer.flush()
+    elapsed = time.perf_counter() - start
+    mailer.stop()
+    return elapsed, enqueue_time, mailer.stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=200, help='emails to send per scenario')
+    parser.add_argument('--reply-ms', type=float, default=20, help='delay before every server reply')
+    parser.add_argument('--drop-every', type=int, default=0, help='drop the session after every N messages')
+    parser.add_argument('--batch-size', type=int, default=20, help='mailer batch size')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    server = StandInSMTPServer(reply_delay=args.reply_ms / 1000, drop_every=args.drop_every)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    print(f"SMTP stand-in on port {port}, {args.reply_ms:.0f}ms per reply")
+
+    try:
+        elapsed = bench_per_message(port, args.emails)
+        print(f"\nConnection per email")
+        print(f"- {args.emails} emails in {elapsed:.2f}s ({args.emails / elapsed:.1f} emails/s)")
+
+        server.counters = {'connections': 0, 'logins': 0, 'delivered': 0}
+        elapsed, enqueue_time, stats = bench_mailer(port, args.emails, args.batch_size)
+        print(f"\nPooled mailer (batch size {args.batch_size})")
+        print(f"- {stats['sent']} emails in {elapsed:.2f}s ({stats['sent'] / elapsed:.1f} emails/s)")
+        print(f"- Enqueue time: {enqueue_time * 1000:.1f}ms")
+        print(f"- Connections: {stats['connections']}, retries: {stats['retries']}, failed: {stats['failed']}")
+        print(f"- Delivered by stand-in: {server.counters['delivered']}")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
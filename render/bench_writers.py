@@ -0,0 +1,170 @@
+"""
+Benchmark the Supabase writers against the in-memory stand-in.
+
+Upstream Wallapop calls are replaced by synthetic results so only the
+database side is measured. Example:
+
+    python bench_writers.py --latency-ms 40 --models 20 --alerts 50 --entries 20
+"""
+import argparse
+import logging
+import random
+import time
+from datetime import datetime, timezone
+
+import wallapop_api_cars
+import wallapop_endpoint_search
+from listing_record import ListingRecord
+from memory_supabase import MemorySupabase
+from process_alerts import process_alerts
+from process_modo_rapido import process_modo_rapido_entries
+
+BRANDS = [('BMW', 'Serie 3'), ('Audi', 'A4'), ('Volkswagen', 'Golf'), ('Seat', 'Leon'), ('Toyota', 'Corolla')]
+
+def make_api_listing(index, brand, model):
+    """Synthetic listing in the shape returned by api.wallapop.com/api/v3/cars/search"""
+    return {
+        'content': {
+            'id': f"item-{index}",
+            'title': f"{brand} {model} {index}",
+            'storytelling': 'Coche en muy buen estado',
+            'price': random.randint(4000, 20000),
+            'currency': 'EUR',
+            'web_slug': f"{brand.lower()}-{model.lower().replace(' ', '-')}-{index}",
+            'distance': random.uniform(1, 200),
+            'location': {'postal_code': '08001', 'city': 'Barcelona', 'country_code': 'ES'},
+            'brand': brand,
+            'model': model,
+            'year': random.randint(2012, 2020),
+            'version': '',
+            'km': random.randint(20000, 190000),
+            'engine': 'gasoline',
+            'gearbox': 'manual',
+            'horsepower': 150,
+            'user': {'id': f"user-{index}", 'micro_name': 'Seller', 'image': None, 'online': False, 'kind': 'normal'},
+            'flags': {'pending': False, 'sold': False, 'reserved': False, 'banned': False},
+            'creation_date': 1700000000000,
+            'modification_date': 1700000000000 + index,
+            'images': [f"https://cdn.wallapop.com/images/{index}/{n}.jpg" for n in range(3)]
+        }
+    }
+
+def make_endpoint_result(params, listings_per_search):
+    """Synthetic search_wallapop_endpoint() result"""
+    listings = []
+    for n in range(listings_per_search):
+        price = float(random.randint(4000, 12000))
+        listings.append(ListingRecord(
+            listing_id=f"{params.get('brand')}-{params.get('model')}-{n}-{random.randint(0, 10 ** 6)}",
+            title=f"{params.get('brand')} {params.get('model')}",
+            price=price,
+            market_price=12000.0,
+            year=2016,
+            kilometers=120000,
+            horsepower=150.0,
+            distance=12,
+            latitude=41.3851,
+            longitude=2.1734,
+            city='Barcelona',
+            postal_code='08001',
+            engine='gasoline',
+            gearbox='manual',
+            web_slug=f"bench-{n}",
+            images=[{'large': 'https://cdn.wallapop.com/images/bench.jpg'}]
+        ))
+    market_data = {
+        'average_price': 12000.0, 'median_price': 12000.0, 'min_price': 4000.0, 'max_price': 20000.0,
+        'total_listings': listings_per_search, 'valid_listings': listings_per_search, 'search_url': ''
+    }
+    return {
+        'success': True, 'search_parameters': params, 'listings': listings,
+        'total_results': len(listings), 'filtered_results': len(listings),
+        'search_url': '', 'market_data': market_data, 'market_search_url': ''
+    }
+
+def report(name, client, elapsed, rows):
+    """Print throughput and round-trip counts for one scenario"""
+    print(f"\n{name}")
+    print(f"- Wall time: {elapsed:.2f}s")
+    print(f"- Rows written: {rows} ({rows / elapsed:.0f} rows/s)")
+    print(f"- Round trips: {client.total_round_trips} ({client.total_round_trips / elapsed:.0f}/s)")
+    for key, count in sorted(client.round_trips.items(), key=lambda item: -item[1]):
+        print(f"    {key}: {count}")
+
+def count_rows(client, tables):
+    return sum(len(client.tables.get(table, [])) for table in tables)
+
+def bench_crawl(latency, models, listings_per_model):
+    client = MemorySupabase(latency=latency)
+    index = 0
+    start = time.perf_counter()
+    for m in range(models):
+        brand, model = BRANDS[m % len(BRANDS)]
+        listings = []
+        for _ in range(listings_per_model):
+            listings.append(make_api_listing(index, brand, model))
+            index += 1
+        search_params = {
+            'brand': brand, 'model': model, 'min_price': 5000, 'max_price': 9000, 'market_price': 10000,
+            'min_year': '2012', 'max_year': '2020', 'price_range_min': 10000,
+            'url': 'https://api.wallapop.com/api/v3/cars/search?brand=bench'
+        }
+        search_id = wallapop_api_cars.insert_search_results(client, search_params, listings)
+        wallapop_api_cars.insert_market_price(client, search_id, {'market_price': 10000, 'sample_size': 20, 'raw_average': 11000})
+    elapsed = time.perf_counter() - start
+    rows = count_rows(client, ['car_searches', 'car_listings', 'car_images', 'car_market_price', 'listing_price_history'])
+    report(f"Crawl writer: {models} models x {listings_per_model} listings", client, elapsed, rows)
+
+def bench_alerts(latency, alerts, listings_per_search, workers):
+    client = MemorySupabase(latency=latency)
+    client.seed('users', [{'id': 1, 'email': 'bench@example.com'}])
+    client.seed('alertas', [{
+        'user_id': 1, 'brand': BRANDS[a % len(BRANDS)][0], 'model': BRANDS[a % len(BRANDS)][1],
+        'min_year': 2012, 'max_year': 2020, 'engine': 'gasoline', 'min_horse_power': 150, 'gearbox': None,
+        'latitude': 41.3851, 'longitude': 2.1734, 'distance': 200, 'max_kilometers': 200000,
+        'email_notifications': False, 'next_run_at': datetime.now(timezone.utc).isoformat()
+    } for a in range(alerts)])
+    wallapop_endpoint_search.search_wallapop_endpoint = lambda params, tile_cache=None: make_endpoint_result(params, listings_per_search)
+
+    start = time.perf_counter()
+    result = process_alerts(client, max_workers=workers)
+    elapsed = time.perf_counter() - start
+    report(f"Alert writer: {alerts} alerts, {workers} workers", client, elapsed, count_rows(client, ['market_data', 'alert_runs']))
+    timing = result.get('timing', {})
+    print(f"- Max alert latency: {timing.get('max_alert_latency_seconds', 0):.2f}s")
+
+def bench_modo_rapido(latency, entries, listings_per_search):
+    client = MemorySupabase(latency=latency)
+    client.seed('modo_rapido', [{
+        'marca': BRANDS[e % len(BRANDS)][0], 'modelo': BRANDS[e % len(BRANDS)][1],
+        'minimo': 2012, 'maximo': 2016, 'cv': 150, 'combustible': 'gasolina'
+    } for e in range(entries)])
+    wallapop_endpoint_search.search_wallapop_endpoint = lambda params, tile_cache=None: make_endpoint_result(params, listings_per_search)
+
+    start = time.perf_counter()
+    process_modo_rapido_entries(client)
+    elapsed = time.perf_counter() - start
+    rows = count_rows(client, ['market_data', 'modo_rapido_runs', 'modo_rapido_listings'])
+    report(f"Modo rapido writer: {entries} entries", client, elapsed, rows)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=40, help='simulated latency per Supabase request')
+    parser.add_argument('--models', type=int, default=20, help='crawl models to write')
+    parser.add_argument('--listings', type=int, default=40, help='listings per search')
+    parser.add_argument('--alerts', type=int, default=50, help='alerts to process')
+    parser.add_argument('--alert-workers', type=int, default=4, help='concurrent alert groups')
+    parser.add_argument('--entries', type=int, default=20, help='modo rapido entries to process')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(0)
+    latency = args.latency_ms / 1000
+
+    print(f"Simulated latency per request: {args.latency_ms:.0f}ms")
+    bench_crawl(latency, args.models, args.listings)
+    bench_alerts(latency, args.alerts, args.listings, args.alert_workers)
+    bench_modo_rapido(latency, args.entries, args.listings)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+HTML templates for the alert notification emails.
+
+Templates are compiled once at import time into %-patterns and the email is
+assembled with a single join; every value coming from a listing or an alert
+is escaped before it is substituted.
+"""
+import html
+import string
+from functools import lru_cache
+from typing import Dict, List, Any
+
+__all__ = ['render_alert_email', 'render_digest_email', 'render_listing']
+
+# Inline styles are kept for email client compatibility
+DOCUMENT_HEAD = (
+    '<html>'
+    '<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">'
+    '<div style="max-width: 600px; margin: 0 auto; padding: 20px;">'
+)
+
+DOCUMENT_FOOTER = '</div></div></body></html>'
+
+ALERT_HEADER_TEMPLATE = (
+    '<div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin-bottom: 25px; text-align: center;">'
+    '<a href="https://cholloscars.com/app/alertas/{alert_id}" style="color: #3498db; text-decoration: none; font-size: 16px; font-weight: bold;">'
+    '👉 Visita tu panel de alertas para gestionar tus búsquedas y ver todos los anuncios 👈'
+    '</a>'
+    '</div>'
+    '<h2 style="color: #2c3e50; margin-bottom: 20px;">¡Nuevos anuncios encontrados para tu {brand} {model}!</h2>'
+)
+
+COUNT_TEMPLATE = (
+    '<p style="font-size: 16px;">Hemos encontrado {count} nuevos anuncios que coinciden con tus criterios:</p>'
+    '<div>'
+)
+
+LISTING_TEMPLATE = (
+    '<div style="border: 1px solid #ddd; padding: 15px; margin-bottom: 20px; border-radius: 5px; display: flex; align-items: start;">'
+    '<div style="flex: 1; min-width: 0; margin-right: auto; padding-right: 15px;">'
+    '<h3 style="color: #2c3e50; margin: 0 0 10px 0; overflow: hidden; text-overflow: ellipsis;">{title}</h3>'
+    '<p style="font-size: 18px; color: #27ae60; margin: 10px 0;"><strong>{price_text}</strong></p>'
+    '<p style="margin: 5px 0;">'
+    '<span style="color: #7f8c8d;">Año:</span> {year} | '
+    '<span style="color: #7f8c8d;">Kilómetros:</span> {km}'
+    '</p>'
+    '<p style="margin: 5px 0;"><span style="color: #7f8c8d;">Ubicación:</span> {location}</p>'
+    '</div>'
+    '{image}'
+    '</div>'
+)
+
+DIGEST_HEADER = (
+    '<div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin-bottom: 25px; text-align: center;">'
+    '<a href="https://cholloscars.com/app/alertas" style="color: #3498db; text-decoration: none; font-size: 16px; font-weight: bold;">'
+    '👉 Visita tu panel de alertas para gestionar tus búsquedas y ver todos los anuncios 👈'
+    '</a>'
+    '</div>'
+    '<h2 style="color: #2c3e50; margin-bottom: 20px;">¡Nuevos anuncios encontrados para tus alertas!</h2>'
+)
+
+DIGEST_SECTION_TEMPLATE = (
+    '<h3 style="color: #2c3e50; margin: 25px 0 10px 0;">'
+    '<a href="https://cholloscars.com/app/alertas/{alert_id}" style="color: #2c3e50;">{brand} {model}</a>'
+    ' · {count} nuevos anuncios'
+    '</h3>'
+)
+
+DIGEST_FOOTER = '</div></body></html>'
+
+IMAGE_TEMPLATE = (
+    '<div style="width: 150px; flex-shrink: 0;">'
+    '<img src="{image_url}" alt="{title}" style="width: 150px; height: 150px; object-fit: cover; border-radius: 5px;">'
+    '</div>'
+)
+
+class CompiledTemplate:
+    """Format string compiled once into a positional %-pattern"""
+
+    def __init__(self, template: str):
+        pattern = []
+        self.fields = []
+        for literal, field, _, _ in string.Formatter().parse(template):
+            pattern.append(literal.replace('%', '%%'))
+            if field is not None:
+                pattern.append('%s')
+                self.fields.append(field)
+        self.pattern = ''.join(pattern)
+
+    def render(self, **values: str) -> str:
+        """Substitute already escaped values"""
+        return self.pattern % tuple([values[field] for field in self.fields])
+
+ALERT_HEADER = CompiledTemplate(ALERT_HEADER_TEMPLATE)
+COUNT = CompiledTemplate(COUNT_TEMPLATE)
+LISTING = CompiledTemplate(LISTING_TEMPLATE)
+IMAGE = CompiledTemplate(IMAGE_TEMPLATE)
+DIGEST_SECTION = CompiledTemplate(DIGEST_SECTION_TEMPLATE)
+
+def escape(value: Any) -> str:
+    """Escape a value for use in element text or a quoted attribute"""
+    if value is None:
+        return ''
+    return html.escape(value if isinstance(value, str) else str(value), quote=True)
+
+def format_kilometers(kilometers: Any) -> str:
+    """Format kilometers with dots as thousands separator"""
+    try:
+        return f"{int(kilometers):,}".replace(",", ".")
+    except (ValueError, TypeError):
+        return escape(kilometers)
+
+@lru_cache(maxsize=1024)
+def alert_header(alert_id: Any, brand: str, model: str) -> str:
+    """Header fragment of an alert, cached because it only depends on the alert"""
+    return ALERT_HEADER.render(alert_id=escape(alert_id), brand=escape(brand), model=escape(model))
+
+def render_listing(listing: Dict[str, Any]) -> str:
+    """HTML fragment for a single listing"""
+    title = escape(listing['title'])
+    images = listing.get('listing_images')
+    image_url = images[0]['image_url'] if images else None
+
+    return LISTING.render(
+        title=title,
+        price_text=escape(listing['price_text']),
+        year=str(listing['year']),
+        km=format_kilometers(listing['kilometers']),
+        location=escape(listing['location']),
+        image=IMAGE.render(image_url=escape(image_url), title=title) if image_url else ''
+    )
+
+def render_alert_email(alert_info: Dict[str, Any], listings: List[Dict[str, Any]]) -> str:
+    """Full HTML body of the notification for one alert"""
+    parts = [
+        DOCUMENT_HEAD,
+        alert_header(alert_info['id'], alert_info['brand'], alert_info['model']),
+        COUNT.render(count=str(len(listings)))
+    ]
+    parts.extend(map(render_listing, listings))
+    parts.append(DOCUMENT_FOOTER)
+    return ''.join(parts)
+
+def render_digest_email(sections: List[Dict[str, Any]]) -> str:
+    """Full HTML body of a digest; each section holds an alert_info and its listings"""
+    parts = [DOCUMENT_HEAD, DIGEST_HEADER]
+    for section in sections:
+        alert_info = section['alert_info']
+        parts.append(DIGEST_SECTION.render(
+            alert_id=escape(alert_info['id']),
+            brand=escape(alert_info['brand']),
+            model=escape(alert_info['model']),
+            count=str(len(section['listings']))
+        ))
+        parts.extend(map(render_listing, section['listings']))
+    parts.append(DIGEST_FOOTER)
+    return ''.join(parts)
@@ -0,0 +1,243 @@
+"""
+Geo-tiling of upstream searches.
+
+A search center and radius are mapped onto a fixed grid of tiles. Every tile
+is fetched once per cycle for a given query, from the tile center with a
+radius covering the whole tile, and the listings are then filtered by their
+distance to each search's own center. Searches from nearby locations with
+the same query (modo rapido, alerts) share the tile fetches instead of each
+running their own.
+
+The price bounds of a search come from the market price at its own center, so
+they are left out of the query key: a tile is fetched with the widest bounds
+of the searches sharing it, and each search filters the price locally, like
+the distance.
+
+Tiling replaces one search by several tile fetches, each returning a single
+page, so it only pays off when the fetches are shared. It is off by default
+(GEO_TILING), and plan_cache only tiles the queries searched from at least
+GEO_TILE_MIN_CENTERS different centers in the cycle whose tiles are fewer
+than those searches; every other search keeps its single direct request.
+
+The tile size depends on the search radius: it is the largest size in
+TILE_SIZES_DEGREES whose fetch radius stays within GEO_TILE_MAX_RADIUS_FACTOR
+times the search radius, so no tile fetch is wider than the search it serves.
+"""
+import logging
+import math
+import os
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Any, Callable, Optional, NamedTuple
+from urllib.parse import quote
+
+import requests
+
+__all__ = ['Tile', 'TileCache', 'covering_tiles', 'plan_cache', 'search_tiles', 'tile_for', 'tile_size']
+
+logger = logging.getLogger(__name__)
+
+CARS_SEARCH_URL = "https://api.wallapop.com/api/v3/cars/search"
+
+# Parameters filtered per search instead of being part of the shared query
+LOCATION_PARAMS = ('latitude', 'longitude', 'distance')
+PRICE_PARAMS = ('min_sale_price', 'max_sale_price')
+
+# Share tile fetches between the searches of a cycle (modo rapido, alerts)
+GEO_TILING = os.getenv("GEO_TILING", "false").lower() == "true"
+
+# Distinct search centers a query needs in a cycle before it is tiled
+MIN_SHARED_CENTERS = int(os.getenv("GEO_TILE_MIN_CENTERS", "2"))
+
+# Largest tile fetch radius, relative to the radius of the search
+MAX_RADIUS_FACTOR = float(os.getenv("GEO_TILE_MAX_RADIUS_FACTOR", "1.0"))
+
+# Tile sizes in degrees, one grid per size
+TILE_SIZES_DEGREES = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0)
+
+KM_PER_DEGREE = 111.32
+EARTH_RADIUS_KM = 6371.0
+
+class Tile(NamedTuple):
+    size: float
+    row: int
+    col: int
+
+    @property
+    def center(self) -> tuple:
+        return round((self.row + 0.5) * self.size, 4), round((self.col + 0.5) * self.size, 4)
+
+    @property
+    def radius_km(self) -> int:
+        """Radius of the fetch covering the whole tile, from its center to its farthest corner"""
+        latitude, longitude = self.center
+        # The corner nearest the equator is the farthest, meridians converge towards the poles
+        corner_latitude = self.row * self.size if latitude >= 0 else (self.row + 1) * self.size
+        return math.ceil(haversine_km(latitude, longitude, corner_latitude, (self.col + 1) * self.size))
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in km"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (float(lat1), float(lon1), float(lat2), float(lon2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def tile_size(latitude: float, radius_km: float) -> float:
+    """Largest tile size whose fetch radius stays within the search radius at this latitude"""
+    max_radius_km = radius_km * MAX_RADIUS_FACTOR
+    fitting = [size for size in TILE_SIZES_DEGREES if tile_for(latitude, 0, size).radius_km <= max_radius_km]
+    return fitting[-1] if fitting else TILE_SIZES_DEGREES[0]
+
+def tile_for(latitude: float, longitude: float, size: float) -> Tile:
+    """Tile of the given size containing a point"""
+    return Tile(size, math.floor(float(latitude) / size), math.floor(float(longitude) / size))
+
+def covering_tiles(latitude: float, longitude: float, radius_km: float) -> List[Tile]:
+    """Tiles intersecting the circle of radius_km around a point"""
+    latitude, longitude = float(latitude), float(longitude)
+    size = tile_size(latitude, radius_km)
+    lat_delta = radius_km / KM_PER_DEGREE
+    lng_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+
+    tiles = []
+    for row in range(math.floor((latitude - lat_delta) / size), math.floor((latitude + lat_delta) / size) + 1):
+        for col in range(math.floor((longitude - lng_delta) / size), math.floor((longitude + lng_delta) / size) + 1):
+            # Closest point of the tile to the center
+            nearest_latitude = min(max(latitude, row * size), (row + 1) * size)
+            nearest_longitude = min(max(longitude, col * size), (col + 1) * size)
+            if haversine_km(latitude, longitude, nearest_latitude, nearest_longitude) <= radius_km:
+                tiles.append(Tile(size, row, col))
+    return tiles
+
+def fetch_search_objects(params: Dict[str, str]) -> List[Dict[str, Any]]:
+    """One page of the cars search for the given query parameters"""
+    url = f"{CARS_SEARCH_URL}?{'&'.join(f'{k}={quote(str(v))}' for k, v in params.items())}"
+    logger.info(f"Tile search URL: {url}")
+    response = requests.get(url)
+    response.raise_for_status()
+    return response.json().get('search_objects', [])
+
+def query_key(query: Dict[str, str]) -> tuple:
+    """Key of an upstream query, without its center, radius and price bounds"""
+    return tuple(sorted((k, str(v)) for k, v in query.items() if k not in LOCATION_PARAMS + PRICE_PARAMS))
+
+def price_bounds(query: Dict[str, str]) -> tuple:
+    """(min, max) sale price of a query, None where unbounded"""
+    return tuple(float(query[k]) if query.get(k) not in (None, '') else None for k in PRICE_PARAMS)
+
+def widest_bounds(bounds: List[tuple]) -> tuple:
+    """Price bounds covering every one of the given bounds"""
+    lows = [low for low, _ in bounds]
+    highs = [high for _, high in bounds]
+    return (None if None in lows else min(lows)), (None if None in highs else max(highs))
+
+class TileCache:
+    """
+    Tile fetches of one cycle, keyed by query and tile. Concurrent searches
+    needing the same tile wait for the fetch already in flight. Only the
+    (query, tile size) pairs in shared are served from tiles, fetched with
+    the price bounds shared maps them to.
+    """
+
+    def __init__(self, shared: Optional[Dict[tuple, tuple]] = None):
+        self.shared = shared or {}
+        self._fetches = {}
+        self._lock = threading.Lock()
+        self.stats = {'fetches': 0, 'hits': 0, 'tiled_queries': len(self.shared)}
+
+    def shares(self, query: Dict[str, str], latitude: float, radius_km: float) -> bool:
+        """Whether a search is served from tiles"""
+        return (query_key(query), tile_size(latitude, radius_km)) in self.shared
+
+    def fetch_bounds(self, query: Dict[str, str], latitude: float, radius_km: float) -> tuple:
+        """Price bounds the tiles of a search are fetched with"""
+        return self.shared.get((query_key(query), tile_size(latitude, radius_km)), price_bounds(query))
+
+    def get(self, key: tuple, fetch: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        with self._lock:
+            future = self._fetches.get(key)
+            owner = future is None
+            if owner:
+                future = self._fetches[key] = Future()
+                self.stats['fetches'] += 1
+            else:
+                self.stats['hits'] += 1
+
+        if owner:
+            try:
+                future.set_result(fetch())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+def plan_cache(searches: List[tuple]) -> Optional[TileCache]:
+    """
+    Tile cache for the (query, latitude, longitude, radius_km) searches of a
+    cycle, tiling the queries searched from several centers when that takes
+    fewer upstream calls. None when geo-tiling is disabled or no query is shared.
+    """
+    if not GEO_TILING:
+        return None
+
+    centers = {}
+    tiles = {}
+    bounds = {}
+    for query, latitude, longitude, radius_km in searches:
+        key = (query_key(query), tile_size(latitude, radius_km))
+        centers.setdefault(key, set()).add((round(float(latitude), 4), round(float(longitude), 4)))
+        tiles.setdefault(key, set()).update(covering_tiles(latitude, longitude, radius_km))
+        bounds.setdefault(key, []).append(price_bounds(query))
+
+    # Tiled only if the tile fetches are fewer than the direct searches they replace
+    shared = {
+        key: widest_bounds(bounds[key]) for key, points in centers.items()
+        if len(points) >= MIN_SHARED_CENTERS and len(tiles[key]) < len(points)
+    }
+    logger.info(f"Geo-tiling {len(shared)} of {len(centers)} queries shared by {MIN_SHARED_CENTERS}+ centers")
+    return TileCache(shared) if shared else None
+
+def search_tiles(query: Dict[str, str], latitude: float, longitude: float, radius_km: float,
+                 cache: TileCache, fetch: Optional[Callable[[Dict[str, str]], List[Dict[str, Any]]]] = None
+                 ) -> List[Dict[str, Any]]:
+    """
+    Search objects within radius_km of a point and the price bounds of query,
+    fetched tile by tile. Each returned content carries its distance to the
+    point in km.
+    """
+    fetch = fetch or fetch_search_objects
+    key = query_key(query)
+    min_price, max_price = price_bounds(query)
+    fetch_bounds = cache.fetch_bounds(query, latitude, radius_km)
+    query = {k: v for k, v in query.items() if k not in LOCATION_PARAMS + PRICE_PARAMS}
+    for param, bound in zip(PRICE_PARAMS, fetch_bounds):
+        if bound is not None:
+            query[param] = str(int(bound))
+
+    found = {}
+    for tile in covering_tiles(latitude, longitude, radius_km):
+        tile_latitude, tile_longitude = tile.center
+        params = {
+            **query,
+            'latitude': format(tile_latitude, '.4f'),
+            'longitude': format(tile_longitude, '.4f'),
+            'distance': str(tile.radius_km * 1000)  # Convert km to meters
+        }
+        for item in cache.get((key, tile), lambda: fetch(params)):
+            content = item['content']
+            if content['id'] in found:
+                continue
+            price = float(content.get('price') or 0)
+            if (min_price is not None and price < min_price) or (max_price is not None and price > max_price):
+                continue
+            location = content.get('location') or {}
+            if location.get('latitude') is None or location.get('longitude') is None:
+                found[content['id']] = item
+                continue
+            distance = haversine_km(latitude, longitude, location['latitude'], location['longitude'])
+            if distance <= radius_km:
+                # Copied so the cached tile results stay independent of this search's center
+                found[content['id']] = {**item, 'content': {**content, 'distance': round(distance, 1)}}
+
+    results = list(found.values())
+    if query.get('order_by', 'price_low_to_high') == 'price_low_to_high':
+        results.sort(key=lambda item: float(item['content'].get('price', 0)))
+    return results
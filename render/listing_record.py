@@ -0,0 +1,176 @@
+"""
+Compact record for a Wallapop car listing.
+
+A listing is transformed once per request into a ListingRecord: the raw
+fields are kept in __slots__ and the derived ones (price texts, price
+difference, location, URL, images) are only computed when first read.
+to_dict() is the single serializer, with field lists for the listing schema,
+the modo_rapido_listings rows and the /api responses. Records also support
+record['field'] and record.get('field') for code written against the
+previous listing dicts.
+"""
+from typing import Dict, Any, List, Optional
+
+__all__ = ['ListingRecord', 'LISTING_FIELDS', 'MODO_RAPIDO_FIELDS', 'API_FIELDS', 'format_price_text']
+
+# Serializer field lists are (key, field) pairs
+
+# Fields of the listing dicts returned by search_wallapop_endpoint
+LISTING_FIELDS = tuple((field, field) for field in (
+    'listing_id', 'title', 'price', 'price_text', 'market_price', 'market_price_text',
+    'price_difference', 'price_difference_percentage', 'location', 'year', 'kilometers',
+    'fuel_type', 'transmission', 'url', 'horsepower', 'distance', 'latitude', 'longitude',
+    'listing_images'
+))
+
+# Columns of modo_rapido_listings filled from a listing
+MODO_RAPIDO_FIELDS = tuple(pair for pair in LISTING_FIELDS if pair[0] not in ('latitude', 'longitude'))
+
+# (key, field) pairs of the listings in /api responses
+API_FIELDS = (
+    ('id', 'listing_id'), ('url', 'url'), ('year', 'year'), ('price', 'price'), ('title', 'title'),
+    ('distance', 'distance'), ('location', 'location'), ('fuel_type', 'fuel_type'),
+    ('horsepower', 'horsepower'), ('kilometers', 'kilometers'), ('price_text', 'price_text'),
+    ('market_price', 'market_price'), ('transmission', 'transmission'), ('listing_images', 'listing_images'),
+    ('price_difference', 'price_difference'), ('market_price_text', 'market_price_text'),
+    ('price_difference_percentage', 'price_difference_percentage')
+)
+
+def format_price_text(price: float) -> str:
+    """Format price as text with euro symbol"""
+    return f"{price:,.0f} €".replace(",", ".")
+
+def image_urls(images: List[Any]) -> List[Dict[str, str]]:
+    """listing_images entries from the image dicts or URL strings of the API"""
+    listing_images = []
+    for img in images:
+        if isinstance(img, dict):
+            url = img.get('large') or img.get('original')
+            if url:
+                listing_images.append({'image_url': url})
+        elif isinstance(img, str):
+            listing_images.append({'image_url': img + "?pictureSize=W800" if "?" not in img else img})
+    return listing_images
+
+class ListingRecord:
+    __slots__ = (
+        'listing_id', 'title', 'price', 'market_price', 'year', 'kilometers', 'horsepower',
+        'distance', 'latitude', 'longitude', '_city', '_postal_code', '_engine', '_gearbox',
+        '_web_slug', '_images', '_price_text', '_market_price_text', '_listing_images'
+    )
+
+    def __init__(self, listing_id: Any, title: str, price: float, market_price: float, year: int,
+                 kilometers: int, horsepower: float, distance: int, latitude: Optional[float],
+                 longitude: Optional[float], city: Any, postal_code: Any, engine: str, gearbox: str,
+                 web_slug: str, images: List[Any]):
+        self.listing_id = listing_id
+        self.title = title
+        self.price = price
+        self.market_price = market_price
+        self.year = year
+        self.kilometers = kilometers
+        self.horsepower = horsepower
+        self.distance = distance
+        self.latitude = latitude
+        self.longitude = longitude
+        self._city = city
+        self._postal_code = postal_code
+        self._engine = engine
+        self._gearbox = gearbox
+        self._web_slug = web_slug
+        self._images = images
+        self._price_text = None
+        self._market_price_text = None
+        self._listing_images = None
+
+    @classmethod
+    def from_content(cls, content: Dict[str, Any], kilometers: int, market_price: float) -> 'ListingRecord':
+        """Record for the content of a Wallapop API search result"""
+        try:
+            distance = round(float(content.get('distance', 0)))
+        except (ValueError, TypeError):
+            distance = 0
+        location = content['location']
+        return cls(
+            listing_id=content['id'],
+            title=content.get('title', ''),
+            price=float(content.get('price', 0)),
+            market_price=market_price,
+            year=int(content.get('year', 0)),
+            kilometers=kilometers,
+            horsepower=float(content.get('horsepower', 0)),
+            distance=distance,
+            latitude=location.get('latitude'),
+            longitude=location.get('longitude'),
+            city=location['city'],
+            postal_code=location['postal_code'],
+            engine=content.get('engine', ''),
+            gearbox=content.get('gearbox', ''),
+            web_slug=content['web_slug'],
+            images=content.get('images', [])
+        )
+
+    # Derived fields
+
+    @property
+    def price_text(self) -> str:
+        if self._price_text is None:
+            self._price_text = format_price_text(self.price)
+        return self._price_text
+
+    @property
+    def market_price_text(self) -> str:
+        if self._market_price_text is None:
+            self._market_price_text = format_price_text(self.market_price)
+        return self._market_price_text
+
+    @property
+    def price_difference(self) -> float:
+        return round(self.market_price - self.price, 2)
+
+    @property
+    def price_difference_percentage(self) -> str:
+        percentage = ((self.market_price - self.price) / self.market_price * 100) if self.market_price > 0 else 0
+        return f"{abs(percentage):.1f}%"
+
+    @property
+    def location(self) -> str:
+        return f"{self._city}, {self._postal_code}"
+
+    @property
+    def url(self) -> str:
+        return f"https://es.wallapop.com/item/{self._web_slug}"
+
+    @property
+    def fuel_type(self) -> str:
+        return (self._engine or '').capitalize()
+
+    @property
+    def transmission(self) -> str:
+        return (self._gearbox or '').capitalize()
+
+    @property
+    def listing_images(self) -> List[Dict[str, str]]:
+        if self._listing_images is None:
+            self._listing_images = image_urls(self._images)
+        return self._listing_images
+
+    # Serialization
+
+    def to_dict(self, fields=LISTING_FIELDS) -> Dict[str, Any]:
+        """Serialize the record with one of the (key, field) lists above"""
+        return {key: getattr(self, field) for key, field in fields}
+
+    # Read access like the previous listing dicts
+
+    def __getitem__(self, field: str) -> Any:
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def get(self, field: str, default: Any = None) -> Any:
+        return getattr(self, field, default)
+
+    def __repr__(self) -> str:
+        return f"ListingRecord({self.listing_id!r}, {self.title!r}, {self.price_text!r})"
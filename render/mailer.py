@@ -0,0 +1,225 @@
+"""
+Background SMTP sender.
+
+Messages are queued by the alert processing and delivered by a single worker
+thread that keeps one authenticated SMTP session open, reconnecting and
+retrying with exponential backoff when the server drops it.
+"""
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.message import Message
+from typing import Optional
+
+__all__ = ['Mailer', 'get_mailer', 'shutdown_mailer', 'smtp_configured']
+
+logger = logging.getLogger(__name__)
+
+# Batches are drained from the queue and sent on one session, probed with NOOP first
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 1.0
+
+# Idle sessions are closed before the server times them out
+DEFAULT_IDLE_SECONDS = 60.0
+
+# Seconds the queued emails get to go out when the process shuts down
+SHUTDOWN_TIMEOUT = float(os.getenv("SMTP_SHUTDOWN_TIMEOUT", "30"))
+
+_mailer = None
+_mailer_lock = threading.Lock()
+
+def smtp_configured() -> bool:
+    """Check whether SMTP credentials are available"""
+    return bool(os.getenv("SMTP_USERNAME") and os.getenv("SMTP_PASSWORD"))
+
+class Mailer:
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 starttls: bool = True, timeout: float = 30, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_retries: int = DEFAULT_MAX_RETRIES, retry_backoff: float = DEFAULT_RETRY_BACKOFF,
+                 idle_seconds: float = DEFAULT_IDLE_SECONDS):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.idle_seconds = idle_seconds
+
+        self.stats = {'queued': 0, 'sent': 0, 'failed': 0, 'retries': 0, 'connections': 0}
+
+        self._queue = queue.Queue()
+        self._server = None
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, message: Message):
+        """Queue a message for delivery and return immediately"""
+        self._ensure_worker()
+        with self._lock:
+            self.stats['queued'] += 1
+        self._queue.put(message)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued message has been delivered or given up on"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stop(self, timeout: Optional[float] = None):
+        """Deliver what is queued, then stop the worker and close the session"""
+        if self._worker is None:
+            return
+        self._queue.put(None)
+        self._worker.join(timeout)
+        self._worker = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='mailer', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                message = self._queue.get(timeout=self.idle_seconds)
+            except queue.Empty:
+                self._disconnect()
+                continue
+
+            if message is None:
+                self._queue.task_done()
+                self._disconnect()
+                return
+
+            # Drain what is already waiting, up to one batch
+            batch = [message]
+            stop_requested = False
+            while len(batch) < self.batch_size:
+                try:
+                    next_message = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_message is None:
+                    stop_requested = True
+                    break
+                batch.append(next_message)
+
+            self._send_batch(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+            if stop_requested:
+                self._queue.task_done()
+                self._disconnect()
+                return
+
+    def _send_batch(self, batch):
+        self._check_session()
+        for message in batch:
+            self._send_with_retry(message)
+
+    def _send_with_retry(self, message: Message):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self._server is None:
+                    self._connect()
+                self._server.send_message(message)
+                with self._lock:
+                    self.stats['sent'] += 1
+                logger.info(f"Email notification sent successfully to {message['To']}")
+                return True
+            except (smtplib.SMTPException, OSError) as e:
+                self._disconnect()
+                if attempt == self.max_retries:
+                    break
+                delay = self.retry_backoff * (2 ** attempt)
+                with self._lock:
+                    self.stats['retries'] += 1
+                logger.warning(f"SMTP error sending email to {message['To']}: {str(e)}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+        with self._lock:
+            self.stats['failed'] += 1
+        logger.error(f"Giving up on email to {message['To']} after {self.max_retries + 1} attempts")
+        return False
+
+    def _check_session(self):
+        """Drop the session if the server closed it while we were idle"""
+        if self._server is None:
+            return
+        try:
+            code, _ = self._server.noop()
+            if code != 250:
+                self._disconnect()
+        except (smtplib.SMTPException, OSError):
+            self._disconnect()
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        with self._lock:
+            self.stats['connections'] += 1
+        logger.info(f"Opened SMTP session with {self.host}:{self.port}")
+
+    def _disconnect(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+def get_mailer() -> Mailer:
+    """Shared mailer configured from the SMTP_* environment variables"""
+    global _mailer
+
+    with _mailer_lock:
+        if _mailer is None:
+            _mailer = Mailer(
+                host=os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+                port=int(os.getenv("SMTP_PORT", "587")),
+                username=os.getenv("SMTP_USERNAME"),
+                password=os.getenv("SMTP_PASSWORD"),
+                starttls=os.getenv("SMTP_STARTTLS", "true").lower() != "false",
+                timeout=float(os.getenv("SMTP_TIMEOUT", "30")),
+                batch_size=int(os.getenv("SMTP_BATCH_SIZE", str(DEFAULT_BATCH_SIZE))),
+                max_retries=int(os.getenv("SMTP_MAX_RETRIES", str(DEFAULT_MAX_RETRIES))),
+                retry_backoff=float(os.getenv("SMTP_RETRY_BACKOFF", str(DEFAULT_RETRY_BACKOFF))),
+                idle_seconds=float(os.getenv("SMTP_IDLE_SECONDS", str(DEFAULT_IDLE_SECONDS)))
+            )
+        return _mailer
+
+def shutdown_mailer(timeout: Optional[float] = None) -> bool:
+    """Deliver the queued emails of the shared mailer, if any, and stop its worker"""
+    if timeout is None:
+        timeout = SHUTDOWN_TIMEOUT
+    with _mailer_lock:
+        mailer = _mailer
+    if mailer is None:
+        return True
+
+    delivered = mailer.flush(timeout)
+    if not delivered:
+        logger.error(f"{mailer._queue.unfinished_tasks} queued emails still undelivered after {timeout}s")
+    mailer.stop(timeout=0 if not delivered else None)
+    return delivered
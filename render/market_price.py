@@ -0,0 +1,263 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+from supabase import create_client, Client
+
+import memory_supabase
+import wallapop_endpoint_search
+
+__all__ = ['get_market_price', 'build_market_search_params', 'market_query_key']
+
+logger = logging.getLogger(__name__)
+
+CARS_SEARCH_URL = "https://api.wallapop.com/api/v3/cars/search"
+HISTORY_TABLE = 'market_price_history'
+
+# Only the cheapest listings are used to estimate the market price
+SAMPLE_SIZE = 20
+
+# Estimates younger than this are served from the history table instead of re-fetched
+MAX_AGE_HOURS = float(os.getenv("MARKET_PRICE_MAX_AGE_HOURS", "6"))
+
+_history_client = None
+
+# query_key -> (computed_at, market_data) for estimates already seen by this process
+_recent_estimates = {}
+_recent_lock = threading.Lock()
+
+def get_history_client() -> Optional[Client]:
+    """Lazily create the Supabase client used for the price history, if configured"""
+    global _history_client
+
+    if _history_client is None:
+        if memory_supabase.use_memory_backend():
+            _history_client = memory_supabase.get_client()
+            return _history_client
+
+        supabase_url = os.getenv("SUPABASE_URL")
+        supabase_key = os.getenv("SUPABASE_KEY")
+        if not supabase_url or not supabase_key:
+            logger.warning("Missing Supabase credentials, market price history disabled")
+            return None
+        _history_client = create_client(supabase_url, supabase_key)
+
+    return _history_client
+
+def build_market_search_params(params: Dict[str, Any]) -> Dict[str, str]:
+    """Build the upstream query used for market analysis"""
+    max_km = params.get('max_kilometers')
+    min_km = params.get('min_kilometers')
+
+    search_params = {
+        'category_ids': '100',
+        'distance': str(int(params.get('distance', 200)) * 1000),  # Convert km to meters
+        'min_sale_price': '3000',
+        'order_by': 'price_low_to_high'
+    }
+
+    if max_km is not None:
+        # Add a slightly higher max_km for market analysis
+        search_params['max_km'] = str(int(float(max_km) * 1.20))
+
+    if min_km is not None:
+        # Add a slightly lower min_km for market analysis
+        search_params['min_km'] = str(int(float(min_km) * 0.80))
+
+    optional_params = [
+        ('brand', 'brand'),
+        ('model', 'model'),
+        ('min_year', 'min_year'),
+        ('max_year', 'max_year'),
+        ('engine', 'engine'),
+        ('latitude', 'latitude'),
+        ('longitude', 'longitude')
+    ]
+
+    for param_key, api_key in optional_params:
+        value = params.get(param_key)
+        if value and str(value).strip():  # Check if value exists and is not empty
+            if param_key in ['latitude', 'longitude']:
+                search_params[api_key] = format(float(value), '.4f')
+            else:
+                search_params[api_key] = str(value)
+
+    # Horsepower range for market analysis (80-130% of min_horse_power)
+    min_hp = params.get('min_horse_power')
+    if min_hp and str(min_hp).strip():
+        try:
+            min_hp = int(float(min_hp))
+            search_params['min_horse_power'] = str(int(min_hp * 0.8))
+            search_params['max_horse_power'] = str(int(min_hp * 1.30))
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Invalid horsepower value '{min_hp}': {str(e)}")
+
+    # Remove empty parameters
+    return {k: v for k, v in search_params.items() if v and str(v).strip()}
+
+def market_query_key(search_params: Dict[str, str]) -> str:
+    """Stable key identifying a market query, independent of parameter order"""
+    canonical = json.dumps(search_params, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def calculate_market_data(search_objects: list, web_url: str) -> Optional[Dict[str, Any]]:
+    """Estimate the market price from the cheapest valid listings of a search"""
+    valid_prices = []
+    for listing in search_objects:
+        content = listing['content']
+
+        try:
+            int(content.get('km', 0))
+        except (ValueError, TypeError):
+            continue
+
+        # Skip unwanted listings
+        if wallapop_endpoint_search.has_unwanted_keywords(content['title'], wallapop_endpoint_search.UNWANTED_KEYWORDS) or \
+           wallapop_endpoint_search.has_unwanted_keywords(content.get('storytelling', ''), wallapop_endpoint_search.UNWANTED_KEYWORDS):
+            continue
+
+        valid_prices.append(float(content['price']))
+
+    if not valid_prices:
+        return None
+
+    valid_prices.sort()
+    valid_prices = valid_prices[:SAMPLE_SIZE]
+    num_prices = len(valid_prices)
+    logger.info(f"Found {num_prices} valid listings for market analysis (using cheapest {SAMPLE_SIZE})")
+
+    median_price = valid_prices[num_prices // 2]
+
+    # Calculate average excluding outliers (prices beyond 2 standard deviations)
+    mean = sum(valid_prices) / num_prices
+    std_dev = (sum((x - mean) ** 2 for x in valid_prices) / num_prices) ** 0.5
+    filtered_prices = [p for p in valid_prices if abs(p - mean) <= 2 * std_dev]
+    avg_price = sum(filtered_prices) / len(filtered_prices) if filtered_prices else mean
+
+    return {
+        'average_price': avg_price,
+        'median_price': median_price,
+        'min_price': valid_prices[0],
+        'max_price': valid_prices[-1],
+        'total_listings': len(search_objects),
+        'valid_listings': num_prices,
+        'search_url': web_url
+    }
+
+def fetch_market_price(search_params: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Run the upstream market query and compute its estimate"""
+    url = f"{CARS_SEARCH_URL}?{'&'.join(f'{k}={quote(str(v))}' for k, v in search_params.items())}"
+    web_url = wallapop_endpoint_search.convert_api_url_to_web_url(url)
+    logger.info(f"\nMarket price search URL: {url}")
+    logger.info(f"\nMarket price web URL: {web_url}")
+
+    response = requests.get(url)
+    response.raise_for_status()
+    data = response.json()
+
+    return calculate_market_data(data.get('search_objects', []), web_url)
+
+def load_recent_market_price(supabase: Client, query_key: str, max_age_hours: float) -> Optional[Tuple[Dict[str, Any], datetime]]:
+    """Return the newest stored estimate for a query and when it was computed, if it is recent enough"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=max_age_hours)).isoformat()
+    response = supabase.table(HISTORY_TABLE)\
+        .select('*')\
+        .eq('query_key', query_key)\
+        .gte('created_at', cutoff)\
+        .order('created_at', desc=True)\
+        .limit(1)\
+        .execute()
+
+    if not response.data:
+        return None
+
+    row = response.data[0]
+    market_data = {
+        'average_price': row['average_price'],
+        'median_price': row['median_price'],
+        'min_price': row['min_price'],
+        'max_price': row['max_price'],
+        'total_listings': row['total_listings'],
+        'valid_listings': row['valid_listings'],
+        'search_url': row['search_url']
+    }
+    return market_data, datetime.fromisoformat(str(row['created_at']).replace('Z', '+00:00'))
+
+def store_market_price(supabase: Client, query_key: str, search_params: Dict[str, str], market_data: Dict[str, Any]):
+    """Append a computed estimate to the history table"""
+    supabase.table(HISTORY_TABLE).insert({
+        'query_key': query_key,
+        'search_parameters': search_params,
+        **market_data,
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }).execute()
+
+def remember_estimate(query_key: str, computed_at: datetime, market_data: Dict[str, Any], max_age_hours: float):
+    """Keep an estimate in memory, evicting the ones too old to be served"""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=max(max_age_hours, MAX_AGE_HOURS))
+    with _recent_lock:
+        for key in [key for key, (seen_at, _) in _recent_estimates.items() if seen_at < cutoff]:
+            del _recent_estimates[key]
+        _recent_estimates[query_key] = (computed_at, market_data)
+
+def get_market_price(params: Dict[str, Any], supabase: Optional[Client] = None,
+                     max_age_hours: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Get the market price for the given search parameters.
+    Recent estimates are served from memory or the history table; otherwise
+    the market is fetched upstream and the new estimate is persisted.
+    """
+    try:
+        logger.info(f"Received params: {params}")
+        if max_age_hours is None:
+            max_age_hours = MAX_AGE_HOURS
+
+        search_params = build_market_search_params(params)
+        query_key = market_query_key(search_params)
+        now = datetime.now(timezone.utc)
+
+        cached = _recent_estimates.get(query_key)
+        if cached and now - cached[0] <= timedelta(hours=max_age_hours):
+            logger.info(f"Using in-memory market price for {query_key}")
+            return dict(cached[1])
+
+        if supabase is None:
+            supabase = get_history_client()
+
+        if supabase is not None and max_age_hours > 0:
+            try:
+                stored = load_recent_market_price(supabase, query_key, max_age_hours)
+                if stored:
+                    market_data, computed_at = stored
+                    logger.info(f"Using stored market price for {query_key}")
+                    # Cached with its own age, so it expires from memory when it would from the table
+                    remember_estimate(query_key, computed_at, market_data, max_age_hours)
+                    return dict(market_data)
+            except Exception as e:
+                logger.warning(f"Could not read market price history: {str(e)}")
+
+        market_data = fetch_market_price(search_params)
+        if not market_data:
+            logger.warning("No valid prices found for market analysis")
+            return None
+
+        logger.info(f"Calculated market data: {market_data}")
+        remember_estimate(query_key, now, market_data, max_age_hours)
+
+        if supabase is not None:
+            try:
+                store_market_price(supabase, query_key, search_params, market_data)
+            except Exception as e:
+                logger.warning(f"Could not store market price history: {str(e)}")
+
+        return dict(market_data)
+
+    except Exception as e:
+        logger.error(f"Error getting market price: {str(e)}", exc_info=True)
+        return None
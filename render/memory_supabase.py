@@ -0,0 +1,422 @@
+"""
+In-memory stand-in for the subset of the Supabase client used by the writers.
+
+Set SUPABASE_BACKEND=memory to make init_supabase() return a shared instance,
+and MEMORY_SUPABASE_LATENCY_MS to simulate the network cost of each request.
+Every execute() counts as one round trip in `round_trips`.
+"""
+import copy
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+__all__ = ['MemorySupabase', 'use_memory_backend', 'get_client']
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+def use_memory_backend() -> bool:
+    """Whether the writers should use the in-memory stand-in instead of Supabase"""
+    return os.getenv("SUPABASE_BACKEND", "").lower() == "memory"
+
+def get_client() -> 'MemorySupabase':
+    """Shared in-memory client, so every writer in the process sees the same data"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            latency = float(os.getenv("MEMORY_SUPABASE_LATENCY_MS", "0")) / 1000
+            _shared_client = MemorySupabase(latency=latency)
+        return _shared_client
+
+class APIResponse:
+    """Mimics the response object returned by postgrest execute()"""
+
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+    def __repr__(self):
+        return f"APIResponse(data={self.data!r}, count={self.count!r})"
+
+def split_columns(columns: str) -> List[str]:
+    """Split a select string on top-level commas: '*, users!inner(email)'"""
+    parts, depth, current = [], 0, ''
+    for char in columns:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+def compare(value, other):
+    """Compare values the way PostgREST would for the common column types"""
+    if isinstance(value, (int, float)) and isinstance(other, str):
+        try:
+            return value, float(other)
+        except ValueError:
+            return str(value), other
+    if isinstance(value, str) and isinstance(other, (int, float)):
+        try:
+            return float(value), other
+        except ValueError:
+            return value, str(other)
+    return value, other
+
+def latest_price_points(client: 'MemorySupabase') -> List[Dict[str, Any]]:
+    """Python version of the listing_price_latest view"""
+    latest = {}
+    for row in sorted(client.tables.get('listing_price_history', []), key=lambda r: r['observed_at']):
+        latest[row['external_id']] = row
+    return list(latest.values())
+
+def listing_price_drops(client: 'MemorySupabase', params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Python version of the listing_price_drops() function"""
+    drops = []
+    previous = {}
+    for row in sorted(client.tables.get('listing_price_history', []), key=lambda r: r['observed_at']):
+        before = previous.get(row['external_id'])
+        previous[row['external_id']] = row
+        if before is None or row['observed_at'] < params['since']:
+            continue
+        drop = float(before['price']) - float(row['price'])
+        if drop > 0 and drop >= float(params.get('min_drop', 0)):
+            drops.append({
+                'external_id': row['external_id'],
+                'previous_price': before['price'],
+                'current_price': row['price'],
+                'price_drop': drop,
+                'km': row.get('km'),
+                'dropped_at': row['observed_at']
+            })
+    return drops
+
+def claim_due_alerts(client: 'MemorySupabase', params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Python version of the claim_due_alerts() function"""
+    users = {user['id']: user for user in client.tables.get('users', [])}
+    due = [
+        alert for alert in client.tables.get('alertas', [])
+        if alert.get('user_id') in users and alert.get('next_run_at') is not None
+        and alert['next_run_at'] <= params['run_at']
+    ]
+    due = sorted(due, key=lambda alert: alert['next_run_at'])[:params['batch_limit']]
+    claimed = []
+    for alert in due:
+        claimed.append({**alert, 'users': {'email': users[alert['user_id']].get('email')}})
+        alert['next_run_at'] = params['lease_until']
+    return claimed
+
+def store_modo_rapido_runs(client: 'MemorySupabase', params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Python version of the store_modo_rapido_runs() function, rolled back on failure like the transaction"""
+    tables = ('market_data', 'modo_rapido_runs', 'modo_rapido_listings', 'modo_rapido')
+    snapshot = {table: list(client.tables.get(table, [])) for table in tables}
+    try:
+        return _store_modo_rapido_runs(client, params['runs'])
+    except Exception:
+        client.tables.update(snapshot)
+        raise
+
+def _store_modo_rapido_runs(client: 'MemorySupabase', runs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    stored = []
+    for run in runs:
+        market_data = client._insert_row('market_data', run['market_data'])
+        modo_rapido_run = client._insert_row('modo_rapido_runs', {
+            'modo_rapido_id': run['modo_rapido_id'],
+            'market_data_id': market_data['id']
+        })
+        for listing in run['listings']:
+            client._insert_row('modo_rapido_listings', {**listing, 'modo_rapido_run_id': modo_rapido_run['id']})
+        client.tables['modo_rapido'] = [
+            {**entry, 'refreshed_at': modo_rapido_run['created_at'], 'refreshed_search_key': run.get('search_key'),
+             'last_run_id': modo_rapido_run['id']}
+            if entry['id'] == run['modo_rapido_id'] else entry
+            for entry in client.tables.get('modo_rapido', [])
+        ]
+        stored.append({
+            'modo_rapido_id': run['modo_rapido_id'],
+            'market_data_id': market_data['id'],
+            'run_id': modo_rapido_run['id'],
+            'listings': len(run['listings'])
+        })
+    return stored
+
+class MemoryQuery:
+    """Chainable table query supporting the filters and modifiers we use"""
+
+    def __init__(self, client: 'MemorySupabase', table: str):
+        self.client = client
+        self.table_name = table
+        self.operation = 'select'
+        self.columns = '*'
+        self.count_mode = None
+        self.payload = None
+        self.on_conflict = 'id'
+        self.filters = []
+        self.orders = []
+        self.limit_count = None
+        self.offset = 0
+
+    # Operations
+
+    def select(self, *columns, count: Optional[str] = None):
+        self.operation = 'select'
+        self.columns = ','.join(columns) if columns else '*'
+        self.count_mode = count
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.operation = 'insert'
+        self.payload = rows
+        return self
+
+    def upsert(self, rows, on_conflict: str = 'id', **kwargs):
+        self.operation = 'upsert'
+        self.payload = rows
+        self.on_conflict = on_conflict or 'id'
+        return self
+
+    def update(self, values: Dict[str, Any], **kwargs):
+        self.operation = 'update'
+        self.payload = values
+        return self
+
+    def delete(self, **kwargs):
+        self.operation = 'delete'
+        return self
+
+    # Filters
+
+    def filter(self, column: str, operator: str, value):
+        checks = {
+            'eq': lambda a, b: a == b,
+            'neq': lambda a, b: a != b,
+            'gt': lambda a, b: a is not None and a > b,
+            'gte': lambda a, b: a is not None and a >= b,
+            'lt': lambda a, b: a is not None and a < b,
+            'lte': lambda a, b: a is not None and a <= b,
+        }
+        check = checks[operator]
+        self.filters.append(lambda row: check(*compare(row.get(column), value)))
+        return self
+
+    def eq(self, column, value):
+        return self.filter(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self.filter(column, 'neq', value)
+
+    def gt(self, column, value):
+        return self.filter(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self.filter(column, 'gte', value)
+
+    def lt(self, column, value):
+        return self.filter(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self.filter(column, 'lte', value)
+
+    def in_(self, column, values):
+        allowed = set(values)
+        self.filters.append(lambda row: row.get(column) in allowed)
+        return self
+
+    def is_(self, column, value):
+        expected = None if value in (None, 'null') else value
+        self.filters.append(lambda row: row.get(column) is expected)
+        return self
+
+    # Modifiers
+
+    def order(self, column: str, desc: bool = False, **kwargs):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count: int, **kwargs):
+        self.limit_count = count
+        return self
+
+    def range(self, start: int, end: int):
+        self.offset = start
+        self.limit_count = end - start + 1
+        return self
+
+    def execute(self) -> APIResponse:
+        return self.client._execute(self)
+
+class MemoryRPC:
+    """Pending RPC call"""
+
+    def __init__(self, client: 'MemorySupabase', name: str, params: Dict[str, Any]):
+        self.client = client
+        self.name = name
+        self.params = params or {}
+
+    def execute(self) -> APIResponse:
+        return self.client._call(self.name, self.params)
+
+class MemorySupabase:
+    """In-memory replacement for supabase.Client with per-call latency and round-trip counts"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.functions: Dict[str, Callable[['MemorySupabase', Dict[str, Any]], Any]] = {
+            'truncate_table': lambda client, params: client.truncate(params['table_name']),
+            'listing_price_drops': listing_price_drops,
+            'claim_due_alerts': claim_due_alerts,
+            'store_modo_rapido_runs': store_modo_rapido_runs,
+        }
+        self.views: Dict[str, Callable[['MemorySupabase'], List[Dict[str, Any]]]] = {
+            'listing_price_latest': latest_price_points,
+        }
+        self.round_trips = Counter()
+        self._next_ids: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def table(self, name: str) -> MemoryQuery:
+        return MemoryQuery(self, name)
+
+    from_ = table
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> MemoryRPC:
+        return MemoryRPC(self, name, params)
+
+    def register_function(self, name: str, function: Callable[['MemorySupabase', Dict[str, Any]], Any]):
+        """Provide a Python implementation for a server-side function"""
+        self.functions[name] = function
+
+    def seed(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert rows without counting a round trip"""
+        with self._lock:
+            return [self._insert_row(table, row) for row in rows]
+
+    def truncate(self, table: str):
+        with self._lock:
+            self.tables[table] = []
+
+    def reset_stats(self):
+        self.round_trips = Counter()
+
+    @property
+    def total_round_trips(self) -> int:
+        return sum(self.round_trips.values())
+
+    def _simulate_round_trip(self, key: str):
+        self.round_trips[key] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _call(self, name: str, params: Dict[str, Any]) -> APIResponse:
+        self._simulate_round_trip(f"rpc:{name}")
+        if name not in self.functions:
+            raise Exception(f"Could not find the function public.{name}")
+        with self._lock:
+            result = self.functions[name](self, params)
+        return APIResponse(copy.deepcopy(result) if result is not None else [])
+
+    def _insert_row(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        rows = self.tables.setdefault(table, [])
+        stored = copy.deepcopy(row)
+        if stored.get('id') is None:
+            next_id = self._next_ids.get(table, 1)
+            stored['id'] = next_id
+            self._next_ids[table] = next_id + 1
+        elif isinstance(stored['id'], int):
+            self._next_ids[table] = max(self._next_ids.get(table, 1), stored['id'] + 1)
+        stored.setdefault('created_at', datetime.now(timezone.utc).isoformat())
+        rows.append(stored)
+        return stored
+
+    def _matching(self, query: MemoryQuery) -> List[Dict[str, Any]]:
+        if query.table_name in self.views:
+            rows = self.views[query.table_name](self)
+        else:
+            rows = self.tables.get(query.table_name, [])
+        return [row for row in rows if all(check(row) for check in query.filters)]
+
+    def _embed(self, row: Dict[str, Any], columns: str) -> Optional[Dict[str, Any]]:
+        """Project a row onto a select string, resolving embedded many-to-one relations"""
+        result = {}
+        for part in split_columns(columns):
+            if part == '*':
+                result.update(row)
+            elif '(' in part:
+                relation, inner_columns = part[:-1].split('(', 1)
+                inner = relation.endswith('!inner')
+                relation = relation.replace('!inner', '')
+                foreign_key = row.get(f"{relation}_id", row.get(f"{relation.rstrip('s')}_id"))
+                related = next((r for r in self.tables.get(relation, []) if r.get('id') == foreign_key), None)
+                if related is None and inner:
+                    return None
+                result[relation] = self._embed(related, inner_columns) if related else None
+            elif part != 'count':
+                result[part] = row.get(part)
+        return result
+
+    def _execute(self, query: MemoryQuery) -> APIResponse:
+        self._simulate_round_trip(f"{query.table_name}:{query.operation}")
+
+        with self._lock:
+            if query.operation == 'insert':
+                rows = query.payload if isinstance(query.payload, list) else [query.payload]
+                return APIResponse(copy.deepcopy([self._insert_row(query.table_name, row) for row in rows]))
+
+            if query.operation == 'upsert':
+                rows = query.payload if isinstance(query.payload, list) else [query.payload]
+                conflict_columns = [c.strip() for c in query.on_conflict.split(',')]
+                existing_rows = self.tables.setdefault(query.table_name, [])
+                written = []
+                for row in rows:
+                    existing = next((
+                        r for r in existing_rows
+                        if all(r.get(c) == row.get(c) for c in conflict_columns)
+                    ), None)
+                    if existing is not None:
+                        existing.update(copy.deepcopy(row))
+                        written.append(existing)
+                    else:
+                        written.append(self._insert_row(query.table_name, row))
+                return APIResponse(copy.deepcopy(written))
+
+            matched = self._matching(query)
+
+            if query.operation == 'update':
+                for row in matched:
+                    row.update(copy.deepcopy(query.payload))
+                return APIResponse(copy.deepcopy(matched))
+
+            if query.operation == 'delete':
+                matched_ids = {id(row) for row in matched}
+                self.tables[query.table_name] = [
+                    row for row in self.tables.get(query.table_name, []) if id(row) not in matched_ids
+                ]
+                return APIResponse(copy.deepcopy(matched))
+
+            for column, desc in reversed(query.orders):
+                matched = sorted(
+                    matched,
+                    key=lambda row: (row.get(column) is None, row.get(column) if row.get(column) is not None else 0),
+                    reverse=desc
+                )
+
+            count = len(matched) if query.count_mode else None
+            end = query.offset + query.limit_count if query.limit_count is not None else None
+            matched = matched[query.offset:end]
+
+            data = []
+            for row in matched:
+                projected = self._embed(row, query.columns)
+                if projected is not None:
+                    data.append(projected)
+            return APIResponse(copy.deepcopy(data), count=count)
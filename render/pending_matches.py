@@ -0,0 +1,59 @@
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+from supabase import Client
+
+__all__ = ['save_pending_matches', 'load_pending_matches', 'clear_pending_matches']
+
+logger = logging.getLogger(__name__)
+
+PENDING_TABLE = 'alert_pending_matches'
+
+# Keep in_() filters short enough for the PostgREST query string
+LOOKUP_CHUNK_SIZE = 200
+
+# Rows per upsert, and per page when reading past the PostgREST row cap
+STORE_CHUNK_SIZE = 500
+PAGE_SIZE = 1000
+
+def save_pending_matches(supabase: Client, matched: Dict[Any, List[tuple]]) -> int:
+    """Store alert_id -> [(content, kilometers, distance)] matches until the alerts come due"""
+    matched_at = datetime.now(timezone.utc).isoformat()
+    rows = [{
+        'alert_id': alert_id,
+        'listing_id': str(content['id']),
+        'content': content,
+        'kilometers': kilometers,
+        'distance': round(distance, 1),
+        'matched_at': matched_at
+    } for alert_id, matches in matched.items() for content, kilometers, distance in matches]
+
+    for i in range(0, len(rows), STORE_CHUNK_SIZE):
+        supabase.table(PENDING_TABLE).upsert(rows[i:i + STORE_CHUNK_SIZE], on_conflict='alert_id,listing_id').execute()
+    return len(rows)
+
+def load_pending_matches(supabase: Client, alert_ids: List[Any]) -> Dict[Any, List[tuple]]:
+    """Pending matches of many alerts, as alert_id -> [(content, kilometers, distance)]"""
+    pending = {}
+    for i in range(0, len(alert_ids), LOOKUP_CHUNK_SIZE):
+        chunk = alert_ids[i:i + LOOKUP_CHUNK_SIZE]
+        offset = 0
+        while True:
+            response = supabase.table(PENDING_TABLE)\
+                .select('alert_id,listing_id,content,kilometers,distance')\
+                .in_('alert_id', chunk)\
+                .order('alert_id')\
+                .order('listing_id')\
+                .range(offset, offset + PAGE_SIZE - 1)\
+                .execute()
+            for row in response.data:
+                pending.setdefault(row['alert_id'], []).append((row['content'], row['kilometers'], float(row['distance'])))
+            if len(response.data) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+    return pending
+
+def clear_pending_matches(supabase: Client, alert_ids: List[Any]):
+    """Forget the pending matches of alerts that have reported them"""
+    for i in range(0, len(alert_ids), LOOKUP_CHUNK_SIZE):
+        supabase.table(PENDING_TABLE).delete().in_('alert_id', alert_ids[i:i + LOOKUP_CHUNK_SIZE]).execute()
@@ -0,0 +1,84 @@
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, List
+from supabase import Client
+
+__all__ = ['observation_from_content', 'record_price_observations', 'get_price_drops']
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TABLE = 'listing_price_history'
+LATEST_VIEW = 'listing_price_latest'
+
+# Keep in_() filters short enough for the PostgREST query string
+LOOKUP_CHUNK_SIZE = 200
+
+TRACKED_FIELDS = ('price', 'km', 'modification_date')
+
+def observation_from_content(content: Dict[str, Any], kilometers: int = None) -> Dict[str, Any]:
+    """Build a price history point from a Wallapop API listing"""
+    return {
+        'external_id': content['id'],
+        'price': float(content['price']),
+        'km': kilometers if kilometers is not None else int(content.get('km', 0)),
+        'modification_date': content.get('modification_date')
+    }
+
+def get_latest_observations(supabase: Client, external_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch the latest recorded point for each listing"""
+    latest = {}
+    for i in range(0, len(external_ids), LOOKUP_CHUNK_SIZE):
+        chunk = external_ids[i:i + LOOKUP_CHUNK_SIZE]
+        response = supabase.table(LATEST_VIEW)\
+            .select('external_id,price,km,modification_date')\
+            .in_('external_id', chunk)\
+            .execute()
+        for row in response.data:
+            latest[row['external_id']] = row
+    return latest
+
+def has_changed(previous: Dict[str, Any], observation: Dict[str, Any]) -> bool:
+    """Check whether an observation differs from the last recorded point"""
+    if previous is None:
+        return True
+    for field in TRACKED_FIELDS:
+        old, new = previous.get(field), observation.get(field)
+        if field == 'price' and old is not None and new is not None:
+            if float(old) != float(new):
+                return True
+        elif old != new:
+            return True
+    return False
+
+def record_price_observations(supabase: Client, observations: List[Dict[str, Any]]) -> int:
+    """Record observations whose price, km or modification date changed. Returns the number of points written."""
+    try:
+        # Last observation wins when a listing shows up twice in the same batch
+        by_id = {obs['external_id']: obs for obs in observations}
+        if not by_id:
+            return 0
+
+        latest = get_latest_observations(supabase, list(by_id.keys()))
+        observed_at = datetime.now(timezone.utc).isoformat()
+
+        changed = [
+            {**obs, 'observed_at': observed_at}
+            for external_id, obs in by_id.items()
+            if has_changed(latest.get(external_id), obs)
+        ]
+
+        if changed:
+            supabase.table(HISTORY_TABLE).insert(changed).execute()
+
+        logger.info(f"Price history: {len(changed)} changed of {len(by_id)} observed listings")
+        return len(changed)
+
+    except Exception as e:
+        logger.error(f"Error recording price history: {str(e)}", exc_info=True)
+        return 0
+
+def get_price_drops(supabase: Client, hours: float = 24, min_drop: float = 0) -> List[Dict[str, Any]]:
+    """Listings whose price dropped within the last `hours`, largest drops first"""
+    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+    response = supabase.rpc('listing_price_drops', {'since': since, 'min_drop': min_drop}).execute()
+    return sorted(response.data or [], key=lambda row: float(row['price_drop']), reverse=True)
@@ -1,29 +1,50 @@
 from datetime import datetime, timezone, timedelta
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import wallapop_endpoint_search
-import smtplib
+import geo_tiles
+import mailer
+import email_templates
+import seen_listings
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
+import math
+import time
 
 logger = logging.getLogger(__name__)
 
-def format_price_text(price: float) -> str:
-    """Format price as text with euro symbol"""
-    return f"{price:,.0f} €".replace(",", ".")
+# Alerts whose search centers fall in the same grid cell share one upstream search
+ALERT_GRID_DEGREES = float(os.getenv("ALERT_GRID_DEGREES", "0.1"))
+
+# Alert groups processed concurrently
+ALERT_WORKERS = int(os.getenv("ALERT_WORKERS", "4"))
+
+# Alerts loaded per call, and the default and retry intervals until their next run
+ALERT_BATCH_LIMIT = int(os.getenv("ALERT_BATCH_LIMIT", "200"))
+DEFAULT_INTERVAL_HOURS = 23
+ALERT_RETRY_MINUTES = int(os.getenv("ALERT_RETRY_MINUTES", "60"))
+
+# Wall-clock budget of one call, and how long the alerts it claims stay hidden from other calls
+ALERT_TIME_BUDGET_SECONDS = float(os.getenv("ALERT_TIME_BUDGET_SECONDS", "25"))
+ALERT_LEASE_MINUTES = int(os.getenv("ALERT_LEASE_MINUTES", "15"))
+ALERT_LOOP_IDLE_SECONDS = float(os.getenv("ALERT_LOOP_IDLE_SECONDS", "60"))
+PROGRESS_TABLE = 'alert_processing_state'
+
+# Send one email per user and cycle instead of one per alert
+ALERT_DIGEST = os.getenv("ALERT_DIGEST", "false").lower() == "true"
+
+KM_PER_DEGREE = 111.32
+EARTH_RADIUS_KM = 6371.0
 
 def send_email_notification(to_email: str, new_listings: List[Dict], alert_info: Dict):
-    """Send email notification about new listings"""
+    """Queue an email notification about new listings"""
     try:
-        # Get SMTP configuration from environment variables
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
         smtp_username = os.getenv("SMTP_USERNAME")
-        smtp_password = os.getenv("SMTP_PASSWORD")
 
         # Validate SMTP configuration
-        if not smtp_username or not smtp_password:
+        if not mailer.smtp_configured():
             logger.error("SMTP credentials not configured. Please set SMTP_USERNAME and SMTP_PASSWORD environment variables.")
             return False
 
@@ -33,233 +54,499 @@ def send_email_notification(to_email: str, new_listings: List[Dict], alert_info:
         msg['To'] = to_email
         msg['Subject'] = f"¡Nuevos anuncios encontrados para tu alerta de {alert_info['brand']} {alert_info['model']}!"
 
-        # Create email body with inline styles for better email client compatibility
-        body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-            <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin-bottom: 25px; text-align: center;">
-                <a href="https://cholloscars.com/app/alertas/{alert_info['id']}" style="color: #3498db; text-decoration: none; font-size: 16px; font-weight: bold;">
-                    👉 Visita tu panel de alertas para gestionar tus búsquedas y ver todos los anuncios 👈
-                </a>
-            </div>
-            
-            <h2 style="color: #2c3e50; margin-bottom: 20px;">¡Nuevos anuncios encontrados para tu {alert_info['brand']} {alert_info['model']}!</h2>
-            <p style="font-size: 16px;">Hemos encontrado {len(new_listings)} nuevos anuncios que coinciden con tus criterios:</p>
-            <div>
-        """
-        
-        # Add each new listing to the email
-        for listing in new_listings:
-            price_text = listing['price_text']
-            title = listing['title']
-            url = listing['url']
-            location = listing['location']
-            year = listing['year']
-            km = f"{listing['kilometers']:,}".replace(",", ".")
-            
-            # Get the first image URL if available
-            image_url = listing['listing_images'][0]['image_url'] if listing['listing_images'] else None
-            
-            body += f"""
-            <div style="border: 1px solid #ddd; padding: 15px; margin-bottom: 20px; border-radius: 5px; display: flex; align-items: start;">
-                <div style="flex: 1; min-width: 0; margin-right: auto; padding-right: 15px;">
-                    <h3 style="color: #2c3e50; margin: 0 0 10px 0; overflow: hidden; text-overflow: ellipsis;">{title}</h3>
-                    <p style="font-size: 18px; color: #27ae60; margin: 10px 0;"><strong>{price_text}</strong></p>
-                    <p style="margin: 5px 0;">
-                        <span style="color: #7f8c8d;">Año:</span> {year} | 
-                        <span style="color: #7f8c8d;">Kilómetros:</span> {km}
-                    </p>
-                    <p style="margin: 5px 0;"><span style="color: #7f8c8d;">Ubicación:</span> {location}</p>
-                </div>
-                {f'<div style="width: 150px; flex-shrink: 0;"><img src="{image_url}" alt="{title}" style="width: 150px; height: 150px; object-fit: cover; border-radius: 5px;"></div>' if image_url else ''}
-            </div>
-            """
-        
-        body += """
-            </div>
-        </div>
-        </body>
-        </html>
-        """
+        # Create email body from the precompiled templates
+        body = email_templates.render_alert_email(alert_info, new_listings)
 
         msg.attach(MIMEText(body, 'html'))
 
-        try:
-            # Connect to SMTP server with timeout
-            with smtplib.SMTP(smtp_server, smtp_port, timeout=30) as server:
-                server.starttls()
-                server.login(smtp_username, smtp_password)
-                server.send_message(msg)
-                
-            logger.info(f"Email notification sent successfully to {to_email}")
-            return True
-            
-        except smtplib.SMTPException as smtp_error:
-            logger.error(f"SMTP error sending email to {to_email}: {str(smtp_error)}")
-            return False
-        except TimeoutError:
-            logger.error(f"Timeout error while sending email to {to_email}")
-            return False
+        # Delivered by the mailer's background session
+        mailer.get_mailer().enqueue(msg)
+        logger.info(f"Email notification queued for {to_email}")
+        return True
         
     except Exception as e:
         logger.error(f"Unexpected error sending email notification: {str(e)}")
         return False
 
-def process_alerts(supabase):
-    """Process all alerts and run searches for those that haven't been run in 23 hours"""
+def send_digest_notification(to_email: str, sections: List[Dict[str, Any]]):
+    """Queue a single email with the new listings of several alerts"""
+    try:
+        smtp_username = os.getenv("SMTP_USERNAME")
+
+        if not mailer.smtp_configured():
+            logger.error("SMTP credentials not configured. Please set SMTP_USERNAME and SMTP_PASSWORD environment variables.")
+            return False
+
+        total_listings = sum(len(section['listings']) for section in sections)
+        msg = MIMEMultipart()
+        msg['From'] = f"Alertas de Coches <{smtp_username}>"
+        msg['To'] = to_email
+        msg['Subject'] = f"¡{total_listings} nuevos anuncios encontrados para tus {len(sections)} alertas!"
+        msg.attach(MIMEText(email_templates.render_digest_email(sections), 'html'))
+
+        mailer.get_mailer().enqueue(msg)
+        logger.info(f"Digest email queued for {to_email}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Unexpected error sending digest notification: {str(e)}")
+        return False
+
+def claim_due_alerts(supabase, now: datetime, limit: int) -> List[Dict]:
+    """
+    Claim the alerts whose next_run_at has passed, most overdue first, with their
+    user emails. The claim is one atomic call, so concurrent calls get disjoint
+    alerts; the lease expires if this call dies.
+    """
+    response = supabase.rpc('claim_due_alerts', {
+        'run_at': now.isoformat(),
+        'lease_until': (now + timedelta(minutes=ALERT_LEASE_MINUTES)).isoformat(),
+        'batch_limit': limit
+    }).execute()
+    return response.data or []
+
+def schedule_next_runs(supabase, alerts: List[Dict], results: List[Dict], now: datetime):
+    """Push next_run_at forward by each alert's interval, or by the retry delay if it failed"""
+    succeeded = {result['alert_id'] for result in results if result.get('success')}
+    
+    # One update per distinct next_run_at instead of one per alert
+    by_next_run = {}
+    for alert in alerts:
+        if alert['id'] in succeeded:
+            interval = timedelta(hours=float(alert.get('run_interval_hours') or DEFAULT_INTERVAL_HOURS))
+        else:
+            interval = timedelta(minutes=ALERT_RETRY_MINUTES)
+        by_next_run.setdefault((now + interval).isoformat(), []).append(alert['id'])
+    
+    for next_run_at, alert_ids in by_next_run.items():
+        supabase.table('alertas')\
+            .update({'next_run_at': next_run_at})\
+            .in_('id', alert_ids)\
+            .execute()
+
+def build_search_params(alert) -> Dict[str, Any]:
+    """Search parameters for a single alert"""
+    search_params = {
+        'brand': alert['brand'],
+        'model': alert['model'],
+        'min_year': alert['min_year'],
+        'max_year': alert['max_year'],
+        'engine': alert['engine'].lower() if alert['engine'] else None,
+        'min_horse_power': alert['min_horse_power'],
+        'gearbox': alert['gearbox'].lower() if alert['gearbox'] else None,
+        'latitude': alert['latitude'],
+        'longitude': alert['longitude'],
+        'distance': alert['distance'],
+        'max_kilometers': alert['max_kilometers']
+    }
+    
+    # Remove None values
+    return {k: v for k, v in search_params.items() if v is not None}
+
+def snap_to_grid(value: float) -> float:
+    """Snap a coordinate to the center of its alert grid cell"""
+    return round((math.floor(float(value) / ALERT_GRID_DEGREES) + 0.5) * ALERT_GRID_DEGREES, 4)
+
+def grid_slack_km() -> int:
+    """Largest distance between a point and the center of its grid cell"""
+    return math.ceil(KM_PER_DEGREE * ALERT_GRID_DEGREES * math.sqrt(2) / 2)
+
+def canonical_search_key(search_params: Dict[str, Any]) -> tuple:
+    """Key shared by alerts that can be served by the same upstream search"""
+    canonical = {}
+    for key, value in search_params.items():
+        if key in ('latitude', 'longitude'):
+            canonical[key] = snap_to_grid(value)
+        elif isinstance(value, str):
+            canonical[key] = value.strip().lower()
+        else:
+            canonical[key] = value
+    return tuple(sorted(canonical.items()))
+
+def plan_alert_searches(alerts: List[Dict]) -> List[Dict[str, Any]]:
+    """Group alerts by canonical search key so each group runs a single upstream search"""
+    groups = {}
+    for alert in alerts:
+        search_params = build_search_params(alert)
+        key = canonical_search_key(search_params)
+        if key not in groups:
+            group_params = dict(search_params)
+            if 'latitude' in group_params and 'longitude' in group_params:
+                # Search from the cell center, widened so every alert's own radius is covered
+                group_params['latitude'] = snap_to_grid(group_params['latitude'])
+                group_params['longitude'] = snap_to_grid(group_params['longitude'])
+                group_params['distance'] = int(group_params.get('distance', 200)) + grid_slack_km()
+            groups[key] = {'key': key, 'search_params': group_params, 'alerts': []}
+        groups[key]['alerts'].append(alert)
+    return list(groups.values())
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in km"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (float(lat1), float(lon1), float(lat2), float(lon2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def filter_listings_for_alert(alert, listings: List[Dict]) -> List[Dict]:
+    """
+    Keep the listings of a shared search that are within this alert's own
+    radius. The records are shared between the alerts of the search, not copied.
+    """
+    if alert.get('latitude') is None or alert.get('longitude') is None:
+        return listings
+    
+    max_distance = alert.get('distance') or 200
+    filtered = []
+    for listing in listings:
+        if listing.get('latitude') is None or listing.get('longitude') is None:
+            filtered.append(listing)
+            continue
+        distance = haversine_km(alert['latitude'], alert['longitude'], listing['latitude'], listing['longitude'])
+        if distance <= max_distance:
+            filtered.append(listing)
+    return filtered
+
+def build_digests(notifications: List[tuple]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Group the notifications of a cycle per user email. A listing matched by
+    several alerts of the same user is only listed under the first one.
+    """
+    digests = {}
+    shown_by_email = {}
+    for alert, new_listings in notifications:
+        email = alert['users']['email']
+        shown = shown_by_email.setdefault(email, set())
+        listings = [listing for listing in new_listings if listing['listing_id'] not in shown]
+        if not listings:
+            continue
+        shown.update(listing['listing_id'] for listing in listings)
+        digests.setdefault(email, []).append({
+            'alert_info': {'brand': alert['brand'], 'model': alert['model'], 'id': alert['id']},
+            'listings': listings
+        })
+    return digests
+
+def send_digest_notifications(notifications: List[tuple]) -> int:
+    """Queue one email per user with the new listings of all their alerts"""
+    digests = build_digests(notifications)
+    for to_email, sections in digests.items():
+        if len(sections) == 1:
+            send_email_notification(to_email, sections[0]['listings'], sections[0]['alert_info'])
+        else:
+            send_digest_notification(to_email, sections)
+    logger.info(f"Queued {len(digests)} digest emails for {len(notifications)} alert notifications")
+    return len(digests)
+
+def market_data_row(market_data: Dict[str, Any]) -> Dict[str, Any]:
+    """market_data row for an alert run"""
+    return {
+        'average_price': market_data.get('average_price', 0),
+        'median_price': market_data.get('median_price', 0),
+        'min_price': market_data.get('min_price', 0),
+        'max_price': market_data.get('max_price', 0),
+        'total_listings': market_data.get('total_listings', 0),
+        'valid_listings': market_data.get('valid_listings', 0),
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }
+
+def record_alert_matches(supabase, matches: List[Dict[str, Any]], seen_by_alert: Dict[Any, Dict[str, int]],
+                         digest: Optional[List[tuple]] = None) -> List[Dict]:
+    """
+    Diff each alert's listings against what it already reported, store the runs
+    and queue the notifications. Every match holds the alert, its listings, its
+    market data and the id of the stored market_data row. When a digest list is
+    given, notifications are collected there instead of being sent.
+    """
+    results = []
+    run_rows = []
+    notifications = []
+    updated_seen = {}
+    
+    for match in matches:
+        alert = match['alert']
+        try:
+            seen = seen_by_alert.get(alert['id'], {})
+            
+            transformed_listings = [listing for listing in match['listings'] if listing.get('listing_id')]
+            listing_ids = [listing['listing_id'] for listing in transformed_listings]
+            
+            # Track new listings for notifications
+            new_listing_ids = seen_listings.find_new_listing_ids(seen, listing_ids)
+            new_listings = [listing for listing in transformed_listings if listing['listing_id'] in new_listing_ids]
+            updated_seen[alert['id']] = seen_listings.update_seen_listings(seen, listing_ids)
+            
+            run_rows.append({
+                'alert_id': alert['id'],
+                'market_data_id': match['market_data_id'],
+                'created_at': datetime.now(timezone.utc).isoformat()
+            })
+            
+            if new_listings and alert.get('email_notifications', True):
+                notifications.append((alert, new_listings))
+            
+            results.append({
+                'alert_id': alert['id'],
+                'success': True,
+                'listings_found': len(transformed_listings),
+                'new_listings_found': len(new_listings),
+                'market_data': match['market_data']
+            })
+            
+        except Exception as e:
+            logger.error(f"Error processing alert {alert['id']}: {str(e)}")
+            results.append({
+                'alert_id': alert['id'],
+                'success': False,
+                'error': str(e)
+            })
+    
+    # Insert all alert runs at once
+    if run_rows:
+        supabase.table('alert_runs').insert(run_rows).execute()
+    
+    # Remember what was reported before notifying, so a failed email is not retried every run
+    seen_listings.save_seen_listings(supabase, updated_seen)
+    
+    if digest is not None:
+        digest.extend(notifications)
+        return results
+    
+    for alert, new_listings in notifications:
+        alert_info = {
+            'brand': alert['brand'],
+            'model': alert['model'],
+            'id': alert['id']
+        }
+        send_email_notification(alert['users']['email'], new_listings, alert_info)
+    
+    return results
+
+def process_alert_group(supabase, group: Dict[str, Any], seen_by_alert: Dict[Any, Dict[str, int]],
+                        digest: Optional[List[tuple]] = None,
+                        tile_cache: Optional[geo_tiles.TileCache] = None) -> List[Dict]:
+    """Run one upstream search for a group of alerts, then filter and notify per alert"""
+    alerts = group['alerts']
+    logger.info(f"Running search for alerts {[alert['id'] for alert in alerts]}")
+    result = wallapop_endpoint_search.search_wallapop_endpoint(group['search_params'], tile_cache)
+    
+    if not result or result.get('error'):
+        error_message = result.get('error') if result else 'Search returned no results'
+        return [{'alert_id': alert['id'], 'success': False, 'error': error_message} for alert in alerts]
+    
+    # One market data entry shared by every alert of the group
+    market_data = result.get('market_data', {})
+    market_data_response = supabase.table('market_data').insert(market_data_row(market_data)).execute()
+    market_data_id = market_data_response.data[0]['id']
+    
+    matches = [{
+        'alert': alert,
+        'listings': filter_listings_for_alert(alert, result.get('listings', [])),
+        'market_data': market_data,
+        'market_data_id': market_data_id
+    } for alert in alerts]
+    
+    return record_alert_matches(supabase, matches, seen_by_alert, digest)
+
+def run_alert_group(supabase, group: Dict[str, Any], seen_by_alert: Dict[Any, Dict[str, int]],
+                    digest: Optional[List[tuple]] = None, tile_cache: Optional[geo_tiles.TileCache] = None):
+    """Process one alert group, isolating its failures, and return (results, latency in seconds)"""
+    start_time = time.perf_counter()
     try:
-        # Get all alerts with their associated user emails
-        alerts_response = supabase.table('alertas')\
-            .select('*, users!inner(email)')\
+        results = process_alert_group(supabase, group, seen_by_alert, digest, tile_cache)
+    except Exception as e:
+        logger.error(f"Error processing alert group {group['key']}: {str(e)}")
+        results = [{
+            'alert_id': alert['id'],
+            'success': False,
+            'error': str(e)
+        } for alert in group['alerts']]
+    
+    latency = time.perf_counter() - start_time
+    logger.info(f"Alerts {[alert['id'] for alert in group['alerts']]} processed in {latency:.2f}s")
+    return results, latency
+
+def release_alerts(supabase, alerts: List[Dict], now: datetime):
+    """Make claimed alerts that were not processed due again right away"""
+    if alerts:
+        supabase.table('alertas')\
+            .update({'next_run_at': now.isoformat()})\
+            .in_('id', [alert['id'] for alert in alerts])\
             .execute()
-        alerts = alerts_response.data
+
+def count_due_alerts(supabase, now: datetime) -> int:
+    """Number of alerts still waiting to be processed"""
+    response = supabase.table('alertas')\
+        .select('id', count='exact')\
+        .lte('next_run_at', now.isoformat())\
+        .limit(1)\
+        .execute()
+    return response.count or 0
+
+def load_progress(supabase) -> Dict[str, Any]:
+    """Persisted progress of the current processing cycle"""
+    response = supabase.table(PROGRESS_TABLE).select('*').eq('name', 'process_alerts').execute()
+    return response.data[0] if response.data else {}
+
+def save_progress(supabase, processed: int, last_next_run_at: Optional[str], remaining_due: int, now: datetime) -> Dict[str, Any]:
+    """
+    Persist the cursor of the cycle: how many alerts it processed, the queue
+    position (next_run_at) of the last one and how many are still due. A new
+    cycle starts after the previous one drained the queue.
+    """
+    previous = load_progress(supabase)
+    if not previous or previous.get('remaining_due', 0) == 0:
+        previous = {'cycle_started_at': now.isoformat(), 'processed_in_cycle': 0}
+    
+    progress = {
+        'name': 'process_alerts',
+        'cycle_started_at': previous['cycle_started_at'],
+        'processed_in_cycle': previous['processed_in_cycle'] + processed,
+        'last_next_run_at': last_next_run_at or previous.get('last_next_run_at'),
+        'remaining_due': remaining_due,
+        'updated_at': datetime.now(timezone.utc).isoformat()
+    }
+    supabase.table(PROGRESS_TABLE).upsert(progress, on_conflict='name').execute()
+    return progress
+
+def process_alerts(supabase, max_workers: Optional[int] = None, limit: Optional[int] = None,
+                   digest: Optional[bool] = None, time_budget: Optional[float] = None):
+    """
+    Process the alerts that are due, up to limit per call, and schedule their next run.
+    In digest mode each user gets one email for all their alerts of the cycle.
+    
+    No new search is started once time_budget seconds have passed; the alerts
+    left over are released and picked up by the next call.
+    """
+    try:
+        if limit is None:
+            limit = ALERT_BATCH_LIMIT
+        if digest is None:
+            digest = ALERT_DIGEST
+        if time_budget is None:
+            time_budget = ALERT_TIME_BUDGET_SECONDS
+        now = datetime.now(timezone.utc)
+        start_time = time.perf_counter()
+        
+        # Only due alerts are claimed, with their associated user emails
+        due_alerts = claim_due_alerts(supabase, now, limit)
+        
+        if not due_alerts:
+            return {"message": "No alerts due", "alerts_processed": 0, "progress": load_progress(supabase)}
+        
+        # Listings already reported by the due alerts, loaded in bulk
+        seen_by_alert = seen_listings.load_seen_listings(supabase, [alert['id'] for alert in due_alerts])
+        
+        # One upstream search per distinct query instead of one per alert
+        groups = plan_alert_searches(due_alerts)
+        logger.info(f"Planned {len(groups)} searches for {len(due_alerts)} due alerts")
+        
+        if max_workers is None:
+            max_workers = ALERT_WORKERS
+        max_workers = max(1, min(max_workers, len(groups) or 1))
+        
+        deadline = start_time + time_budget
+        notifications = [] if digest else None
+        # Groups with the same query from different centers share their geo tile fetches;
+        # planning loads market prices, so it stops at the deadline like the searches
+        tile_cache = wallapop_endpoint_search.plan_tiles(
+            [group['search_params'] for group in groups], max_workers, deadline
+        )
+        outcomes = {}
+        pending = iter(enumerate(groups))
+        
+        # Groups are independent, so they run concurrently; each one is rescheduled as soon
+        # as it finishes, so a call cut short by a timeout keeps the work already done
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = {}
+            
+            def submit_next():
+                index, group = next(pending, (None, None))
+                if group is not None:
+                    future = executor.submit(run_alert_group, supabase, group, seen_by_alert, notifications, tile_cache)
+                    in_flight[future] = (index, group)
+            
+            for _ in range(max_workers):
+                submit_next()
+            
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, group = in_flight.pop(future)
+                    outcomes[index] = future.result()
+                    schedule_next_runs(supabase, group['alerts'], outcomes[index][0], now)
+                    if time.perf_counter() < deadline:
+                        submit_next()
         
-        if not alerts:
-            return {"message": "No alerts found", "alerts_processed": 0}
+        deferred_alerts = [alert for _, group in pending for alert in group['alerts']]
+        release_alerts(supabase, deferred_alerts, now)
+        
+        wall_time = time.perf_counter() - start_time
         
         processed_alerts = []
+        alert_latencies = {}
+        for index in sorted(outcomes):
+            group_results, latency = outcomes[index]
+            processed_alerts.extend(group_results)
+            for result in group_results:
+                alert_latencies[result['alert_id']] = round(latency, 3)
+        
+        logger.info(f"Processed {len(processed_alerts)} alerts in {wall_time:.2f}s with {max_workers} workers, "
+                    f"{len(deferred_alerts)} deferred to the next call")
         
-        for alert in alerts:
-            try:
-                # Get user email from the joined data
-                user_email = alert['users']['email']
-                
-                # Get the latest run for this alert
-                latest_run = supabase.table('alert_runs')\
-                    .select('*, market_data(*)')\
-                    .eq('alert_id', alert['id'])\
-                    .order('created_at', desc=True)\
-                    .limit(1)\
-                    .execute()
-                
-                should_run = True
-                previous_listing_ids = set()
-                if latest_run.data:
-                    last_run_time = datetime.fromisoformat(latest_run.data[0]['created_at'].replace('Z', '+00:00'))
-                    time_since_last_run = datetime.now(timezone.utc) - last_run_time
-                    should_run = time_since_last_run > timedelta(hours=23)
-                    # Get previous listing IDs from the market data
-                    if latest_run.data[0].get('market_data'):
-                        try:
-                            previous_listing_ids = {listing['id'] for listing in latest_run.data[0]['market_data'].get('listings', [])}
-                        except (KeyError, TypeError):
-                            logger.warning(f"Could not get previous listings for alert {alert['id']}")
-                            previous_listing_ids = set()
-                
-                if should_run:
-                    logger.info(f"Processing alert {alert['id']} for user {user_email}")
-                    
-                    # Prepare search parameters
-                    search_params = {
-                        'brand': alert['brand'],
-                        'model': alert['model'],
-                        'min_year': alert['min_year'],
-                        'max_year': alert['max_year'],
-                        'engine': alert['engine'].lower() if alert['engine'] else None,
-                        'min_horse_power': alert['min_horse_power'],
-                        'gearbox': alert['gearbox'].lower() if alert['gearbox'] else None,
-                        'latitude': alert['latitude'],
-                        'longitude': alert['longitude'],
-                        'distance': alert['distance'],
-                        'max_kilometers': alert['max_kilometers']
-                    }
-                    
-                    # Remove None values
-                    search_params = {k: v for k, v in search_params.items() if v is not None}
-                    
-                    # Perform search using the new endpoint search function
-                    logger.info(f"Running search for alert {alert['id']}")
-                    result = wallapop_endpoint_search.search_wallapop_endpoint(search_params)
-                    
-                    if result and not result.get('error'):
-                        # Transform listings to match frontend format
-                        transformed_listings = []
-                        new_listings = []  # Track new listings for notifications
-                        
-                        for listing in result.get('listings', []):
-                            try:
-                                listing_id = listing.get('listing_id')  # Use get() to safely access fields
-                                if not listing_id:
-                                    continue
-                                    
-                                # Check if this is a new listing
-                                is_new_listing = listing_id not in previous_listing_ids
-                                
-                                if is_new_listing:
-                                    new_listings.append(listing)
-                                transformed_listings.append(listing)
-                                
-                            except Exception as e:
-                                logger.error(f"Error processing listing in alert {alert['id']}: {str(e)}")
-                                continue
-                        
-                        # First create the market data entry
-                        market_data = result.get('market_data', {})
-                        market_data_entry = {
-                            'average_price': market_data.get('average_price', 0),
-                            'median_price': market_data.get('median_price', 0),
-                            'min_price': market_data.get('min_price', 0),
-                            'max_price': market_data.get('max_price', 0),
-                            'total_listings': market_data.get('total_listings', 0),
-                            'valid_listings': market_data.get('valid_listings', 0),
-                            'created_at': datetime.now(timezone.utc).isoformat()
-                        }
-                        
-                        # Insert market data and get its ID
-                        market_data_response = supabase.table('market_data').insert(market_data_entry).execute()
-                        market_data_id = market_data_response.data[0]['id']
-                        
-                        # Create alert run with reference to market data
-                        run_data = {
-                            'alert_id': alert['id'],
-                            'market_data_id': market_data_id,
-                            'created_at': datetime.now(timezone.utc).isoformat()
-                        }
-                        
-                        # Insert alert run
-                        supabase.table('alert_runs').insert(run_data).execute()
-                        
-                        # If there are new listings, send email notification
-                        if new_listings and alert.get('email_notifications', True):
-                            alert_info = {
-                                'brand': alert['brand'],
-                                'model': alert['model'],
-                                'id': alert['id']
-                            }
-                            send_email_notification(user_email, new_listings, alert_info)
-                        
-                        processed_alerts.append({
-                            'alert_id': alert['id'],
-                            'success': True,
-                            'listings_found': len(transformed_listings),
-                            'new_listings_found': len(new_listings),
-                            'market_data': market_data
-                        })
-                    else:
-                        error_message = result.get('error') if result else 'Search returned no results'
-                        processed_alerts.append({
-                            'alert_id': alert['id'],
-                            'success': False,
-                            'error': error_message
-                        })
-                else:
-                    logger.info(f"Skipping alert {alert['id']} - last run was less than 23 hours ago")
-                    
-            except Exception as e:
-                logger.error(f"Error processing alert {alert['id']}: {str(e)}")
-                processed_alerts.append({
-                    'alert_id': alert['id'],
-                    'success': False,
-                    'error': str(e)
-                })
+        digest_emails = send_digest_notifications(notifications) if digest else None
+        
+        processed_ids = set(alert_latencies)
+        last_processed = [alert for alert in due_alerts if alert['id'] in processed_ids]
+        remaining_due = count_due_alerts(supabase, now)
+        progress = save_progress(
+            supabase, len(processed_alerts),
+            last_processed[-1]['next_run_at'] if last_processed else None,
+            remaining_due, now
+        )
         
         return {
-            "message": "Alerts processing completed",
+            "message": "Alerts processing completed" if remaining_due == 0 else "Alerts processing in progress",
             "alerts_processed": len(processed_alerts),
-            "results": processed_alerts
+            "alerts_deferred": len(deferred_alerts),
+            "searches_run": len(outcomes),
+            "tile_fetches": tile_cache.stats if tile_cache else None,
+            "more_due": remaining_due > 0,
+            "digest_emails": digest_emails,
+            "progress": progress,
+            "results": processed_alerts,
+            "timing": {
+                "workers": max_workers,
+                "time_budget_seconds": time_budget,
+                "wall_time_seconds": round(wall_time, 3),
+                "max_alert_latency_seconds": max(alert_latencies.values(), default=0),
+                "alert_latency_seconds": alert_latencies
+            }
         }
             
     except Exception as e:
         logger.error(f"Error in process_alerts: {str(e)}")
-        return {"error": str(e)} 
\ No newline at end of file
+        return {"error": str(e)}
+
+def run_alert_loop(get_supabase, process=None, idle_seconds: Optional[float] = None, stop_event=None):
+    """
+    Process alerts continuously: call after call while work is due, then
+    sleep idle_seconds before polling the queue again.
+    """
+    if process is None:
+        process = process_alerts
+    if idle_seconds is None:
+        idle_seconds = ALERT_LOOP_IDLE_SECONDS
+    
+    while stop_event is None or not stop_event.is_set():
+        try:
+            result = process(get_supabase())
+            if result.get('error'):
+                logger.error(f"Alert loop iteration failed: {result['error']}")
+            elif result.get('more_due'):
+                continue
+        except Exception as e:
+            logger.error(f"Error in alert loop: {str(e)}")
+        
+        if stop_event is not None:
+            stop_event.wait(idle_seconds)
+        else:
+            time.sleep(idle_seconds)
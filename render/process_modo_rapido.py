@@ -1,18 +1,196 @@
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import logging
-from typing import Dict, Any
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+import geo_tiles
 import wallapop_endpoint_search
+from listing_record import ListingRecord, MODO_RAPIDO_FIELDS
 
 __all__ = ['process_modo_rapido_entries']
 
 logger = logging.getLogger(__name__)
 
-def format_price_text(price: float) -> str:
-    """Format price as text with euro symbol"""
-    return f"{price:,.0f} €".replace(",", ".")
+# Searches run concurrently during a modo rapido refresh
+MODO_RAPIDO_WORKERS = int(os.getenv("MODO_RAPIDO_WORKERS", "4"))
 
-def process_modo_rapido_entries(supabase):
-    """Process all modo_rapido entries and run searches"""
+# Entries refreshed more recently than this keep their last run unless forced.
+# Must stay below the 24h retention of modo_rapido_runs (see retention.py).
+REFRESH_MINUTES = float(os.getenv("MODO_RAPIDO_REFRESH_MINUTES", "60"))
+
+# Entries stored per store_modo_rapido_runs call
+STORE_CHUNK_SIZE = int(os.getenv("MODO_RAPIDO_STORE_CHUNK_SIZE", "25"))
+
+REQUIRED_FIELDS = ['marca', 'modelo', 'minimo', 'maximo', 'cv', 'combustible']
+
+# Map combustible values to Wallapop's expected values
+COMBUSTIBLE_MAPPING = {
+    'gasolina': 'gasoline',
+    'diesel': 'gasoil',
+    'diésel': 'gasoil',
+    'híbrido': 'hybrid',
+    'hibrido': 'hybrid',
+    'eléctrico': 'electric',
+    'electrico': 'electric'
+}
+
+def build_search_params(entry) -> Dict[str, Any]:
+    """Search parameters for a modo_rapido entry, using its Spanish column names"""
+    engine = entry['combustible'].lower()
+    engine = COMBUSTIBLE_MAPPING.get(engine, engine)
+    
+    search_params = {
+        'brand': entry['marca'],
+        'model': entry['modelo'],
+        'min_year': entry['minimo'],
+        'max_year': entry['maximo'],
+        'engine': engine,
+        'min_horse_power': entry['cv'] - 5,
+        'max_horse_power': entry['cv'] + 5,
+        'latitude': 41.3851,  # Default to Barcelona coordinates
+        'longitude': 2.1734,
+        'distance': 200,  # Default to 200km radius
+        'max_kilometers': 200000  # Max 200,000 km
+    }
+    
+    # Remove None values
+    return {k: v for k, v in search_params.items() if v is not None}
+
+def search_key(entry) -> tuple:
+    """Entries with the same key share one search within a run"""
+    return (
+        str(entry['marca']).strip().lower(),
+        str(entry['modelo']).strip().lower(),
+        entry['minimo'],
+        entry['maximo'],
+        entry['cv'],
+        COMBUSTIBLE_MAPPING.get(entry['combustible'].lower(), entry['combustible'].lower())
+    )
+
+def search_key_text(entry) -> str:
+    """search_key as stored in modo_rapido.refreshed_search_key"""
+    return '|'.join(str(part) for part in search_key(entry))
+
+def parse_timestamp(value) -> Optional[datetime]:
+    if not value:
+        return None
+    timestamp = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+def is_fresh(entry, now: datetime, refresh_minutes: float = REFRESH_MINUTES) -> bool:
+    """
+    Whether the entry's last run is recent enough to reuse. Changing the
+    entry's search parameters makes it stale straight away.
+    """
+    refreshed_at = parse_timestamp(entry.get('refreshed_at'))
+    return (
+        refreshed_at is not None
+        and entry.get('last_run_id') is not None
+        and entry.get('refreshed_search_key') == search_key_text(entry)
+        and now - refreshed_at < timedelta(minutes=refresh_minutes)
+    )
+
+def listing_rows(listings: List[ListingRecord]) -> List[Dict[str, Any]]:
+    """modo_rapido_listings rows for the search listings, without their run id"""
+    created_at = datetime.now(timezone.utc).isoformat()
+    rows = []
+    for listing in listings:
+        row = listing.to_dict(MODO_RAPIDO_FIELDS)
+        row['created_at'] = created_at
+        rows.append(row)
+    return rows
+
+def market_data_row(market_data: Dict[str, Any]) -> Dict[str, Any]:
+    """market_data row for a modo rapido run"""
+    return {
+        'average_price': market_data.get('average_price', 0),
+        'median_price': market_data.get('median_price', 0),
+        'min_price': market_data.get('min_price', 0),
+        'max_price': market_data.get('max_price', 0),
+        'total_listings': market_data.get('total_listings', 0),
+        'valid_listings': market_data.get('valid_listings', 0),
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }
+
+def store_runs(supabase, runs: List[Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+    """
+    Store the market data, run and listings of many entries with one
+    store_modo_rapido_runs call per chunk. Each call is a single transaction.
+    Returns modo_rapido_id -> stored ids, plus the store time of its chunk.
+    """
+    stored = {}
+    for i in range(0, len(runs), STORE_CHUNK_SIZE):
+        chunk = runs[i:i + STORE_CHUNK_SIZE]
+        start_time = time.perf_counter()
+        try:
+            response = supabase.rpc('store_modo_rapido_runs', {'runs': chunk}).execute()
+        except Exception as e:
+            logger.error(f"Error storing {len(chunk)} modo rapido runs: {str(e)}")
+            for run in chunk:
+                stored[run['modo_rapido_id']] = {'error': str(e)}
+            continue
+        store_seconds = time.perf_counter() - start_time
+        logger.info(f"Stored {len(chunk)} modo rapido runs in {store_seconds:.2f}s")
+        for row in response.data or []:
+            stored[row['modo_rapido_id']] = {**row, 'store_seconds': store_seconds}
+    return stored
+
+def process_entry_group(supabase, entries: List[Dict[str, Any]],
+                        tile_cache: Optional[geo_tiles.TileCache] = None) -> List[tuple]:
+    """
+    Run one search for entries sharing a search key. Returns (entry, result, run)
+    for each entry, where run is the payload to store or None if the search failed.
+    """
+    start_time = time.perf_counter()
+    search_params = build_search_params(entries[0])
+    logger.info(f"Search params for entries {[entry['id'] for entry in entries]}: {search_params}")
+    
+    try:
+        result = wallapop_endpoint_search.search_wallapop_endpoint(search_params, tile_cache)
+        error = None
+    except Exception as e:
+        logger.error(f"Error searching for entries {[entry['id'] for entry in entries]}: {str(e)}")
+        result, error = None, str(e)
+    search_seconds = time.perf_counter() - start_time
+    
+    timing = {'search_seconds': round(search_seconds, 3), 'shared_search': len(entries) > 1}
+    outcomes = []
+    for entry in entries:
+        if result and result.get('listings'):
+            market_data = result.get('market_data', {})
+            run = {
+                'modo_rapido_id': entry['id'],
+                'search_key': search_key_text(entry),
+                'market_data': market_data_row(market_data),
+                'listings': listing_rows(result['listings'])
+            }
+            processed = {
+                'modo_rapido_id': entry['id'],
+                'success': True,
+                'listings_found': len(run['listings']),
+                'market_data': market_data,
+                'timing': dict(timing)
+            }
+        else:
+            logger.info(f"No listings found for entry {entry['id']}")
+            run = None
+            processed = {
+                'modo_rapido_id': entry['id'],
+                'success': False,
+                'error': error or (result or {}).get('error') or 'Search returned no results',
+                'timing': dict(timing)
+            }
+        outcomes.append((entry, processed, run))
+    
+    return outcomes
+
+def process_modo_rapido_entries(supabase, max_workers: Optional[int] = None, force: bool = False,
+                                refresh_minutes: Optional[float] = None):
+    """
+    Process the modo_rapido entries, running one search per distinct search key
+    concurrently. Entries that are still fresh keep their last run unless force is set.
+    """
     try:
         # Get all modo_rapido entries
         entries_response = supabase.table('modo_rapido').select('*').execute()
@@ -22,168 +200,87 @@ def process_modo_rapido_entries(supabase):
             return {"message": "No modo_rapido entries found", "entries_processed": 0}
         
         logger.info(f"Found {len(entries)} modo_rapido entries to process")
-        processed_entries = []
-        successful_entries = 0
+        start_time = time.perf_counter()
+        if refresh_minutes is None:
+            refresh_minutes = REFRESH_MINUTES
+        now = datetime.now(timezone.utc)
         
+        groups = {}
+        fresh_results = {}
         for entry in entries:
-            try:
-                logger.info(f"Processing entry {entry['id']}: {entry['marca']} {entry['modelo']}")
-                
-                # Validate required fields
-                required_fields = ['marca', 'modelo', 'minimo', 'maximo', 'cv', 'combustible']
-                missing_fields = [field for field in required_fields if not entry.get(field)]
-                if missing_fields:
-                    logger.error(f"Entry {entry['id']} missing required fields: {missing_fields}")
-                    continue
-
-                # Map combustible values to Wallapop's expected values
-                combustible_mapping = {
-                    'gasolina': 'gasoline',
-                    'diesel': 'gasoil',
-                    'diésel': 'gasoil',
-                    'híbrido': 'hybrid',
-                    'hibrido': 'hybrid',
-                    'eléctrico': 'electric',
-                    'electrico': 'electric'
-                }
-                
-                engine = entry['combustible'].lower()
-                engine = combustible_mapping.get(engine, engine)
-                
-                # Prepare search parameters using Spanish column names
-                search_params = {
-                    'brand': entry['marca'],
-                    'model': entry['modelo'],
-                    'min_year': entry['minimo'],
-                    'max_year': entry['maximo'],
-                    'engine': engine,
-                    'min_horse_power': entry['cv'] - 5,
-                    'max_horse_power': entry['cv'] + 5,
-                    'latitude': 41.3851,  # Default to Barcelona coordinates
-                    'longitude': 2.1734,
-                    'distance': 200,  # Default to 200km radius
-                    'max_kilometers': 200000  # Max 200,000 km
+            # Validate required fields
+            missing_fields = [field for field in REQUIRED_FIELDS if not entry.get(field)]
+            if missing_fields:
+                logger.error(f"Entry {entry['id']} missing required fields: {missing_fields}")
+                continue
+            if not force and is_fresh(entry, now, refresh_minutes):
+                fresh_results[entry['id']] = {
+                    'modo_rapido_id': entry['id'],
+                    'success': True,
+                    'fresh': True,
+                    'refreshed_at': entry['refreshed_at'],
+                    'last_run_id': entry['last_run_id']
                 }
-                
-                logger.info(f"Search params for entry {entry['id']}: {search_params}")
-                
-                # Remove None values
-                search_params = {k: v for k, v in search_params.items() if v is not None}
-                
-                # Run the search
-                result = wallapop_endpoint_search.search_wallapop_endpoint(search_params)
-                
-                if result and result.get('listings'):
-                    # First, insert market data
-                    market_data = result.get('market_data', {})
-                    market_data_insert = {
-                        'average_price': market_data.get('average_price', 0),
-                        'median_price': market_data.get('median_price', 0),
-                        'min_price': market_data.get('min_price', 0),
-                        'max_price': market_data.get('max_price', 0),
-                        'total_listings': market_data.get('total_listings', 0),
-                        'valid_listings': market_data.get('valid_listings', 0),
-                        'created_at': datetime.now(timezone.utc).isoformat()
-                    }
-                    
-                    logger.info(f"Inserting market data for entry {entry['id']}")
-                    market_data_response = supabase.table('market_data').insert(market_data_insert).execute()
-                    if hasattr(market_data_response, 'error') and market_data_response.error:
-                        logger.error(f"Error inserting market data for entry {entry['id']}: {market_data_response.error}")
-                        continue
-                    
-                    market_data_id = market_data_response.data[0]['id']
-                    
-                    # Then, create modo_rapido_run
-                    run_data = {
+                continue
+            groups.setdefault(search_key(entry), []).append(entry)
+        
+        if fresh_results:
+            logger.info(f"Skipping {len(fresh_results)} entries refreshed in the last {refresh_minutes:g} minutes")
+        
+        if max_workers is None:
+            max_workers = MODO_RAPIDO_WORKERS
+        max_workers = max(1, min(max_workers, len(groups) or 1))
+        
+        # Only used when entries with the same query search from several centers
+        tile_cache = wallapop_endpoint_search.plan_tiles(
+            [build_search_params(group[0]) for group in groups.values()], max_workers
+        )
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            group_outcomes = list(executor.map(lambda group: process_entry_group(supabase, group, tile_cache), groups.values()))
+        outcomes = [outcome for group in group_outcomes for outcome in group]
+        
+        # All runs are written together, a handful of round trips for the whole refresh
+        stored = store_runs(supabase, [run for _, _, run in outcomes if run is not None])
+        
+        results_by_id = dict(fresh_results)
+        for entry, processed, run in outcomes:
+            if run is not None:
+                stored_run = stored.get(entry['id'], {'error': 'Run was not stored'})
+                if stored_run.get('error'):
+                    processed = {
                         'modo_rapido_id': entry['id'],
-                        'market_data_id': market_data_id,
-                        'created_at': datetime.now(timezone.utc).isoformat()
+                        'success': False,
+                        'error': stored_run['error'],
+                        'timing': processed['timing']
                     }
-                    
-                    logger.info(f"Creating modo_rapido_run for entry {entry['id']}")
-                    run_response = supabase.table('modo_rapido_runs').insert(run_data).execute()
-                    if hasattr(run_response, 'error') and run_response.error:
-                        logger.error(f"Error inserting run for entry {entry['id']}: {run_response.error}")
-                        continue
-                    
-                    run_id = run_response.data[0]['id']
-                    
-                    # Transform and insert listings
-                    listings_to_insert = []
-                    for listing in result['listings']:
-                        price = float(listing['price'])
-                        market_price = market_data.get('median_price', 0)
-                        price_difference = market_price - price
-                        price_difference_percentage = (price_difference / market_price * 100) if market_price > 0 else 0
-                        
-                        try:
-                            distance_km = round(float(listing.get('distance', 0)))
-                        except Exception as e:
-                            distance_km = 0
-                        
-                        listing_data = {
-                            'modo_rapido_run_id': run_id,
-                            'listing_id': listing['listing_id'],
-                            'title': listing['title'],
-                            'price': price,
-                            'price_text': listing['price_text'],
-                            'market_price': market_price,
-                            'market_price_text': format_price_text(market_price),
-                            'price_difference': round(price_difference, 2),
-                            'price_difference_percentage': f"{abs(price_difference_percentage):.1f}%",
-                            'location': listing['location'],
-                            'year': listing['year'],
-                            'kilometers': listing['kilometers'],
-                            'fuel_type': listing['fuel_type'],
-                            'transmission': listing['transmission'],
-                            'url': listing['url'],
-                            'horsepower': listing['horsepower'],
-                            'distance': distance_km,
-                            'listing_images': listing['listing_images'],
-                            'created_at': datetime.now(timezone.utc).isoformat()
-                        }
-                        listings_to_insert.append(listing_data)
-                    
-                    if listings_to_insert:
-                        logger.info(f"Inserting {len(listings_to_insert)} listings for run {run_id}")
-                        listing_response = supabase.table('modo_rapido_listings').insert(listings_to_insert).execute()
-                        if hasattr(listing_response, 'error') and listing_response.error:
-                            logger.error(f"Error inserting listings for run {run_id}: {listing_response.error}")
-                            continue
-                    
-                    successful_entries += 1
-                    logger.info(f"Successfully processed entry {entry['id']} with {len(listings_to_insert)} listings")
-                    
-                    processed_entries.append({
-                        'modo_rapido_id': entry['id'],
-                        'success': True,
-                        'listings_found': len(listings_to_insert),
-                        'market_data': market_data
-                    })
                 else:
-                    logger.info(f"No listings found for entry {entry['id']}")
-                    processed_entries.append({
-                        'modo_rapido_id': entry['id'],
-                        'success': False,
-                        'error': 'Search returned no results'
-                    })
-                    
-            except Exception as e:
-                logger.error(f"Error processing modo_rapido entry {entry['id']}: {str(e)}")
-                processed_entries.append({
-                    'modo_rapido_id': entry['id'],
-                    'success': False,
-                    'error': str(e)
-                })
+                    processed['timing']['store_seconds'] = round(stored_run['store_seconds'], 3)
+            results_by_id[entry['id']] = processed
+        processed_entries = [results_by_id[entry['id']] for entry in entries if entry['id'] in results_by_id]
+        successful_entries = sum(1 for result in processed_entries if result['success'])
+        wall_time = time.perf_counter() - start_time
+        
+        logger.info(f"Processed {len(processed_entries)} entries with {len(groups)} searches in {wall_time:.2f}s")
         
         return {
             "message": "Modo rapido processing completed",
             "entries_processed": len(processed_entries),
             "successful_entries": successful_entries,
-            "results": processed_entries
+            "entries_fresh": len(fresh_results),
+            "searches_run": len(groups),
+            "tile_fetches": tile_cache.stats if tile_cache else None,
+            "results": processed_entries,
+            "timing": {
+                "workers": max_workers,
+                "wall_time_seconds": round(wall_time, 3),
+                "max_entry_seconds": max(
+                    (result['timing']['search_seconds'] + result['timing'].get('store_seconds', 0)
+                     for result in processed_entries if 'timing' in result),
+                    default=0
+                )
+            }
         }
             
     except Exception as e:
         logger.error(f"Error in process_modo_rapido: {str(e)}")
-        return {"error": str(e)} 
\ No newline at end of file
+        return {"error": str(e)}
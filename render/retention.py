@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, List, Optional
+from supabase import Client
+
+__all__ = ['DEFAULT_POLICIES', 'load_policies', 'purge_table', 'run_retention']
+
+logger = logging.getLogger(__name__)
+
+# Rows deleted per request; each chunk is selected by key so every delete stays small
+CHUNK_SIZE = int(os.getenv("RETENTION_CHUNK_SIZE", "500"))
+
+# PostgREST caps responses at 1000 rows by default
+PAGE_SIZE = 1000
+
+# Retention policies in dependency order: rows referencing others are purged first.
+# Rows still referenced by one of referenced_by (table, column) are kept.
+DEFAULT_POLICIES = [
+    {
+        'table': 'modo_rapido_listings',
+        'column': 'created_at',
+        'max_age_hours': 24
+    },
+    {
+        'table': 'modo_rapido_runs',
+        'column': 'created_at',
+        'max_age_hours': 24,
+        'referenced_by': [('modo_rapido_listings', 'modo_rapido_run_id')]
+    },
+    {
+        'table': 'market_data',
+        'column': 'created_at',
+        'max_age_hours': 24,
+        'referenced_by': [('modo_rapido_runs', 'market_data_id'), ('alert_runs', 'market_data_id')]
+    },
+]
+
+def load_policies() -> List[Dict[str, Any]]:
+    """Retention policies from RETENTION_POLICIES (a JSON list), or the defaults"""
+    configured = os.getenv("RETENTION_POLICIES")
+    if not configured:
+        return DEFAULT_POLICIES
+    policies = json.loads(configured)
+    for policy in policies:
+        policy['referenced_by'] = [tuple(reference) for reference in policy.get('referenced_by', [])]
+    return policies
+
+def find_referenced(supabase: Client, ids: List[Any], references: List[tuple]) -> set:
+    """IDs among ids that are still referenced from another table"""
+    referenced = set()
+    for table, column in references:
+        remaining = [i for i in ids if i not in referenced]
+        if not remaining:
+            break
+        offset = 0
+        while True:
+            # Several rows may reference the same ID, so page through all of them
+            response = supabase.table(table)\
+                .select(column)\
+                .in_(column, remaining)\
+                .order(column)\
+                .range(offset, offset + PAGE_SIZE - 1)\
+                .execute()
+            referenced.update(row[column] for row in response.data)
+            if len(response.data) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+    return referenced
+
+def purge_table(supabase: Client, policy: Dict[str, Any], chunk_size: int = CHUNK_SIZE,
+                max_chunks: Optional[int] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Delete the expired rows of one table in bounded chunks, walking its key in order"""
+    table = policy['table']
+    key = policy.get('key', 'id')
+    now = now or datetime.now(timezone.utc)
+    cutoff = (now - timedelta(hours=policy['max_age_hours'])).isoformat()
+    logger.info(f"Purging {table} rows with {policy['column']} older than {cutoff}")
+
+    chunks = []
+    last_key = None
+    while max_chunks is None or len(chunks) < max_chunks:
+        start_time = time.perf_counter()
+        query = supabase.table(table).select(key).lt(policy['column'], cutoff)
+        if last_key is not None:
+            # Keyset pagination moves past rows kept because they are still referenced
+            query = query.gt(key, last_key)
+        rows = query.order(key).limit(chunk_size).execute().data
+        if not rows:
+            break
+
+        ids = [row[key] for row in rows]
+        last_key = ids[-1]
+        referenced = find_referenced(supabase, ids, policy.get('referenced_by', []))
+        deletable = [i for i in ids if i not in referenced]
+        if deletable:
+            supabase.table(table).delete().in_(key, deletable).execute()
+
+        chunk = {
+            'deleted': len(deletable),
+            'skipped': len(referenced),
+            'seconds': round(time.perf_counter() - start_time, 3)
+        }
+        chunks.append(chunk)
+        logger.info(f"{table} chunk {len(chunks)}: deleted {chunk['deleted']}, "
+                    f"kept {chunk['skipped']} referenced, {chunk['seconds']}s")
+
+        if len(rows) < chunk_size:
+            break
+
+    return {
+        'table': table,
+        'cutoff': cutoff,
+        'deleted': sum(chunk['deleted'] for chunk in chunks),
+        'skipped': sum(chunk['skipped'] for chunk in chunks),
+        'seconds': round(sum(chunk['seconds'] for chunk in chunks), 3),
+        'chunks': chunks
+    }
+
+def run_retention(supabase: Client, policies: Optional[List[Dict[str, Any]]] = None,
+                  chunk_size: int = CHUNK_SIZE, max_chunks: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Apply the retention policies in order; a failing table does not stop the others"""
+    now = datetime.now(timezone.utc)
+    reports = []
+    for policy in policies or load_policies():
+        try:
+            reports.append(purge_table(supabase, policy, chunk_size, max_chunks, now))
+        except Exception as e:
+            logger.error(f"Error purging {policy['table']}: {str(e)}", exc_info=True)
+            reports.append({'table': policy['table'], 'error': str(e)})
+    return reports
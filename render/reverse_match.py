@@ -0,0 +1,335 @@
+"""
+Reverse matching of alerts.
+
+Instead of one upstream search per alert, every cycle crawls the car listings
+published since the previous crawl and matches them against an index of all
+alerts, so the cost grows with the number of new listings rather than with the
+number of alerts. The matches are kept in the pending store (pending_matches)
+and priced and reported when their alert comes due.
+
+A due alert whose window reaches back before what the crawls matched it
+against runs its own search instead: an alert created since its previous run,
+or one whose window includes listings skipped by a crawl that stopped at its
+page limit (or preceded the first crawl).
+"""
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+
+import market_price
+import pending_matches
+import seen_listings
+import wallapop_endpoint_search
+from process_alerts import (
+    build_search_params, canonical_search_key, claim_due_alerts, haversine_km,
+    market_data_row, plan_alert_searches, record_alert_matches, run_alert_group,
+    schedule_next_runs, send_digest_notifications,
+    ALERT_BATCH_LIMIT, ALERT_DIGEST, DEFAULT_INTERVAL_HOURS, PROGRESS_TABLE
+)
+
+__all__ = ['AlertIndex', 'crawl_newest_listings', 'process_alerts_reverse']
+
+logger = logging.getLogger(__name__)
+
+CARS_SEARCH_URL = "https://api.wallapop.com/api/v3/cars/search"
+
+# Same value as api.OrderBy.NEWEST
+NEWEST = "newest"
+
+# Area covered by the crawl, centered on Spain by default
+CRAWL_LATITUDE = float(os.getenv("REVERSE_CRAWL_LATITUDE", str(wallapop_endpoint_search.SPAIN_CENTER['lat'])))
+CRAWL_LONGITUDE = float(os.getenv("REVERSE_CRAWL_LONGITUDE", str(wallapop_endpoint_search.SPAIN_CENTER['lng'])))
+CRAWL_DISTANCE_KM = int(os.getenv("REVERSE_CRAWL_DISTANCE_KM", "1000"))
+
+# Window of the first crawl, later ones start where the previous one started;
+# pages bound the crawl on busy days
+CRAWL_WINDOW_HOURS = float(os.getenv("REVERSE_CRAWL_WINDOW_HOURS", "24"))
+CRAWL_MAX_PAGES = int(os.getenv("REVERSE_CRAWL_MAX_PAGES", "50"))
+CRAWL_PAGE_SIZE = 40
+
+# Rows per page when loading the alerts past the PostgREST row cap
+PAGE_SIZE = 1000
+
+def normalize(value: Any) -> Optional[str]:
+    return str(value).strip().lower() if value not in (None, '') else None
+
+def crawl_newest_listings(since: datetime, max_pages: int = CRAWL_MAX_PAGES) -> Tuple[List[Dict[str, Any]], datetime]:
+    """
+    Fetch the listings published since a point in time, newest first. Returns
+    the listings and the time the crawl covers back to: since, or the creation
+    date of the oldest listing fetched when the page limit stopped it earlier.
+    """
+    since_ms = since.timestamp() * 1000
+    params = {
+        'category_ids': '100',
+        'order_by': NEWEST,
+        'latitude': format(CRAWL_LATITUDE, '.4f'),
+        'longitude': format(CRAWL_LONGITUDE, '.4f'),
+        'distance': str(CRAWL_DISTANCE_KM * 1000),  # Convert km to meters
+        'step': str(CRAWL_PAGE_SIZE)
+    }
+
+    contents = []
+    for page in range(max_pages):
+        params['start'] = str(page * CRAWL_PAGE_SIZE)
+        url = f"{CARS_SEARCH_URL}?{'&'.join(f'{k}={quote(str(v))}' for k, v in params.items())}"
+        response = requests.get(url)
+        response.raise_for_status()
+        search_objects = response.json().get('search_objects', [])
+
+        for listing in search_objects:
+            content = listing['content']
+            if content.get('creation_date', 0) < since_ms:
+                logger.info(f"Crawled {len(contents)} listings published since {since.isoformat()}")
+                return contents, since
+            contents.append(content)
+
+        if len(search_objects) < CRAWL_PAGE_SIZE:
+            logger.info(f"Crawled all {len(contents)} listings")
+            return contents, since
+
+    if not contents:
+        return contents, since
+    covered_since = datetime.fromtimestamp(contents[-1].get('creation_date', 0) / 1000, timezone.utc)
+    logger.warning(f"Crawl stopped at the page limit ({max_pages} pages, {len(contents)} listings) "
+                   f"back to {covered_since.isoformat()} instead of {since.isoformat()}")
+    return contents, covered_since
+
+def parse_time(value) -> Optional[datetime]:
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')) if value else None
+
+def previous_run(alert: Dict[str, Any]) -> datetime:
+    """When a due alert last ran, from its next_run_at and interval"""
+    return parse_time(alert['next_run_at']) - timedelta(hours=float(alert.get('run_interval_hours') or DEFAULT_INTERVAL_HOURS))
+
+def load_crawl_state(supabase) -> Dict[str, Any]:
+    """Start of the last crawl and end of the latest window a crawl skipped"""
+    response = supabase.table(PROGRESS_TABLE).select('*').eq('name', 'reverse_crawl').execute()
+    return response.data[0] if response.data else {}
+
+def save_crawl_state(supabase, crawled_at: datetime, gap_until: Optional[datetime]):
+    supabase.table(PROGRESS_TABLE).upsert({
+        'name': 'reverse_crawl',
+        'cycle_started_at': crawled_at.isoformat(),
+        'crawl_gap_until': gap_until.isoformat() if gap_until else None,
+        'updated_at': datetime.now(timezone.utc).isoformat()
+    }, on_conflict='name').execute()
+
+def load_alerts(supabase) -> List[Dict[str, Any]]:
+    """Every alert, paged past the PostgREST row cap"""
+    alerts = []
+    offset = 0
+    while True:
+        response = supabase.table('alertas').select('*').order('id').range(offset, offset + PAGE_SIZE - 1).execute()
+        alerts.extend(response.data)
+        if len(response.data) < PAGE_SIZE:
+            return alerts
+        offset += PAGE_SIZE
+
+def needs_search(alert: Dict[str, Any], gap_until: Optional[datetime]) -> bool:
+    """Whether a due alert's window reaches back before the listings the crawls matched it against"""
+    matched_since = max([time for time in (gap_until, parse_time(alert.get('created_at'))) if time], default=None)
+    return matched_since is not None and previous_run(alert) < matched_since
+
+class AlertIndex:
+    """
+    Alerts indexed by brand and model. Alerts without a model are kept
+    under (brand, None), so a listing is only checked against the alerts of
+    its own brand and model.
+    """
+
+    def __init__(self, alerts: List[Dict[str, Any]]):
+        self.buckets = defaultdict(list)
+        for alert in alerts:
+            self.buckets[(normalize(alert['brand']), normalize(alert.get('model')))].append(alert)
+
+    def candidates(self, content: Dict[str, Any]) -> List[Dict[str, Any]]:
+        brand = normalize(content.get('brand'))
+        model = normalize(content.get('model'))
+        return self.buckets.get((brand, model), []) + self.buckets.get((brand, None), [])
+
+    @staticmethod
+    def match(alert: Dict[str, Any], content: Dict[str, Any], kilometers: int) -> Optional[float]:
+        """Distance to the alert's center if the listing meets its criteria, else None"""
+        year = int(content.get('year') or 0)
+        if alert.get('min_year') and year < int(alert['min_year']):
+            return None
+        if alert.get('max_year') and year > int(alert['max_year']):
+            return None
+
+        if alert.get('min_horse_power'):
+            # Same horsepower range as the per-alert search
+            horsepower = float(content.get('horsepower') or 0)
+            min_hp = int(float(alert['min_horse_power']))
+            if horsepower < min_hp or horsepower > int(min_hp * 1.30):
+                return None
+
+        if alert.get('max_kilometers') and kilometers > int(alert['max_kilometers']):
+            return None
+        if alert.get('engine') and normalize(content.get('engine')) != normalize(alert['engine']):
+            return None
+        if alert.get('gearbox') and normalize(content.get('gearbox')) != normalize(alert['gearbox']):
+            return None
+
+        location = content.get('location') or {}
+        if alert.get('latitude') is None or alert.get('longitude') is None:
+            return 0.0
+        if location.get('latitude') is None or location.get('longitude') is None:
+            return None
+        distance = haversine_km(alert['latitude'], alert['longitude'], location['latitude'], location['longitude'])
+        if distance > (alert.get('distance') or 200):
+            return None
+        return distance
+
+def match_listings(index: AlertIndex, contents: List[Dict[str, Any]]) -> Dict[Any, List[tuple]]:
+    """alert_id -> [(content, kilometers, distance)] for every listing matching an alert"""
+    matched = defaultdict(list)
+    for content in contents:
+        candidates = index.candidates(content)
+        if not candidates:
+            continue
+        kilometers = wallapop_endpoint_search.get_valid_kilometers(content)
+        if kilometers is None:
+            continue
+        for alert in candidates:
+            distance = index.match(alert, content, kilometers)
+            if distance is not None:
+                matched[alert['id']].append((content, kilometers, distance))
+    return matched
+
+def bargain_listings(matches: List[tuple], market_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Transform the matches priced like the per-alert search (50-90% of the market average)"""
+    min_price = int(market_data['average_price'] * 0.50)
+    max_price = int(market_data['average_price'] * 0.90)
+    listings = []
+    for content, kilometers, distance in matches:
+        if not min_price <= float(content['price']) <= max_price:
+            continue
+        listing = wallapop_endpoint_search.transform_listing(content, kilometers, market_data['median_price'])
+        listing.distance = round(distance)
+        listings.append(listing)
+    return listings
+
+def crawl_and_match(supabase, now: datetime) -> Dict[str, Any]:
+    """
+    Crawl the listings published since the previous crawl, match them against
+    every alert and store the matches until the alerts come due
+    """
+    state = load_crawl_state(supabase)
+    last_crawl = parse_time(state.get('cycle_started_at'))
+    gap_until = parse_time(state.get('crawl_gap_until'))
+
+    since = last_crawl or now - timedelta(hours=CRAWL_WINDOW_HOURS)
+    contents, covered_since = crawl_newest_listings(since)
+    if last_crawl is None or covered_since > since:
+        # Listings before covered_since were never matched
+        gap_until = max(gap_until, covered_since) if gap_until else covered_since
+
+    alerts = load_alerts(supabase)
+    matched = match_listings(AlertIndex(alerts), contents)
+    stored = pending_matches.save_pending_matches(supabase, matched)
+    logger.info(f"{len(contents)} new listings matched {len(matched)} of {len(alerts)} alerts")
+
+    save_crawl_state(supabase, now, gap_until)
+    return {
+        'listings_crawled': len(contents),
+        'crawl_complete': covered_since <= since,
+        'crawled_since': covered_since.isoformat(),
+        'alerts_indexed': len(alerts),
+        'matches_stored': stored,
+        'gap_until': gap_until
+    }
+
+def process_alerts_reverse(supabase, limit: Optional[int] = None, digest: Optional[bool] = None):
+    """Match the new listings against every alert, then report the pending matches of the due alerts"""
+    try:
+        if limit is None:
+            limit = ALERT_BATCH_LIMIT
+        if digest is None:
+            digest = ALERT_DIGEST
+        now = datetime.now(timezone.utc)
+
+        crawl = crawl_and_match(supabase, now)
+        gap_until = crawl.pop('gap_until')
+
+        due_alerts = claim_due_alerts(supabase, now, limit)
+        if not due_alerts:
+            return {"message": "No alerts due", "mode": "reverse", "alerts_processed": 0, **crawl}
+
+        # Alerts whose window the crawls did not fully match run their own search
+        searched_alerts = [alert for alert in due_alerts if needs_search(alert, gap_until)]
+        searched_ids = {alert['id'] for alert in searched_alerts}
+        reported_alerts = [alert for alert in due_alerts if alert['id'] not in searched_ids]
+        matched = pending_matches.load_pending_matches(supabase, [alert['id'] for alert in reported_alerts])
+
+        # Market prices are only needed for alerts with matches, once per distinct query
+        market_by_key = {}
+        alert_matches = []
+        results = []
+        notifications = [] if digest else None
+        for alert in reported_alerts:
+            if alert['id'] not in matched:
+                results.append({'alert_id': alert['id'], 'success': True, 'listings_found': 0, 'new_listings_found': 0})
+                continue
+
+            search_params = build_search_params(alert)
+            key = canonical_search_key(search_params)
+            if key not in market_by_key:
+                market_by_key[key] = market_price.get_market_price(search_params)
+            market_data = market_by_key[key]
+
+            if not market_data:
+                results.append({'alert_id': alert['id'], 'success': False, 'error': 'Could not determine market price'})
+                continue
+
+            alert_matches.append({
+                'alert': alert,
+                'key': key,
+                'listings': bargain_listings(matched[alert['id']], market_data),
+                'market_data': market_data
+            })
+
+        if alert_matches:
+            # One market_data row per distinct query, inserted in a single request
+            keys = list({match['key']: None for match in alert_matches})
+            rows = [market_data_row(market_by_key[key]) for key in keys]
+            inserted = supabase.table('market_data').insert(rows).execute().data
+            market_data_ids = {key: row['id'] for key, row in zip(keys, inserted)}
+            for match in alert_matches:
+                match['market_data_id'] = market_data_ids[match['key']]
+
+            seen_by_alert = seen_listings.load_seen_listings(supabase, [match['alert']['id'] for match in alert_matches])
+            results.extend(record_alert_matches(supabase, alert_matches, seen_by_alert, notifications))
+
+        if searched_alerts:
+            logger.info(f"Searching {len(searched_alerts)} alerts the crawls did not fully match")
+            seen_by_alert = seen_listings.load_seen_listings(supabase, list(searched_ids))
+            for group in plan_alert_searches(searched_alerts):
+                results.extend(run_alert_group(supabase, group, seen_by_alert, notifications)[0])
+
+        if digest:
+            send_digest_notifications(notifications)
+
+        # Reported matches are forgotten; those of failed alerts wait for their retry
+        pending_matches.clear_pending_matches(supabase, [result['alert_id'] for result in results if result.get('success')])
+        schedule_next_runs(supabase, due_alerts, results, now)
+
+        return {
+            "message": "Alerts processing completed",
+            "mode": "reverse",
+            "alerts_processed": len(results),
+            **crawl,
+            "alerts_matched": len(alert_matches),
+            "alerts_searched": len(searched_alerts),
+            "more_due": len(due_alerts) == limit,
+            "results": results
+        }
+
+    except Exception as e:
+        logger.error(f"Error in process_alerts_reverse: {str(e)}")
+        return {"error": str(e)}
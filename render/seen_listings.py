@@ -0,0 +1,71 @@
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Iterable
+from supabase import Client
+
+__all__ = ['load_seen_listings', 'find_new_listing_ids', 'update_seen_listings', 'save_seen_listings']
+
+logger = logging.getLogger(__name__)
+
+SEEN_TABLE = 'alert_seen_listings'
+
+# Keep in_() filters short enough for the PostgREST query string
+LOOKUP_CHUNK_SIZE = 200
+
+# Listings not seen again within the TTL are forgotten, and each alert keeps at most MAX_IDS
+SEEN_TTL_DAYS = int(os.getenv("SEEN_LISTINGS_TTL_DAYS", "30"))
+SEEN_MAX_IDS = int(os.getenv("SEEN_LISTINGS_MAX_IDS", "2000"))
+
+def today() -> int:
+    """Current day number, the resolution at which last-seen times are stored"""
+    return int(datetime.now(timezone.utc).timestamp() // 86400)
+
+def load_seen_listings(supabase: Client, alert_ids: List[Any]) -> Dict[Any, Dict[str, int]]:
+    """Fetch the seen listings of many alerts, as alert_id -> {listing_id: last seen day}"""
+    seen = {}
+    for i in range(0, len(alert_ids), LOOKUP_CHUNK_SIZE):
+        chunk = alert_ids[i:i + LOOKUP_CHUNK_SIZE]
+        response = supabase.table(SEEN_TABLE)\
+            .select('alert_id,listing_ids,last_seen')\
+            .in_('alert_id', chunk)\
+            .execute()
+        for row in response.data:
+            seen[row['alert_id']] = dict(zip(row['listing_ids'] or [], row['last_seen'] or []))
+    return seen
+
+def find_new_listing_ids(seen: Dict[str, int], listing_ids: Iterable[str]) -> set:
+    """Listing IDs that the alert has not reported before"""
+    return set(listing_ids) - seen.keys()
+
+def update_seen_listings(seen: Dict[str, int], listing_ids: Iterable[str], day: int = None) -> Dict[str, int]:
+    """Mark listings as seen today, dropping expired entries and the oldest beyond the cap"""
+    if day is None:
+        day = today()
+    cutoff = day - SEEN_TTL_DAYS
+    updated = {listing_id: last_seen for listing_id, last_seen in seen.items() if last_seen > cutoff}
+    for listing_id in listing_ids:
+        updated[listing_id] = day
+
+    if len(updated) > SEEN_MAX_IDS:
+        newest = sorted(updated.items(), key=lambda item: item[1], reverse=True)[:SEEN_MAX_IDS]
+        updated = dict(newest)
+    return updated
+
+def seen_row(alert_id: Any, seen: Dict[str, int]) -> Dict[str, Any]:
+    """Row storing the seen listings of one alert as sorted parallel arrays"""
+    listing_ids = sorted(seen)
+    return {
+        'alert_id': alert_id,
+        'listing_ids': listing_ids,
+        'last_seen': [seen[listing_id] for listing_id in listing_ids],
+        'updated_at': datetime.now(timezone.utc).isoformat()
+    }
+
+def save_seen_listings(supabase: Client, seen_by_alert: Dict[Any, Dict[str, int]]):
+    """Upsert the seen listings of many alerts in one request"""
+    if not seen_by_alert:
+        return
+    rows = [seen_row(alert_id, seen) for alert_id, seen in seen_by_alert.items()]
+    supabase.table(SEEN_TABLE).upsert(rows, on_conflict='alert_id').execute()
+    logger.info(f"Saved seen listings for {len(rows)} alerts")
@@ -0,0 +1,12 @@
+-- Listings matched to an alert by the reverse crawl and not yet reported.
+-- Every crawl matches its new listings against all alerts and stores them here;
+-- reverse_match prices and reports them when the alert comes due, then clears them.
+create table if not exists alert_pending_matches (
+    alert_id bigint not null references alertas (id) on delete cascade,
+    listing_id text not null,
+    content jsonb not null,
+    kilometers integer not null,
+    distance numeric not null,
+    matched_at timestamptz not null default now(),
+    primary key (alert_id, listing_id)
+);
@@ -0,0 +1,17 @@
+-- Cursor of the alert processing cycle, written by process_alerts.save_progress.
+-- The queue itself is alertas.next_run_at: processed alerts move forward and
+-- claimed ones are leased for ALERT_LEASE_MINUTES, so a call that times out only
+-- delays the alerts it had not finished.
+-- reverse_match keeps a 'reverse_crawl' row whose cycle_started_at is the start
+-- of the last crawl; crawl_gap_until is the oldest listing time reached by the
+-- latest crawl that stopped at its page limit.
+create table if not exists alert_processing_state (
+    name text primary key,
+    cycle_started_at timestamptz not null,
+    processed_in_cycle integer not null default 0,
+    last_next_run_at timestamptz,
+    remaining_due integer not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+alter table alert_processing_state add column if not exists crawl_gap_until timestamptz;
@@ -0,0 +1,16 @@
+-- Per-alert scheduling: process_alerts loads only the alerts whose next_run_at
+-- has passed, most overdue first, and moves it forward by run_interval_hours.
+alter table alertas add column if not exists next_run_at timestamptz not null default now();
+alter table alertas add column if not exists run_interval_hours numeric not null default 23;
+
+create index if not exists alertas_next_run_at_idx on alertas (next_run_at);
+
+-- Existing alerts keep their cadence from their latest run
+update alertas a
+set next_run_at = r.last_run + a.run_interval_hours * interval '1 hour'
+from (
+    select alert_id, max(created_at) as last_run
+    from alert_runs
+    group by alert_id
+) r
+where r.alert_id = a.id;
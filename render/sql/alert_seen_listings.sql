@@ -0,0 +1,9 @@
+-- Listings already reported by each alert, one compact row per alert.
+-- listing_ids is sorted and last_seen holds the matching day numbers (days since
+-- epoch); seen_listings.update_seen_listings applies the TTL and per-alert cap.
+create table if not exists alert_seen_listings (
+    alert_id bigint primary key references alertas (id) on delete cascade,
+    listing_ids text[] not null default '{}',
+    last_seen integer[] not null default '{}',
+    updated_at timestamptz not null default now()
+);
@@ -0,0 +1,9 @@
+-- Fingerprint of the last upstream result written for each coches model.
+-- wallapop_api_cars.main skips filtering and all writes when it is unchanged.
+create table if not exists car_search_fingerprints (
+    model_key text primary key,
+    fingerprint text not null,
+    search_id text,
+    listing_count integer not null default 0,
+    updated_at timestamptz not null default now()
+);
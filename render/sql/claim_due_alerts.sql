@@ -0,0 +1,35 @@
+-- Claim the alerts whose next_run_at has passed, most overdue first, in one
+-- statement: the rows are locked with skip locked and leased until lease_until,
+-- so concurrent calls never claim the same alert.
+--
+-- Returns the claimed alerts with the next_run_at they were due at and the
+-- email of their user, like select('*, users!inner(email)') on alertas.
+create or replace function claim_due_alerts(run_at timestamptz, lease_until timestamptz, batch_limit integer)
+returns jsonb
+language sql volatile as $$
+    with due as (
+        select a.id, a.next_run_at
+        from alertas a
+        join users u on u.id = a.user_id
+        where a.next_run_at <= run_at
+        order by a.next_run_at
+        limit batch_limit
+        for update of a skip locked
+    ), claimed as (
+        update alertas a
+        set next_run_at = lease_until
+        from due
+        where a.id = due.id
+        returning a.*, due.next_run_at as due_at
+    )
+    select coalesce(
+        jsonb_agg(
+            (to_jsonb(c) - 'due_at')
+            || jsonb_build_object('next_run_at', c.due_at, 'users', jsonb_build_object('email', u.email))
+            order by c.due_at
+        ),
+        '[]'::jsonb
+    )
+    from claimed c
+    join users u on u.id = c.user_id
+$$;
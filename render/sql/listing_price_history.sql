@@ -0,0 +1,51 @@
+-- Compact per-listing time series written by price_history.record_price_observations.
+-- A point is only appended when price, km or modification_date changed, and the
+-- table is not part of the nightly clear_tables truncation.
+create table if not exists listing_price_history (
+    id bigint generated always as identity primary key,
+    external_id text not null,
+    price numeric not null,
+    km integer,
+    modification_date bigint,
+    observed_at timestamptz not null default now()
+);
+
+create index if not exists listing_price_history_external_id_observed_at_idx
+    on listing_price_history (external_id, observed_at desc);
+
+create index if not exists listing_price_history_observed_at_idx
+    on listing_price_history (observed_at);
+
+-- Latest point per listing, used to deduplicate unchanged observations
+create or replace view listing_price_latest as
+select distinct on (external_id) external_id, price, km, modification_date, observed_at
+from listing_price_history
+order by external_id, observed_at desc;
+
+-- Price drops recorded since a point in time
+create or replace function listing_price_drops(since timestamptz, min_drop numeric default 0)
+returns table (
+    external_id text,
+    previous_price numeric,
+    current_price numeric,
+    price_drop numeric,
+    km integer,
+    dropped_at timestamptz
+)
+language sql stable as $$
+    select external_id, previous_price, current_price, previous_price - current_price, km, observed_at
+    from (
+        select h.external_id,
+               lag(h.price) over (partition by h.external_id order by h.observed_at) as previous_price,
+               h.price as current_price,
+               h.km,
+               h.observed_at
+        from listing_price_history h
+        where h.external_id in (
+            select external_id from listing_price_history where observed_at >= since
+        )
+    ) points
+    where observed_at >= since
+      and previous_price > current_price
+      and previous_price - current_price >= min_drop
+$$;
@@ -0,0 +1,18 @@
+-- Every market price estimate computed by market_price.get_market_price.
+-- Recent rows for the same query_key are served instead of re-fetching the market.
+create table if not exists market_price_history (
+    id bigint generated always as identity primary key,
+    query_key text not null,
+    search_parameters jsonb not null,
+    average_price numeric not null,
+    median_price numeric not null,
+    min_price numeric not null,
+    max_price numeric not null,
+    total_listings integer not null,
+    valid_listings integer not null,
+    search_url text,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists market_price_history_query_key_created_at_idx
+    on market_price_history (query_key, created_at desc);
@@ -0,0 +1,7 @@
+-- Per-entry freshness for modo rapido: entries refreshed less than
+-- MODO_RAPIDO_REFRESH_MINUTES ago with the same search parameters keep their
+-- last run instead of being searched again. store_modo_rapido_runs() sets
+-- these columns when it stores a run.
+alter table modo_rapido add column if not exists refreshed_at timestamptz;
+alter table modo_rapido add column if not exists refreshed_search_key text;
+alter table modo_rapido add column if not exists last_run_id bigint references modo_rapido_runs (id) on delete set null;
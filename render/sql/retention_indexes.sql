@@ -0,0 +1,9 @@
+-- Indexes used by the retention job (retention.py): the age filter on each
+-- purged table and the reference checks that keep rows still in use.
+create index if not exists modo_rapido_listings_created_at_idx on modo_rapido_listings (created_at);
+create index if not exists modo_rapido_runs_created_at_idx on modo_rapido_runs (created_at);
+create index if not exists market_data_created_at_idx on market_data (created_at);
+
+create index if not exists modo_rapido_listings_modo_rapido_run_id_idx on modo_rapido_listings (modo_rapido_run_id);
+create index if not exists modo_rapido_runs_market_data_id_idx on modo_rapido_runs (market_data_id);
+create index if not exists alert_runs_market_data_id_idx on alert_runs (market_data_id);
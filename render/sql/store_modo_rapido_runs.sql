@@ -0,0 +1,58 @@
+-- Store the market_data, modo_rapido_runs and modo_rapido_listings rows of many
+-- modo rapido entries in one call. The function runs in a single transaction, so
+-- a failure leaves no orphaned market_data or runs behind.
+--
+-- The entry's freshness columns (modo_rapido_freshness.sql) are updated in the
+-- same transaction, so an entry is only marked fresh once its run is stored.
+--
+-- runs: [{"modo_rapido_id": ..., "search_key": "...", "market_data": {...}, "listings": [{...}, ...]}, ...]
+create or replace function store_modo_rapido_runs(runs jsonb)
+returns jsonb
+language plpgsql as $$
+declare
+    run jsonb;
+    new_market_data_id market_data.id%type;
+    new_run_id modo_rapido_runs.id%type;
+    listing_count integer;
+    stored jsonb := '[]'::jsonb;
+begin
+    for run in select value from jsonb_array_elements(runs) loop
+        insert into market_data (average_price, median_price, min_price, max_price, total_listings, valid_listings, created_at)
+        select m.average_price, m.median_price, m.min_price, m.max_price, m.total_listings, m.valid_listings,
+               coalesce(m.created_at, now())
+        from jsonb_populate_record(null::market_data, run->'market_data') m
+        returning id into new_market_data_id;
+
+        insert into modo_rapido_runs (modo_rapido_id, market_data_id, created_at)
+        select r.modo_rapido_id, new_market_data_id, now()
+        from jsonb_populate_record(null::modo_rapido_runs, run) r
+        returning id into new_run_id;
+
+        insert into modo_rapido_listings (
+            modo_rapido_run_id, listing_id, title, price, price_text, market_price, market_price_text,
+            price_difference, price_difference_percentage, location, year, kilometers, fuel_type,
+            transmission, url, horsepower, distance, listing_images, created_at
+        )
+        select new_run_id, l.listing_id, l.title, l.price, l.price_text, l.market_price, l.market_price_text,
+               l.price_difference, l.price_difference_percentage, l.location, l.year, l.kilometers, l.fuel_type,
+               l.transmission, l.url, l.horsepower, l.distance, l.listing_images, coalesce(l.created_at, now())
+        from jsonb_populate_recordset(null::modo_rapido_listings, run->'listings') l;
+        get diagnostics listing_count = row_count;
+
+        update modo_rapido
+        set refreshed_at = now(),
+            refreshed_search_key = run->>'search_key',
+            last_run_id = new_run_id
+        where id = (select r.modo_rapido_id from jsonb_populate_record(null::modo_rapido_runs, run) r);
+
+        stored := stored || jsonb_build_array(jsonb_build_object(
+            'modo_rapido_id', run->'modo_rapido_id',
+            'market_data_id', new_market_data_id,
+            'run_id', new_run_id,
+            'listings', listing_count
+        ));
+    end loop;
+
+    return stored;
+end;
+$$;
@@ -1,10 +1,14 @@
 import requests
+import hashlib
 from datetime import datetime
 import os
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import logging
 from urllib.parse import quote
+import market_price
+import price_history
+import memory_supabase
 
 # Load environment variables
 load_dotenv()
@@ -17,8 +21,24 @@ UNWANTED_KEYWORDS = [
     'gripada', 'despiece', 'no arranca', 'averiado', 'cambiar motor', '¡No contesto mensajes!', 'averiada', '647 358 133', 'mallorca', 'palma'
 ]
 
+# Per-model result fingerprints; unchanged models skip filtering and DB writes
+FINGERPRINT_TABLE = 'car_search_fingerprints'
+
+# Truncate all crawl tables and rewrite every model instead of skipping unchanged ones
+FULL_REFRESH = os.getenv("CRAWL_FULL_REFRESH", "false").lower() == "true"
+
+# PostgREST caps responses at 1000 rows by default
+PAGE_SIZE = 1000
+
+# Center point used for the batch crawl searches
+CRAWL_LATITUDE = '41.224151'
+CRAWL_LONGITUDE = '1.7255678'
+
 def init_supabase() -> Client:
     """Initialize Supabase client"""
+    if memory_supabase.use_memory_backend():
+        return memory_supabase.get_client()
+    
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_KEY")
     
@@ -73,6 +93,7 @@ def insert_search_results(supabase: Client, search_params, listings):
         # Prepare batch data
         new_listings_data = []
         images_data = []
+        price_observations = []
         
         # Get all existing external_ids in one query
         external_ids = [listing['content']['id'] for listing in listings]
@@ -113,6 +134,8 @@ def insert_search_results(supabase: Client, search_params, listings):
                 stats['filtered_listings'] += 1
                 continue
             
+            price_observations.append(price_history.observation_from_content(content, kilometers))
+            
             if external_id in existing_ids:
                 logger.info(f"Listing {external_id} already exists, skipping...")
                 stats['existing_listings'] += 1
@@ -182,12 +205,16 @@ def insert_search_results(supabase: Client, search_params, listings):
                     logger.info(f"Inserting batch of {len(chunk)} images...")
                     supabase.table('car_images').insert(chunk).execute()
         
+        # Track price changes for every valid listing, including ones already stored
+        stats['price_points_recorded'] = price_history.record_price_observations(supabase, price_observations)
+        
         logger.info(f"Search results summary:")
         logger.info(f"- New listings: {stats['new_listings']}")
         logger.info(f"- Existing listings: {stats['existing_listings']}")
         logger.info(f"- Filtered listings: {stats['filtered_listings']}")
         logger.info(f"- Failed listings: {stats['failed_listings']}")
         logger.info(f"- Images inserted: {stats['images_inserted']}")
+        logger.info(f"- Price points recorded: {stats['price_points_recorded']}")
         
         return search_id
         
@@ -241,8 +268,8 @@ def search_wallapop_cars(car, market_data):
         search_params = {
             'keywords': car['modelo'],
             'brand': car['marca'],
-            'latitude': '41.224151',
-            'longitude': '1.7255678',
+            'latitude': CRAWL_LATITUDE,
+            'longitude': CRAWL_LONGITUDE,
             'category_ids': '100',
             'distance': '200000',
             'min_year': start_year,
@@ -329,8 +356,8 @@ def insert_images_batch(supabase: Client, listing_id: str, images: list):
     if image_data:
         supabase.table('car_images').insert(image_data).execute()
 
-def get_market_price(car):
-    """Get market price using relevance-based search"""
+def get_market_price(car, supabase: Client = None):
+    """Get market price from the shared market price service"""
     try:
         # Parse year range
         year_range = car['ano_fabricacion']
@@ -340,64 +367,34 @@ def get_market_price(car):
             start_year, end_year = year_range.split('-')
         else:
             start_year = end_year = year_range
-            
-        # Build search URL for market analysis
-        base_url = "https://api.wallapop.com/api/v3/cars/search"
-        search_params = {
-            'model': car['modelo'],
+
+        params = {
             'brand': car['marca'],
-            'latitude': '41.224151',
-            'longitude': '1.7255678',
-            'category_ids': '100',
-            'distance': '100000',
+            'model': car['modelo'],
             'min_year': start_year.strip(),
             'max_year': end_year.strip(),
-            'max_km': '200000',
-            'order_by': 'price_low_to_high',
-            'min_sale_price': '3000',
+            'latitude': CRAWL_LATITUDE,
+            'longitude': CRAWL_LONGITUDE,
+            'distance': 100,
+            'max_kilometers': 200000
         }
 
         # Add engine type if specified
         if 'combustible' in car:
             if car['combustible'] == 'Diésel':
-                search_params['engine'] = 'gasoil'
+                params['engine'] = 'gasoil'
             elif car['combustible'] == 'Gasolina':
-                search_params['engine'] = 'gasoline'
-
-        url = f"{base_url}?{'&'.join(f'{k}={quote(str(v))}' for k, v in search_params.items())}"
-        logger.info(f"\nMarket price search URL: {url}")
-        
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Filter and process listings
-        valid_prices = []
-        for listing in data.get('search_objects', [])[:15]:  # Only use first 20 listings
-            content = listing['content']
-            
-            # Apply same filtering as main search
-            kilometers = int(content['km'])
-            if kilometers < 1000 and kilometers >= 200:
-                kilometers *= 1000
-            elif kilometers <= 200 or kilometers > 200000:
-                continue
-
-            # Skip unwanted listings
-            if has_unwanted_keywords(content['title'], UNWANTED_KEYWORDS) or \
-               has_unwanted_keywords(content.get('storytelling', ''), UNWANTED_KEYWORDS):
-                continue
+                params['engine'] = 'gasoline'
 
-            valid_prices.append(float(content['price']))
-
-        if valid_prices:
-            avg_price = sum(valid_prices) / len(valid_prices)
-            market_price = avg_price * 0.9  # 90% of average price
+        market_data = market_price.get_market_price(params, supabase)
+        if market_data:
+            avg_price = market_data['average_price']
+            market_price_value = avg_price * 0.9  # 90% of average price
             return {
-                'market_price': market_price,
-                'sample_size': len(valid_prices),
-                'min_price': market_price * 0.5,
-                'max_price': market_price,
+                'market_price': market_price_value,
+                'sample_size': market_data['valid_listings'],
+                'min_price': market_price_value * 0.5,
+                'max_price': market_price_value,
                 'raw_average': avg_price
             }
         return None
@@ -425,14 +422,16 @@ def insert_market_price(supabase: Client, search_id: str, market_data: dict):
         }
         supabase.table('car_market_price').insert(data).execute()
         logger.info(f"Inserted market price data for search {search_id}")
+        return True
     except Exception as e:
         logger.error(f"Error inserting market price: {str(e)}", exc_info=True)
+        return False
 
 def clear_tables(supabase: Client):
     """Clear all data from tables we're writing to"""
     try:
         # Delete in correct order to respect foreign key constraints
-        tables = ['car_images', 'car_market_price', 'car_listings', 'car_searches']
+        tables = ['car_images', 'car_market_price', 'car_listings', 'car_searches', FINGERPRINT_TABLE]
         for table in tables:
             logger.info(f"Clearing table: {table}")
             # Use RPC call to truncate table
@@ -441,12 +440,97 @@ def clear_tables(supabase: Client):
     except Exception as e:
         logger.error(f"Error clearing tables: {str(e)}")
 
-def main():
+def get_model_key(car):
+    """Key identifying one coches entry across crawls"""
+    return '|'.join(str(car.get(field, '')).strip().lower() for field in ['marca', 'modelo', 'ano_fabricacion', 'combustible'])
+
+def compute_result_fingerprint(listings):
+    """Fingerprint an upstream result from its sorted listing IDs and modification dates"""
+    entries = sorted(f"{listing['content']['id']}:{listing['content'].get('modification_date', '')}" for listing in listings)
+    return hashlib.sha1('\n'.join(entries).encode('utf-8')).hexdigest()
+
+def load_fingerprints(supabase: Client):
+    """Load the fingerprint and search ID stored for every model by the previous crawl"""
+    try:
+        response = supabase.table(FINGERPRINT_TABLE).select('model_key,fingerprint,search_id').execute()
+        return {row['model_key']: row for row in response.data}
+    except Exception as e:
+        logger.error(f"Error loading result fingerprints: {str(e)}")
+        return {}
+
+def save_fingerprint(supabase: Client, model_key, fingerprint, search_id, listing_count):
+    """Store the fingerprint of the result just written for a model"""
+    try:
+        supabase.table(FINGERPRINT_TABLE).upsert({
+            'model_key': model_key,
+            'fingerprint': fingerprint,
+            'search_id': search_id,
+            'listing_count': listing_count,
+            'updated_at': datetime.now().isoformat()
+        }, on_conflict='model_key').execute()
+        return True
+    except Exception as e:
+        logger.error(f"Error saving result fingerprint for {model_key}: {str(e)}")
+        return False
+
+def clear_search_results(supabase: Client, search_id):
+    """Remove the rows written for a previous search so the model can be rewritten"""
+    try:
+        listings = supabase.table('car_listings').select('id').eq('search_id', search_id).execute()
+        listing_ids = [row['id'] for row in listings.data]
+        if listing_ids:
+            supabase.table('car_images').delete().in_('listing_id', listing_ids).execute()
+        supabase.table('car_listings').delete().eq('search_id', search_id).execute()
+        supabase.table('car_market_price').delete().eq('search_id', search_id).execute()
+        supabase.table('car_searches').delete().eq('id', search_id).execute()
+    except Exception as e:
+        logger.error(f"Error clearing previous results for search {search_id}: {str(e)}")
+
+def load_search_ids(supabase: Client):
+    """IDs of every car_searches row, paged past the PostgREST row cap"""
+    search_ids = []
+    offset = 0
+    while True:
+        response = supabase.table('car_searches').select('id').order('id').range(offset, offset + PAGE_SIZE - 1).execute()
+        search_ids.extend(row['id'] for row in response.data)
+        if len(response.data) < PAGE_SIZE:
+            return search_ids
+        offset += PAGE_SIZE
+
+def prune_stale_results(supabase: Client, kept_search_ids, refreshed_keys):
+    """
+    Remove the results of every model not refreshed by this crawl: models whose
+    search failed or returned nothing, and models dropped from coches.
+    """
+    try:
+        stale_ids = [search_id for search_id in load_search_ids(supabase) if search_id not in kept_search_ids]
+        for search_id in stale_ids:
+            clear_search_results(supabase, search_id)
+
+        fingerprint_rows = supabase.table(FINGERPRINT_TABLE).select('model_key').execute().data
+        stale_keys = [row['model_key'] for row in fingerprint_rows if row['model_key'] not in refreshed_keys]
+        if stale_keys:
+            supabase.table(FINGERPRINT_TABLE).delete().in_('model_key', stale_keys).execute()
+
+        logger.info(f"Removed {len(stale_ids)} stale searches and {len(stale_keys)} stale fingerprints")
+        return len(stale_ids)
+    except Exception as e:
+        logger.error(f"Error removing stale results: {str(e)}")
+        return 0
+
+def main(full_refresh=None):
     logger.info("Starting Wallapop car searches...")
     supabase = init_supabase()
     
-    # Clear all tables before starting
-    clear_tables(supabase)
+    if full_refresh is None:
+        full_refresh = FULL_REFRESH
+    
+    if full_refresh:
+        # Clear all tables (and fingerprints) so every model is rewritten
+        clear_tables(supabase)
+        fingerprints = {}
+    else:
+        fingerprints = load_fingerprints(supabase)
     
     cars = get_cars_from_supabase()
     
@@ -458,36 +542,77 @@ def main():
     logging.getLogger('httpx').setLevel(logging.WARNING)
     logging.getLogger('httpcore').setLevel(logging.WARNING)
     
-    successful_searches = 0
-    failed_searches = 0
+    stats = {
+        'successful_searches': 0,
+        'failed_searches': 0,
+        'unchanged_models': 0,
+        'stale_searches_removed': 0
+    }
+    
+    # Searches and models still current after this crawl; everything else is pruned
+    kept_search_ids = set()
+    refreshed_keys = set()
     
     for car in cars:
         logger.info(f"\nProcessing {car['marca']} {car['modelo']}...")
         
         # First get market price
-        market_data = get_market_price(car)
+        market_data = get_market_price(car, supabase)
         if market_data:
             logger.info(f"Market price analysis: {market_data}")
             
             # Search with price limits based on market price
             result = search_wallapop_cars(car, market_data)
             if result and result['listings']:
+                model_key = get_model_key(car)
+                fingerprint = compute_result_fingerprint(result['listings'])
+                previous = fingerprints.get(model_key)
+                
+                if previous and previous['fingerprint'] == fingerprint:
+                    logger.info(f"Result unchanged for {car['marca']} {car['modelo']}, skipping")
+                    stats['unchanged_models'] += 1
+                    stats['successful_searches'] += 1
+                    kept_search_ids.add(previous['search_id'])
+                    refreshed_keys.add(model_key)
+                    continue
+                
+                # The previous result is only removed once the new one is fully stored
                 search_id = insert_search_results(supabase, result['search_parameters'], result['listings'])
-                if search_id:
-                    insert_market_price(supabase, search_id, market_data)
-                    successful_searches += 1
+                if (search_id
+                        and insert_market_price(supabase, search_id, market_data)
+                        and save_fingerprint(supabase, model_key, fingerprint, search_id, len(result['listings']))):
+                    if previous and previous.get('search_id'):
+                        clear_search_results(supabase, previous['search_id'])
+                    stats['successful_searches'] += 1
+                    kept_search_ids.add(search_id)
+                    refreshed_keys.add(model_key)
                 else:
-                    failed_searches += 1
+                    logger.warning(f"Could not store the result for {car['marca']} {car['modelo']}, keeping the previous one")
+                    if search_id:
+                        clear_search_results(supabase, search_id)
+                    if previous and previous.get('search_id'):
+                        kept_search_ids.add(previous['search_id'])
+                        refreshed_keys.add(model_key)
+                    stats['failed_searches'] += 1
             else:
-                failed_searches += 1
+                stats['failed_searches'] += 1
         else:
-            failed_searches += 1
+            stats['failed_searches'] += 1
             logger.warning(f"Could not determine market price for {car['marca']} {car['modelo']}")
     
+    if stats['successful_searches']:
+        stats['stale_searches_removed'] = prune_stale_results(supabase, kept_search_ids, refreshed_keys)
+    else:
+        # A crawl where every search failed (e.g. upstream down) keeps the previous results
+        logger.warning("No successful searches, keeping the previous results")
+    
     logger.info("\nSearch summary:")
-    logger.info(f"Successful searches: {successful_searches}")
-    logger.info(f"Failed searches: {failed_searches}")
-    logger.info(f"Total searches: {successful_searches + failed_searches}")
+    logger.info(f"Successful searches: {stats['successful_searches']}")
+    logger.info(f"Failed searches: {stats['failed_searches']}")
+    logger.info(f"Unchanged models skipped: {stats['unchanged_models']}")
+    logger.info(f"Stale searches removed: {stats['stale_searches_removed']}")
+    logger.info(f"Total searches: {stats['successful_searches'] + stats['failed_searches']}")
+    return stats
 
 if __name__ == "__main__":
     # Configure logging